@@ -1,28 +1,704 @@
 #!/usr/bin/env python3
+import io
 import os
+import re
 import sys
+import glob
+import ipaddress
+import shutil
 import time
-import psycopg2
-import requests
+import uuid
+import math
+import mmap
+import random
+import socket
+import ssl
+import struct
+import threading
+import queue
+import signal
+import socketserver
+import atexit
+import base64
+import importlib
+import functools
 import json
-from datetime import datetime
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+# Name of the check running on the current thread, used to tag interleaved log lines
+_log_context = threading.local()
+# Reentrant: the SIGTERM handler logs on the main thread, possibly while that
+# thread is already inside a synchronous write
+_log_lock = threading.RLock()
+
+def submit_in_context(executor, func, *args):
+    # Like executor.submit, but log lines from the worker keep the caller's check tag
+    check_name = getattr(_log_context, 'check_name', None)
+    
+    def run():
+        _log_context.check_name = check_name
+        try:
+            return func(*args)
+        finally:
+            _log_context.check_name = None
+    
+    return executor.submit(run)
+
+class LazyModule:
+    # Stands in for a backend client module and imports it on first use, so
+    # startup doesn't pay for clients whose checks are disabled
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+    
+    def __getattr__(self, attribute):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+psycopg2 = LazyModule('psycopg2')
+requests = LazyModule('requests')
+
+@functools.lru_cache(maxsize=None)
+def timed_http_adapter_class():
+    # HTTPAdapter whose connections time their own DNS lookup, TCP connect and TLS
+    # handshake, so the phases of a probe's real request can be reported. Built on
+    # first use because requests/urllib3 are imported lazily.
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    
+    class TimedConnectionMixin:
+        trace_setup = None  # {phase: ms} until the first response reports it
+        trace_address = None
+        
+        def _new_conn(self):
+            setup = {}
+            start = time.monotonic()
+            if phase_timing_enabled():
+                try:
+                    # Timed on its own; the connect below then hits the DNS cache
+                    socket.getaddrinfo(getattr(self, '_dns_host', self.host), self.port, type=socket.SOCK_STREAM)
+                except OSError:
+                    pass  # the connect reports the error
+                setup['dns'] = (time.monotonic() - start) * 1000
+                start = time.monotonic()
+            sock = super()._new_conn()
+            setup['tcp_connect'] = (time.monotonic() - start) * 1000
+            try:
+                self.trace_address = sock.getpeername()[0]
+            except OSError:
+                pass
+            self.trace_setup = setup
+            return sock
+    
+    class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+        pass
+    
+    class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+        def connect(self):
+            start = time.monotonic()
+            super().connect()
+            if self.trace_setup is not None:
+                # Includes the CONNECT tunnel when going through a proxy
+                elapsed = (time.monotonic() - start) * 1000
+                self.trace_setup['tls_handshake'] = max(0.0, elapsed - sum(self.trace_setup.values()))
+    
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+    
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+    
+    pool_classes = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+    
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = pool_classes
+        
+        def proxy_manager_for(self, proxy, **proxy_kwargs):
+            manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+            if not proxy.lower().startswith('socks'):
+                manager.pool_classes_by_scheme = pool_classes
+            return manager
+    
+    return TimedHTTPAdapter
+
+def attach_request_phases(response, *args, **kwargs):
+    # Session response hook: response.trace_phases holds the request's phases in ms.
+    # Connection setup only appears on the request that opened the connection;
+    # requests' elapsed runs until the response headers, so TTFB is the rest.
+    connection = getattr(response.raw, 'connection', None)
+    setup = getattr(connection, 'trace_setup', None) or {}
+    if connection is not None:
+        connection.trace_setup = None
+    elapsed = response.elapsed.total_seconds() * 1000
+    phases = dict(setup)
+    phases['ttfb'] = max(0.0, elapsed - sum(setup.values()))
+    phases['total'] = elapsed
+    response.trace_phases = phases
+    response.trace_address = getattr(connection, 'trace_address', None)
+    response.trace_reused = not setup
+    return response
+
+def log_request_phases(target, response):
+    # Phase breakdown of a probe's own request, next to its timed_probe total
+    phases = getattr(response, 'trace_phases', None)
+    if not phases or not phase_timing_enabled():
+        return
+    source = "reused connection" if response.trace_reused else None
+    log_phase_samples(target, [phases], response.trace_address or urlsplit(response.url).hostname, source)
+
+def build_http_session(retries=None, pool_maxsize=None):
+    # All probes share one pooled, keep-alive session, so repeated probes measure
+    # the service rather than DNS/TCP/TLS setup. Every HTTP call goes through it,
+    # which keeps the transport swappable in one place.
+    from urllib3.util.retry import Retry
+    
+    retries = Retry(
+        total=int(os.environ.get('HTTP_RETRIES', '0')) if retries is None else retries,
+        backoff_factor=float(os.environ.get('HTTP_BACKOFF', '0.5')),
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=None,  # probes are safe to retry, including POSTs
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = timed_http_adapter_class()(
+        pool_connections=int(os.environ.get('HTTP_MAX_HOSTS', '20')),
+        pool_maxsize=int(os.environ.get('HTTP_POOL_SIZE', '10')) if pool_maxsize is None else pool_maxsize,
+        pool_block=True,  # hard per-host connection limit
+        max_retries=retries
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = 'connectivity-tester'
+    session.hooks['response'].append(attach_request_phases)
+    return session
+
+_http_sessions = {}
+_http_session_lock = threading.Lock()
+
+def http_session(pool_maxsize=None):
+    # The shared session, built on first use. Callers that need a bigger per-host
+    # pool get their own session for that size, which also stays warm between rounds.
+    with _http_session_lock:
+        if pool_maxsize not in _http_sessions:
+            _http_sessions[pool_maxsize] = build_http_session(pool_maxsize=pool_maxsize)
+        return _http_sessions[pool_maxsize]
+
+# Logging: log() only filters by level and queues a (time, level, check, message)
+# record; a single writer thread formats records and writes them to stdout in
+# batches. LOG_ASYNC=false writes synchronously instead.
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARN': 30, 'ERROR': 40}
+_log_threshold = LOG_LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), 20)
+_log_json = os.environ.get('LOG_FORMAT', 'text').lower() == 'json'
+_log_async = os.environ.get('LOG_ASYNC', 'true').lower() == 'true'
+_log_queue = queue.SimpleQueue()
+_log_timestamp = [None, '']
+
+def format_log_record(record):
+    timestamp, level, check_name, message = record
+    if level is None:
+        return message  # pre-formatted line, e.g. a JSON result
+    if _log_json:
+        return json.dumps({
+            'time': datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': level, 'check': check_name, 'message': message
+        }, default=str)
+    
+    # strftime only once per second; only the writer (or _log_lock holder) calls this
+    second = int(timestamp)
+    if _log_timestamp[0] != second:
+        _log_timestamp[0] = second
+        _log_timestamp[1] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+    if check_name:
+        return f"[{_log_timestamp[1]}] [{level}] [{check_name}] {message}"
+    return f"[{_log_timestamp[1]}] [{level}] {message}"
+
+def write_log_lines(lines):
+    try:
+        sys.stdout.write('\n'.join(lines) + '\n')
+        sys.stdout.flush()
+    except (OSError, ValueError):
+        pass  # stdout closed; keep the writer alive
+
+def log_writer():
+    while True:
+        batch = [_log_queue.get()]
+        try:
+            while len(batch) < 1000:
+                batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        lines = [format_log_record(item) for item in batch if not isinstance(item, threading.Event)]
+        if lines:
+            write_log_lines(lines)
+        # Flush markers are released once everything queued before them is written
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+
+def enqueue_log_record(record):
+    if _log_async:
+        _log_queue.put(record)  # never blocks, even while stdout is stalled
+    else:
+        with _log_lock:
+            write_log_lines([format_log_record(record)])
+
+def flush_logs(timeout=5):
+    # Waits until every record queued so far has been written
+    if _log_async:
+        marker = threading.Event()
+        _log_queue.put(marker)
+        marker.wait(timeout)
+
+def handle_sigterm(signum, frame):
+    log("Received SIGTERM, shutting down", "WARN")
+    clear_ready_file()
+    flush_logs()
+    sys.exit(128 + signum)
+
+if _log_async:
+    threading.Thread(target=log_writer, name='log-writer', daemon=True).start()
+    atexit.register(flush_logs)
 
 def log(message, level="INFO"):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] [{level}] {message}")
+    check_name = getattr(_log_context, 'check_name', None)
+    # The first error a check logs becomes the error of its structured result
+    if level == "ERROR" and check_name:
+        note_result(check_name, error=message)
+    if LOG_LEVELS.get(level, 20) < _log_threshold:
+        return
+    enqueue_log_record((time.time(), level, check_name, message))
+
+# The check that must pass for the pod to be considered ready
+REQUIRED_CHECK = 'Primary PostgreSQL'
+
+# Prometheus metrics, keyed by (kind, target). kind is "check" for whole checks
+# and e.g. "postgres_connect" or "http" for individual network calls.
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_probe_metrics = {}
+_metrics_lock = threading.Lock()
+_readiness = {'ready': False}
+
+def record_probe(kind, target, duration, success):
+    with _metrics_lock:
+        metric = _probe_metrics.setdefault((kind, target), {
+            'buckets': [0] * len(METRIC_BUCKETS),
+            'sum': 0.0,
+            'count': 0,
+            'success': 0,
+            'last_result': 0
+        })
+        for i, bound in enumerate(METRIC_BUCKETS):
+            if duration <= bound:
+                metric['buckets'][i] += 1
+        metric['sum'] += duration
+        metric['count'] += 1
+        metric['success'] += 1 if success else 0
+        metric['last_result'] = 1 if success else 0
+    
+    if kind == 'check' and target == REQUIRED_CHECK:
+        set_ready(success)
+
+def set_ready(ready):
+    # Readiness is exposed on /readyz and, if READY_FILE is set, as a file that
+    # exists only while ready (for exec probes or containers sharing a volume).
+    # Only the connectivity run that maintains READY_FILE touches it, so a benchmark
+    # or fleet run exec'd into the same pod leaves the tester's file alone.
+    _readiness['ready'] = bool(ready)
+    ready_file = os.environ.get('READY_FILE')
+    if not ready_file or not _readiness.get('owns_ready_file'):
+        return
+    try:
+        if ready:
+            with open(ready_file, 'w') as f:
+                f.write(f"{datetime.now(timezone.utc).isoformat()}\n")
+        elif os.path.exists(ready_file):
+            os.remove(ready_file)
+    except OSError as e:
+        log(f"Could not update READY_FILE {ready_file}: {str(e)}", "WARN")
+
+def clear_ready_file():
+    # A stopped or restarted tester must not look ready (e.g. on a shared emptyDir)
+    set_ready(False)
+
+@contextmanager
+def timed_probe(kind, target):
+    # Records one probe; the block may set probe['success'] = False for
+    # failures that don't raise (e.g. an HTTP error status)
+    probe = {'success': True}
+    start = time.monotonic()
+    try:
+        yield probe
+    except Exception:
+        record_probe(kind, target, time.monotonic() - start, False)
+        raise
+    record_probe(kind, target, time.monotonic() - start, probe['success'])
+
+def render_metrics():
+    def labels(kind, target, le=None):
+        target = target.replace('\\', '\\\\').replace('"', '\\"')
+        if le is None:
+            return f'{{kind="{kind}",target="{target}"}}'
+        return f'{{kind="{kind}",target="{target}",le="{le}"}}'
+    
+    lines = [
+        "# HELP connectivity_probe_duration_seconds Duration of connectivity probes.",
+        "# TYPE connectivity_probe_duration_seconds histogram",
+    ]
+    with _metrics_lock:
+        metrics = sorted((key, dict(metric, buckets=list(metric['buckets']))) for key, metric in _probe_metrics.items())
+        ready = _readiness['ready']
+    
+    for (kind, target), metric in metrics:
+        for bound, count in zip(METRIC_BUCKETS, metric['buckets']):
+            lines.append(f"connectivity_probe_duration_seconds_bucket{labels(kind, target, bound)} {count}")
+        lines.append(f"connectivity_probe_duration_seconds_bucket{labels(kind, target, '+Inf')} {metric['count']}")
+        lines.append(f"connectivity_probe_duration_seconds_sum{labels(kind, target)} {metric['sum']:.6f}")
+        lines.append(f"connectivity_probe_duration_seconds_count{labels(kind, target)} {metric['count']}")
+    
+    lines.append("# HELP connectivity_probe_success_total Number of successful connectivity probes.")
+    lines.append("# TYPE connectivity_probe_success_total counter")
+    for (kind, target), metric in metrics:
+        lines.append(f"connectivity_probe_success_total{labels(kind, target)} {metric['success']}")
+    
+    lines.append("# HELP connectivity_probe_last_result Result of the most recent probe (1 = success).")
+    lines.append("# TYPE connectivity_probe_last_result gauge")
+    for (kind, target), metric in metrics:
+        lines.append(f"connectivity_probe_last_result{labels(kind, target)} {metric['last_result']}")
+    
+    lines.append("# HELP connectivity_ready Whether the required checks have passed.")
+    lines.append("# TYPE connectivity_ready gauge")
+    lines.append(f"connectivity_ready {1 if ready else 0}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.respond(200, render_metrics(), 'text/plain; version=0.0.4')
+        elif self.path == '/healthz':
+            self.respond(200, "ok\n")
+        elif self.path == '/readyz':
+            if _readiness['ready']:
+                self.respond(200, "ready\n")
+            else:
+                self.respond(503, f"{REQUIRED_CHECK} has not passed\n")
+        else:
+            self.respond(404, "not found\n")
+    
+    def respond(self, status, body, content_type='text/plain'):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        # Scrapes would otherwise flood the pod log
+        pass
+
+def start_metrics_server():
+    port = int(os.environ.get('METRICS_PORT', '9102'))
+    if port <= 0:
+        log("Metrics endpoint disabled (METRICS_PORT=0)")
+        return None
+    
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    except OSError as e:
+        log(f"Could not start metrics endpoint on port {port}: {str(e)}", "WARN")
+        return None
+    
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    log(f"Serving /metrics, /healthz and /readyz on port {port}")
+    return server
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def format_percentiles(values_ms):
+    if len(values_ms) == 1:
+        return f"{values_ms[0]:.1f}ms"
+    return (f"p50 {percentile(values_ms, 50):.1f}ms / p95 {percentile(values_ms, 95):.1f}ms / "
+            f"p99 {percentile(values_ms, 99):.1f}ms")
+
+# Resolver cache shared by every probe: requests and the raw sockets go through
+# socket.getaddrinfo, and libpq is handed the cached address via hostaddr
+_system_getaddrinfo = socket.getaddrinfo
+_dns_cache = {}
+_dns_stats = {}
+_dns_lock = threading.Lock()
+
+# Suffixes of Azure service hostnames that can be served through private endpoints
+AZURE_HOST_SUFFIXES = ('.azure.com', '.azure.net', '.windows.net', '.azure-api.net', '.azurecr.io')
+
+def is_ip_literal(host):
+    try:
+        ipaddress.ip_address(host.split('%', 1)[0])
+        return True
+    except ValueError:
+        return False
+
+def cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    # Drop-in replacement for socket.getaddrinfo: each name is looked up once per
+    # DNS_CACHE_TTL seconds whatever the port, and every real lookup is timed
+    if (not isinstance(host, str) or is_ip_literal(host)
+            or (port is not None and not str(port).isdigit())):
+        return _system_getaddrinfo(host, port, family, type, proto, flags)
+    
+    key = (host.lower(), family, type, proto, flags)
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+    if entry is None or entry[0] <= time.monotonic():
+        start = time.monotonic()
+        try:
+            infos = _system_getaddrinfo(host, None, family, type, proto, flags)
+        except OSError as e:
+            record_dns_lookup(host, time.monotonic() - start, e)
+            raise
+        record_dns_lookup(host, time.monotonic() - start, sorted({info[4][0] for info in infos}))
+        # getaddrinfo doesn't expose record TTLs, so DNS_CACHE_TTL caps them
+        entry = (start + float(os.environ.get('DNS_CACHE_TTL', '30')), infos)
+        with _dns_lock:
+            _dns_cache[key] = entry
+    
+    port = int(port or 0)
+    return [(f, t, p, c, (address[0], port) + tuple(address[2:])) for f, t, p, c, address in entry[1]]
+
+def record_dns_lookup(host, duration, result):
+    record_probe('dns_resolve', host, duration, not isinstance(result, Exception))
+    with _dns_lock:
+        _dns_stats[host.lower()] = {'ms': duration * 1000, 'result': result}
+
+if os.environ.get('DNS_CACHE', 'true').lower() == 'true':
+    socket.getaddrinfo = cached_getaddrinfo
+
+def resolve_host(host):
+    return sorted({info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)})
+
+def pg_hostaddr(host):
+    # Resolved address for libpq's hostaddr, so PostgreSQL connections use the
+    # cache too; host is still sent for TLS verification. None lets libpq resolve.
+    # Hosts with several addresses are left to libpq, which tries them in resolver
+    # order and falls back past dead ones; pinning one would lose that.
+    if not host or host.startswith('/') or is_ip_literal(host) or ',' in host:
+        return None
+    try:
+        addresses = dict.fromkeys(info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM))
+    except OSError:
+        return None
+    return next(iter(addresses)) if len(addresses) == 1 else None
+
+def address_scope(addresses):
+    scopes = {'private' if ipaddress.ip_address(a.split('%', 1)[0]).is_private else 'public' for a in addresses}
+    return scopes.pop() if len(scopes) == 1 else 'mixed'
+
+def configured_hostnames():
+    # Every hostname the enabled checks will contact: (core, custom) lists
+    core = []
+    for config in (postgres_primary_config(), postgres_secondary_config()):
+        if config and config['host']:
+            core.append(config['host'])
+    for var in ('AZURE_OPENAI_ENDPOINT', 'AZURE_DOCINTEL_ENDPOINT', 'OLLAMA_ENDPOINT', 'OPENAI_COMPATIBLE_ENDPOINT'):
+        if os.environ.get(var):
+            core.append(urlsplit(os.environ[var]).hostname)
+    if os.environ.get('TEST_EXTERNAL_SERVICES', 'true').lower() == 'true':
+        core.extend(urlsplit(url).hostname for url in EXTERNAL_SERVICES.values())
+    
+    custom = []
+    if os.environ.get('TEST_CUSTOM_HOSTNAMES', 'true').lower() == 'true':
+        custom = [custom_host_hostname(url) for url in load_custom_hosts().values()]
+    
+    core = [host for host in core if host and not host.startswith('/') and not is_ip_literal(host)]
+    custom = [host for host in custom if host and not is_ip_literal(host)]
+    return core, custom
+
+def resolve_configured_hosts():
+    # Resolve everything up front and concurrently, so slow DNS (e.g. CoreDNS under
+    # load) shows up here with its own latency instead of as generic probe timeouts
+    core, custom = configured_hostnames()
+    if not core and not custom:
+        return
+    
+    log("Resolving configured hostnames...")
+    start = time.monotonic()
+    dns_results = resolve_unique_hosts(core + custom, int(os.environ.get('DNS_CONCURRENCY', '32')))
+    elapsed = time.monotonic() - start
+    expect_private = os.environ.get('EXPECT_PRIVATE_ENDPOINTS', 'false').lower() == 'true'
+    
+    for host in sorted(set(core)):
+        addresses = dns_results[host]
+        ms = _dns_stats.get(host.lower(), {}).get('ms', 0)
+        if isinstance(addresses, Exception):
+            log(f"DNS {host}: FAILED after {ms:.1f}ms ({str(addresses)})", "WARN")
+            continue
+        
+        scope = address_scope(addresses)
+        message = f"DNS {host}: {', '.join(addresses)} in {ms:.1f}ms"
+        if host.lower().endswith(AZURE_HOST_SUFFIXES):
+            if scope == 'private':
+                log(f"{message} (private endpoint)")
+            else:
+                log(f"{message} ({scope} IP - not using a private endpoint)", "WARN" if expect_private else "INFO")
+        else:
+            log(message)
+    
+    failed = [host for host, addresses in dns_results.items() if isinstance(addresses, Exception)]
+    timings = sorted(((_dns_stats.get(host.lower(), {}).get('ms', 0), host) for host in dns_results), reverse=True)
+    slowest = ', '.join(f"{host} {ms:.1f}ms" for ms, host in timings[:3])
+    log(f"Resolved {len(dns_results) - len(failed)}/{len(dns_results)} hostnames in {elapsed:.2f}s "
+        f"(slowest: {slowest})", "WARN" if failed else "INFO")
+
+def open_traced_connection(host, port, use_tls, timeout=10):
+    # Opens a socket step by step so DNS, TCP connect and TLS handshake can be
+    # timed separately. Returns (socket, phases in ms, resolved address).
+    phases = {}
+    start = time.monotonic()
+    addrinfo = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    phases['dns'] = (time.monotonic() - start) * 1000
+    
+    family, socktype, proto, _, address = addrinfo[0]
+    sock = socket.socket(family, socktype, proto)
+    sock.settimeout(timeout)
+    try:
+        start = time.monotonic()
+        sock.connect(address)
+        phases['tcp_connect'] = (time.monotonic() - start) * 1000
+        
+        if use_tls:
+            start = time.monotonic()
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+            phases['tls_handshake'] = (time.monotonic() - start) * 1000
+    except Exception:
+        sock.close()
+        raise
+    
+    return sock, phases, address[0]
+
+def send_traced_request(sock, method, parts):
+    # Sends a minimal request on an already open connection and reads the status
+    # line only. Returns (status code, ms until the response started).
+    path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    start = time.monotonic()
+    sock.sendall(
+        f"{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        f"User-Agent: connectivity-tester\r\nConnection: close\r\n\r\n".encode('ascii')
+    )
+    with sock.makefile('rb') as f:
+        status_line = f.readline(65537)
+    elapsed_ms = (time.monotonic() - start) * 1000
+    try:
+        return int(status_line.split()[1]), elapsed_ms
+    except (IndexError, ValueError):
+        raise OSError(f"invalid HTTP response {status_line[:60]!r}")
+
+def trace_http_phases(url, timeout=10):
+    parts = urlsplit(url)
+    use_tls = parts.scheme == 'https'
+    port = parts.port or (443 if use_tls else 80)
+    
+    start = time.monotonic()
+    sock, phases, address = open_traced_connection(parts.hostname, port, use_tls, timeout)
+    try:
+        _, phases['ttfb'] = send_traced_request(sock, 'GET', parts)
+    finally:
+        sock.close()
+    phases['total'] = (time.monotonic() - start) * 1000
+    return phases, address
+
+def log_phase_samples(target, samples, address, source=None):
+    # samples: list of {phase: ms}; also exported as per-phase metrics
+    for phases in samples:
+        for phase, ms in phases.items():
+            if phase != 'total':
+                record_probe(phase, target, ms / 1000, True)
+    
+    parts = []
+    for phase, label in (('dns', 'DNS'), ('tcp_connect', 'TCP connect'), ('proxy_connect', 'proxy CONNECT'),
+                         ('tls_handshake', 'TLS'),
+                         ('ttfb', 'TTFB'), ('total', 'total')):
+        values = [phases[phase] for phases in samples if phase in phases]
+        if values:
+            parts.append(f"{label} {format_percentiles(values)}")
+    
+    repeats = f" over {len(samples)} runs" if len(samples) > 1 else ""
+    source = f", {source}" if source else ""
+    log(f"{target} timing{repeats} ({address}{source}): {', '.join(parts)}")
+
+def probe_repeat():
+    return max(1, int(os.environ.get('PROBE_REPEAT', '1')))
+
+def phase_timing_enabled():
+    return os.environ.get('PHASE_TIMING', 'true').lower() == 'true'
+
+def http_phase_trace_enabled():
+    # Opt-in: the trace is an extra unauthenticated GET that bypasses the session and
+    # any proxy, so its phases describe the network path, not the probe's own request
+    return phase_timing_enabled() and os.environ.get('HTTP_PHASE_TRACE', 'false').lower() == 'true'
+
+def log_http_phases(target, url):
+    # Optional separate raw request next to the real probe, always on a new connection;
+    # the probe's own phases come from log_request_phases()
+    if not http_phase_trace_enabled():
+        return
+    try:
+        samples = []
+        address = None
+        for _ in range(probe_repeat()):
+            phases, address = trace_http_phases(url)
+            samples.append(phases)
+        log_phase_samples(target, samples, address, source="separate trace GET, not the probe request")
+    except Exception as e:
+        log(f"{target} timing unavailable for {url}: {str(e)}", "WARN")
+
+def postgres_primary_config():
+    return {
+        'server_name': "Primary PostgreSQL",
+        'host': os.environ.get('PGHOST'),
+        'port': os.environ.get('PGPORT', '5432'),
+        'database': os.environ.get('PGDATABASE'),
+        'user': os.environ.get('PGUSER'),
+        'password': os.environ.get('PGPASSWORD')
+    }
+
+def postgres_secondary_config():
+    # Secondary settings fall back to the primary ones; None if not configured
+    secondary_host = os.environ.get('PGHOST_SECONDARY')
+    if not secondary_host:
+        return None
+    
+    return {
+        'server_name': "Secondary PostgreSQL",
+        'host': secondary_host,
+        'port': os.environ.get('PGPORT_SECONDARY', '5432'),
+        'database': os.environ.get('PGDATABASE_SECONDARY') or os.environ.get('PGDATABASE', 'postgres'),
+        'user': os.environ.get('PGUSER_SECONDARY') or os.environ.get('PGUSER'),
+        'password': os.environ.get('PGPASSWORD_SECONDARY') or os.environ.get('PGPASSWORD')
+    }
 
 def test_postgres():
     log("Testing PostgreSQL connectivity...")
     
     # Test primary PostgreSQL server
-    primary_result = test_postgres_server(
-        server_name="Primary PostgreSQL",
-        host=os.environ.get('PGHOST'),
-        port=os.environ.get('PGPORT', '5432'),
-        database=os.environ.get('PGDATABASE'),
-        user=os.environ.get('PGUSER'),
-        password=os.environ.get('PGPASSWORD')
-    )
+    primary_result = test_postgres_server(**postgres_primary_config())
     
     return primary_result
 
@@ -30,164 +706,613 @@ def test_postgres_secondary():
     log("Testing Secondary PostgreSQL connectivity...")
     
     # Check if secondary PostgreSQL is configured
-    secondary_host = os.environ.get('PGHOST_SECONDARY')
-    if not secondary_host:
+    config = postgres_secondary_config()
+    if config is None:
         log("Secondary PostgreSQL test skipped - PGHOST_SECONDARY not configured", "WARN")
         return None
     
     # Test secondary PostgreSQL server
-    secondary_result = test_postgres_server(
-        server_name="Secondary PostgreSQL",
-        host=secondary_host,
-        port=os.environ.get('PGPORT_SECONDARY', '5432'),
-        database=os.environ.get('PGDATABASE_SECONDARY') or os.environ.get('PGDATABASE', 'postgres'),
-        user=os.environ.get('PGUSER_SECONDARY') or os.environ.get('PGUSER'),
-        password=os.environ.get('PGPASSWORD_SECONDARY') or os.environ.get('PGPASSWORD')
-    )
+    secondary_result = test_postgres_server(**config)
+    
+    # Measure replication lag and compare read latency against the primary
+    if secondary_result and replication_check_enabled():
+        try:
+            compare_replica(postgres_primary_config(), config)
+        except Exception as e:
+            log(f"Replication check failed: {str(e)}", "WARN")
     
     return secondary_result
 
+def parse_lsn(lsn):
+    # '16/B374D848' -> byte position
+    high, _, low = lsn.partition('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+def timed_query(cursor, query):
+    start = time.monotonic()
+    cursor.execute(query)
+    row = cursor.fetchone()
+    return row, (time.monotonic() - start) * 1000
+
+def replication_check_enabled():
+    return os.environ.get('REPLICATION_CHECK', 'true').lower() == 'true'
+
+def replica_lag(cursor):
+    # (replay LSN, lag in seconds); both None on a server that isn't a replica.
+    # Replay timestamp only advances with primary activity, so a fully replayed
+    # replica counts as zero lag
+    (replay_lsn, lag), _ = timed_query(cursor, """
+        SELECT pg_last_wal_replay_lsn()::text,
+               CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END;
+    """)
+    return replay_lsn, None if lag is None else float(lag)
+
+def compare_replica(primary, secondary):
+    window = float(os.environ.get('REPLICATION_SAMPLE_WINDOW', '2'))
+    interval = float(os.environ.get('REPLICATION_SAMPLE_INTERVAL', '0.5'))
+    lag_threshold = float(os.environ.get('REPLICATION_LAG_THRESHOLD', '30'))
+    
+    log(f"Sampling replication lag and read latency for {window:.0f}s...")
+    
+    connections = {}
+    try:
+        for config in (primary, secondary):
+            if not all([config['host'], config['user'], config['password']]):
+                continue
+            conn = psycopg2.connect(
+                host=config['host'],
+                hostaddr=pg_hostaddr(config['host']),
+                port=config['port'],
+                database=config['database'],
+                user=config['user'],
+                password=config['password'],
+                connect_timeout=10,
+                options=check_statement_timeout()
+            )
+            conn.autocommit = True
+            connections[config['server_name']] = conn.cursor()
+        
+        secondary_cursor = connections[secondary['server_name']]
+        primary_cursor = connections.get(primary['server_name'])
+        if primary_cursor is None:
+            log("Primary PostgreSQL not configured - reporting replica-side lag only", "WARN")
+        
+        (in_recovery,), _ = timed_query(secondary_cursor, "SELECT pg_is_in_recovery();")
+        if not in_recovery:
+            log("Secondary PostgreSQL is not in recovery (not a streaming replica) - comparing read latency only")
+        
+        read_ms = {name: [] for name in connections}
+        lag_seconds = []
+        lag_bytes = []
+        
+        deadline = time.monotonic() + window
+        sample = 0
+        while time.monotonic() < deadline:
+            # Alternate which server goes first so neither is favoured
+            names = list(connections)
+            if sample % 2:
+                names.reverse()
+            for name in names:
+                _, ms = timed_query(connections[name], "SELECT 1;")
+                read_ms[name].append(ms)
+                record_probe('postgres_read', name, ms / 1000, True)
+            
+            if in_recovery:
+                replay_lsn, lag = replica_lag(secondary_cursor)
+                if lag is not None:
+                    lag_seconds.append(lag)
+                if primary_cursor is not None and replay_lsn:
+                    (current_lsn,), _ = timed_query(primary_cursor, "SELECT pg_current_wal_lsn()::text;")
+                    lag_bytes.append(max(0, parse_lsn(current_lsn) - parse_lsn(replay_lsn)))
+            
+            sample += 1
+            time.sleep(interval)
+    finally:
+        for cursor in connections.values():
+            cursor.connection.close()
+    
+    log(f"Read latency over {sample} paired samples (SELECT 1):")
+    for name, values in read_ms.items():
+        log(f"  {name}: {format_percentiles(values)}")
+    if primary_cursor is not None:
+        delta = percentile(read_ms[secondary['server_name']], 50) - percentile(read_ms[primary['server_name']], 50)
+        log(f"  Secondary vs primary p50: {delta:+.1f}ms")
+    
+    if lag_seconds:
+        log(f"Replication lag (time): p50 {percentile(lag_seconds, 50):.2f}s, max {max(lag_seconds):.2f}s")
+        if max(lag_seconds) > lag_threshold:
+            log(f"Replication lag exceeded {lag_threshold:.0f}s", "WARN")
+    if lag_bytes:
+        log(f"Replication lag (WAL): p50 {percentile(lag_bytes, 50) / 1024:.1f}kB, max {max(lag_bytes) / 1024:.1f}kB")
+
+def fetch_server_inventory(cursor):
+    # Everything that is server-wide comes back from a single query, so the
+    # inventory costs one round trip on the connection we already opened
+    cursor.execute("""
+        SELECT 
+            version(),
+            current_setting('max_connections')::int,
+            current_setting('superuser_reserved_connections')::int,
+            (SELECT count(*) FROM pg_stat_activity),
+            (SELECT json_agg(json_build_array(
+                        datname,
+                        has_database_privilege(current_user, datname, 'CONNECT'),
+                        oid::bigint
+                    ) ORDER BY datname)
+             FROM pg_database
+             WHERE datistemplate = false),
+            (SELECT json_agg(json_build_array(name, default_version, comment) ORDER BY name)
+             FROM pg_available_extensions);
+    """)
+    version, max_connections, reserved, in_use, databases, available = cursor.fetchone()
+    
+    return {
+        'version': version,
+        'max_connections': max_connections,
+        'reserved_connections': reserved,
+        'connections_in_use': in_use,
+        'databases': [(name, can_connect) for name, can_connect, _ in databases or []],
+        # oids change when a database is dropped and recreated under the same name
+        'database_oids': {name: oid for name, _, oid in databases or []},
+        'available_extensions': [tuple(ext) for ext in available or []]
+    }
+
+def measure_exact_database_sizes(host, port, database, user, password, db_names, workers, budget):
+    # pg_database_size() walks every file of a database, so only run it for the
+    # requested databases, spread over a few connections, within a time budget
+    deadline = time.monotonic() + budget
+    pending = deque(db_names)
+    sizes = {}
+    
+    def worker():
+        try:
+            conn = psycopg2.connect(
+                host=host,
+                hostaddr=pg_hostaddr(host),
+                port=port,
+                database=database,
+                user=user,
+                password=password,
+                connect_timeout=10,
+                options=f"-c statement_timeout={int(budget * 1000)}"
+            )
+        except Exception as e:
+            log(f"Could not open connection for database sizing: {str(e)}", "WARN")
+            return
+        
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            while time.monotonic() < deadline:
+                try:
+                    db_name = pending.popleft()  # atomic, so workers need no lock
+                except IndexError:
+                    break
+                try:
+                    cursor.execute("SELECT pg_size_pretty(pg_database_size(%s));", (db_name,))
+                    sizes[db_name] = (cursor.fetchone()[0], 'exact')
+                except Exception as e:
+                    sizes[db_name] = (None, f"error: {str(e).strip()}")
+            cursor.close()
+        finally:
+            conn.close()
+    
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, min(workers, len(pending))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+    
+    results = dict(sizes)
+    for db_name in db_names:
+        results.setdefault(db_name, (None, f"time budget of {budget:.0f}s exceeded"))
+    return results
+
+def describe_database_size(db_name, can_connect, sizes):
+    if not can_connect:
+        return "no CONNECT privilege"
+    size, method = sizes.get(db_name, (None, 'not measured'))
+    if size is None:
+        return f"size {method}"
+    return f"{size}, {method}"
+
+def log_postgres_phases(server_name, host, port):
+    # psycopg2 hides DNS and TCP connect inside connect(); time them on a raw socket
+    if not phase_timing_enabled():
+        return
+    try:
+        samples = []
+        address = None
+        for _ in range(probe_repeat()):
+            start = time.monotonic()
+            sock, phases, address = open_traced_connection(host, int(port), use_tls=False)
+            sock.close()
+            phases['total'] = (time.monotonic() - start) * 1000
+            samples.append(phases)
+        log_phase_samples(server_name, samples, address)
+    except Exception as e:
+        log(f"{server_name} timing unavailable: {str(e)}", "WARN")
+
 def test_postgres_server(server_name, host, port, database, user, password):
     log(f"Testing {server_name} server...")
     
     if not all([host, user, password]):
+        missing = ', '.join(name for name, value in (('host', host), ('user', user), ('password', password)) if not value)
+        note_result(error_class='ConfigurationError', error=f"{server_name} not configured (missing {missing})")
         log(f"{server_name} test skipped - missing required configuration", "WARN")
         return False
     
+    # Database sizing: skip (default), estimate (pg_class.relpages) or exact (pg_database_size)
+    size_mode = os.environ.get('DATABASE_SIZE_MODE', 'skip').lower()
+    
+    note_result(target=f"{host}:{port}/{database}")
     try:
         log(f"Connecting to {server_name} at {host}:{port}/{database}")
+        log_postgres_phases(server_name, host, port)
         
-        conn = psycopg2.connect(
-            host=host,
-            port=port,
-            database=database,
-            user=user,
-            password=password,
-            connect_timeout=10
-        )
+        connect_start = time.monotonic()
+        with timed_probe('postgres_connect', server_name):
+            conn = psycopg2.connect(
+                host=host,
+                hostaddr=pg_hostaddr(host),
+                port=port,
+                database=database,
+                user=user,
+                password=password,
+                connect_timeout=10,
+                options=check_statement_timeout()
+            )
+        connect_ms = (time.monotonic() - connect_start) * 1000
         
         cursor = conn.cursor()
-        cursor.execute("SELECT version();")
-        version = cursor.fetchone()
-        log(f"{server_name} connection successful! Version: {version[0]}")
+        query_start = time.monotonic()
+        with timed_probe('postgres_query', server_name):
+            inventory = fetch_server_inventory(cursor)
+        query_ms = (time.monotonic() - query_start) * 1000
+        cursor.close()
+        conn.close()
         
-        # List all databases
-        log(f"Listing available databases on {server_name}...")
-        cursor.execute("""
-            SELECT datname, pg_size_pretty(pg_database_size(datname)) as size
-            FROM pg_database 
-            WHERE datistemplate = false 
-            ORDER BY datname;
-        """)
-        databases = cursor.fetchall()
+        log(f"{server_name} connect/TLS/auth: {connect_ms:.1f}ms, inventory query: {query_ms:.1f}ms")
         
-        log(f"Found {len(databases)} databases on {server_name}:")
-        for db_name, db_size in databases:
-            log(f"  - {db_name} ({db_size})")
+        log(f"{server_name} connection successful! Version: {inventory['version']}")
+        note_result(
+            server_version=inventory['version'],
+            connect_ms=round(connect_ms, 1),
+            inventory_query_ms=round(query_ms, 1),
+            max_connections=inventory['max_connections'],
+            connections_in_use=inventory['connections_in_use'],
+        )
         
-        cursor.close()
-        conn.close()
+        databases = inventory['databases']
+        accessible = [db_name for db_name, can_connect in databases if can_connect]
+        
+        snapshots_enabled = os.environ.get('CATALOG_SNAPSHOT', 'false').lower() == 'true'
+        snapshot = load_catalog_snapshot(server_name, host, port) if snapshots_enabled else None
+        
+        # Size estimates need a fresh connection, so they bypass the snapshot
+        cached = cached_database_inventories(snapshot, inventory, accessible) if size_mode != 'estimate' else {}
+        
+        # Per-database catalog pass, also collecting size estimates when requested
+        db_inventories = fetch_database_inventories(
+            server_name, host, port, user, password, inventory,
+            [db_name for db_name in accessible if db_name not in cached],
+            estimate_sizes=(size_mode == 'estimate')
+        )
+        db_inventories = {db_name: cached.get(db_name) or db_inventories[db_name] for db_name in accessible}
+        
+        sizes = {}
+        if size_mode == 'estimate':
+            for db_name, db_inventory in db_inventories.items():
+                if isinstance(db_inventory, dict):
+                    sizes[db_name] = (db_inventory['estimated_size'], 'estimated from pg_class.relpages')
+        elif size_mode == 'exact':
+            requested = [name.strip() for name in os.environ.get('DATABASE_SIZE_DATABASES', '').split(',') if name.strip()]
+            targets = [db_name for db_name in accessible if not requested or db_name in requested]
+            budget = float(os.environ.get('DATABASE_SIZE_BUDGET', '30'))
+            log(f"Measuring exact size of {len(targets)} databases on {server_name} (budget: {budget:.0f}s)...")
+            sizes = measure_exact_database_sizes(
+                host, port, database, user, password, targets,
+                extension_check_workers(inventory), budget
+            )
+        
+        # List all databases
+        log(f"Listing available databases on {server_name}...")
+        if snapshot and not sizes:
+            # Additions and removals are reported with the catalog changes
+            log(f"Found {len(databases)} databases on {server_name} ({len(accessible)} accessible)")
+        else:
+            log(f"Found {len(databases)} databases on {server_name}:")
+            for db_name, can_connect in databases:
+                log(f"  - {db_name} ({describe_database_size(db_name, can_connect, sizes)})")
         
-        # Test extensions for each database on this server
-        test_postgres_extensions_for_server(server_name, host, port, user, password)
+        # Report extensions for each database on this server
+        test_postgres_extensions_for_server(server_name, inventory, db_inventories, snapshot)
+        if snapshots_enabled:
+            save_catalog_snapshot(server_name, host, port, inventory, db_inventories, snapshot)
+        note_result(databases={
+            db_name: {
+                'can_connect': can_connect,
+                'extensions': ({ext_name: ext_version for ext_name, ext_version, _ in db_inventories[db_name]['extensions']}
+                               if isinstance(db_inventories.get(db_name), dict) else None),
+            }
+            for db_name, can_connect in databases
+        })
         
         return True
         
     except Exception as e:
+        note_result(error_class=type(e).__name__)
         log(f"{server_name} connection failed: {str(e)}", "ERROR")
         return False
 
-def test_postgres_extensions_for_server(server_name, host, port, user, password):
-    log(f"Testing PostgreSQL extensions for {server_name}...")
+def fetch_database_extensions(host, port, user, password, db_name, estimate_sizes=False):
+    # pg_extension (and pg_class for size estimates) are the only per-database
+    # catalogs we need; everything else comes from the server inventory
+    connect_start = time.monotonic()
+    db_conn = psycopg2.connect(
+        host=host,
+        hostaddr=pg_hostaddr(host),
+        port=port,
+        database=db_name,
+        user=user,
+        password=password,
+        connect_timeout=10,
+        options=check_statement_timeout()
+    )
+    connect_ms = (time.monotonic() - connect_start) * 1000
     
     try:
-        # First, get list of accessible databases
-        conn = psycopg2.connect(
-            host=host,
-            port=port,
-            database='postgres',  # Connect to default postgres database
-            user=user,
-            password=password,
-            connect_timeout=10
-        )
+        db_cursor = db_conn.cursor()
+        query_start = time.monotonic()
         
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT datname 
-            FROM pg_database 
-            WHERE datistemplate = false 
-            AND has_database_privilege(current_user, datname, 'CONNECT')
-            ORDER BY datname;
+        # Get installed extensions
+        db_cursor.execute("""
+            SELECT 
+                extname as extension_name,
+                extversion as version,
+                nspname as schema
+            FROM pg_extension e
+            JOIN pg_namespace n ON n.oid = e.extnamespace
+            ORDER BY extname;
         """)
-        databases = [row[0] for row in cursor.fetchall()]
-        cursor.close()
-        conn.close()
+        extensions = db_cursor.fetchall()
         
-        log(f"Checking extensions in {len(databases)} accessible databases on {server_name}...")
+        # Estimate size from planner statistics instead of walking the files
+        estimated_size = None
+        if estimate_sizes:
+            db_cursor.execute("""
+                SELECT pg_size_pretty(sum(relpages)::bigint * current_setting('block_size')::bigint)
+                FROM pg_class;
+            """)
+            estimated_size = db_cursor.fetchone()[0]
         
-        for db_name in databases:
-            try:
-                log(f"{server_name} - Database: {db_name}")
-                log("-" * 50)
-                
-                # Connect to specific database
-                db_conn = psycopg2.connect(
-                    host=host,
-                    port=port,
-                    database=db_name,
-                    user=user,
-                    password=password,
-                    connect_timeout=10
-                )
-                
-                db_cursor = db_conn.cursor()
-                
-                # Get installed extensions
-                db_cursor.execute("""
-                    SELECT 
-                        extname as extension_name,
-                        extversion as version,
-                        nspname as schema
-                    FROM pg_extension e
-                    JOIN pg_namespace n ON n.oid = e.extnamespace
-                    ORDER BY extname;
-                """)
-                extensions = db_cursor.fetchall()
-                
-                if extensions:
-                    log(f"  Extensions ({len(extensions)} installed):")
-                    for ext_name, ext_version, ext_schema in extensions:
-                        log(f"    • {ext_name} v{ext_version} (schema: {ext_schema})")
-                else:
-                    log("    No extensions installed")
-                
-                # Get available (but not installed) extensions
-                db_cursor.execute("""
-                    SELECT 
-                        name,
-                        default_version,
-                        comment
-                    FROM pg_available_extensions
-                    WHERE name NOT IN (SELECT extname FROM pg_extension)
-                    ORDER BY name
-                    LIMIT 5;
-                """)
-                available = db_cursor.fetchall()
-                
-                if available:
-                    log(f"  Available extensions (showing first 5):")
-                    for ext_name, ext_version, ext_comment in available:
-                        comment_short = ext_comment[:40] + "..." if ext_comment and len(ext_comment) > 40 else ext_comment or "No description"
-                        log(f"    • {ext_name} v{ext_version} - {comment_short}")
-                
-                db_cursor.close()
-                db_conn.close()
-                
-                log("")  # Empty line between databases
-                
-            except Exception as db_error:
-                log(f"    Error accessing database {db_name} on {server_name}: {str(db_error)}", "WARN")
+        query_ms = (time.monotonic() - query_start) * 1000
+        db_cursor.close()
+    finally:
+        db_conn.close()
+    
+    return {
+        'extensions': extensions,
+        'estimated_size': estimated_size,
+        'connect_ms': connect_ms,
+        'query_ms': query_ms,
+        'fetched_at': time.time()
+    }
+
+def extension_check_workers(inventory):
+    # Stay well inside the server's free connection slots: use at most half of
+    # what is left after reserved and currently open connections
+    configured = int(os.environ.get('EXTENSION_CHECK_CONCURRENCY', '4'))
+    if configured <= 1:
+        return 1
+    
+    free_slots = (inventory['max_connections'] - inventory['reserved_connections']
+                  - inventory['connections_in_use'])
+    return max(1, min(configured, free_slots // 2))
+
+def fetch_database_inventories(server_name, host, port, user, password, inventory, databases, estimate_sizes=False):
+    # Returns db_name -> inventory dict, or the exception raised for that database
+    workers = extension_check_workers(inventory)
+    log(f"Checking {len(databases)} accessible databases on {server_name} "
+        f"({workers} concurrent connection(s))...")
+    
+    inventory_start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extensions') as executor:
+        futures = {
+            db_name: executor.submit(fetch_database_extensions, host, port, user, password, db_name, estimate_sizes)
+            for db_name in databases
+        }
+    
+    db_inventories = {}
+    for db_name in databases:
+        try:
+            db_inventories[db_name] = futures[db_name].result()
+        except Exception as db_error:
+            db_inventories[db_name] = db_error
+    
+    log(f"Database catalog pass for {server_name} took {time.monotonic() - inventory_start:.1f}s")
+    return db_inventories
+
+# Catalog snapshots (CATALOG_SNAPSHOT=true): the per-database catalog inventory of
+# each server is kept on disk, so later runs can skip unchanged databases and
+# report only what changed
+def catalog_snapshot_path(host, port):
+    directory = os.environ.get('CATALOG_SNAPSHOT_DIR') or os.path.join(
+        os.environ.get('PVC_MOUNT_PATH', '/mnt/test-storage'), 'catalog-snapshots')
+    return os.path.join(directory, re.sub(r'[^A-Za-z0-9_.-]', '_', f"{host}_{port}") + '.json')
+
+def load_catalog_snapshot(server_name, host, port):
+    path = catalog_snapshot_path(host, port)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        log(f"Ignoring unreadable catalog snapshot for {server_name} ({path}): {str(e)}", "WARN")
+        return None
+    if 'database_extensions' not in snapshot:
+        log(f"Ignoring catalog snapshot for {server_name} in an older format ({path})", "WARN")
+        return None
+    return snapshot
+
+def save_catalog_snapshot(server_name, host, port, inventory, db_inventories, previous):
+    # 'databases' holds every database on the server (name -> oid), including those we
+    # cannot connect to; 'database_extensions' only those that were fetched. Databases
+    # that failed this time keep their previous extension entry.
+    previous_extensions = (previous or {}).get('database_extensions', {})
+    database_extensions = {}
+    for db_name, db_inventory in db_inventories.items():
+        if isinstance(db_inventory, dict):
+            database_extensions[db_name] = {
+                'oid': inventory['database_oids'].get(db_name),
+                'fetched_at': db_inventory.get('fetched_at', time.time()),
+                'extensions': {name: [version, schema] for name, version, schema in db_inventory['extensions']},
+            }
+        elif db_name in previous_extensions:
+            database_extensions[db_name] = previous_extensions[db_name]
+    
+    snapshot = {
+        'server': f"{host}:{port}",
+        'taken_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'version': inventory['version'],
+        'databases': inventory['database_oids'],
+        'database_extensions': database_extensions,
+        'available_extensions': {name: version for name, version, _ in inventory['available_extensions']},
+    }
+    path = catalog_snapshot_path(host, port)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        log(f"Could not save catalog snapshot for {server_name}: {str(e)}", "WARN")
+
+def cached_database_inventories(snapshot, inventory, databases):
+    # Databases whose oid is unchanged and whose snapshot entry is younger than
+    # CATALOG_REFRESH_SECONDS (default an hour) are served from the snapshot without
+    # connecting; extension changes inside that window show up on the next refresh
+    refresh_seconds = float(os.environ.get('CATALOG_REFRESH_SECONDS', '3600'))
+    if not snapshot or refresh_seconds <= 0:
+        return {}
+    
+    cached = {}
+    for db_name in databases:
+        entry = snapshot['database_extensions'].get(db_name)
+        if (entry and entry['oid'] == inventory['database_oids'].get(db_name)
+                and time.time() - entry['fetched_at'] < refresh_seconds):
+            cached[db_name] = {
+                'extensions': [(name, version, schema) for name, (version, schema) in sorted(entry['extensions'].items())],
+                'estimated_size': None,
+                'fetched_at': entry['fetched_at'],
+                'cached': True,
+            }
+    return cached
+
+def log_catalog_diff(server_name, inventory, db_inventories, snapshot):
+    # Returns the number of changes logged since the snapshot
+    changes = 0
+    
+    def change(message):
+        nonlocal changes
+        changes += 1
+        log(f"  {message}")
+    
+    if snapshot['version'] != inventory['version']:
+        change(f"Server version changed: {snapshot['version'].split(' on ')[0]} -> {inventory['version'].split(' on ')[0]}")
+    
+    # Added/removed/recreated compare every database on the server, whether or not
+    # we can connect to it; extensions only those fetched both times
+    previous_oids = snapshot['databases']
+    current_oids = inventory['database_oids']
+    for db_name in sorted(set(current_oids) - set(previous_oids)):
+        change(f"Database added: {db_name}")
+    for db_name in sorted(set(previous_oids) - set(current_oids)):
+        change(f"Database removed: {db_name}")
+    for db_name in sorted(set(previous_oids) & set(current_oids)):
+        if previous_oids[db_name] != current_oids[db_name]:
+            change(f"Database recreated: {db_name}")
+    
+    for db_name, db_inventory in db_inventories.items():
+        entry = snapshot['database_extensions'].get(db_name)
+        if entry is None or not isinstance(db_inventory, dict) or db_inventory.get('cached'):
+            continue
+        if entry['oid'] != current_oids.get(db_name):
+            continue  # recreated: the old entry describes a different database
+        
+        before = entry['extensions']
+        after = {name: [version, schema] for name, version, schema in db_inventory['extensions']}
+        for name in sorted(set(after) - set(before)):
+            change(f"{db_name}: extension installed: {name} v{after[name][0]} (schema: {after[name][1]})")
+        for name in sorted(set(before) - set(after)):
+            change(f"{db_name}: extension removed: {name} v{before[name][0]}")
+        for name in sorted(set(before) & set(after)):
+            if before[name][0] != after[name][0]:
+                change(f"{db_name}: extension upgraded: {name} v{before[name][0]} -> v{after[name][0]}")
+            if before[name][1] != after[name][1]:
+                change(f"{db_name}: extension moved: {name} schema {before[name][1]} -> {after[name][1]}")
+    
+    available_before = snapshot.get('available_extensions', {})
+    available_after = {name: version for name, version, _ in inventory['available_extensions']}
+    updated = sorted(name for name in available_after
+                     if name in available_before and available_before[name] != available_after[name])
+    added = sorted(set(available_after) - set(available_before))
+    if updated:
+        change(f"Available extension versions changed: {', '.join(f'{name} v{available_before[name]} -> v{available_after[name]}' for name in updated)}")
+    if added:
+        change(f"Newly available extensions: {', '.join(added)}")
+    
+    return changes
+
+def test_postgres_extensions_for_server(server_name, inventory, db_inventories, snapshot=None):
+    log(f"Testing PostgreSQL extensions for {server_name}...")
+    
+    try:
+        if snapshot:
+            # Only what changed since the previous snapshot
+            for db_name, db_inventory in db_inventories.items():
+                if isinstance(db_inventory, Exception):
+                    log(f"    Error accessing database {db_name} on {server_name}: {str(db_inventory)}", "WARN")
+            cached = sum(1 for db_inventory in db_inventories.values()
+                         if isinstance(db_inventory, dict) and db_inventory.get('cached'))
+            log(f"Catalog changes on {server_name} since {snapshot['taken_at']} "
+                f"({len(db_inventories) - cached} databases refreshed, {cached} unchanged and served from the snapshot):")
+            if not log_catalog_diff(server_name, inventory, db_inventories, snapshot):
+                log("  No changes")
+            return
+        
+        log(f"Checking extensions in {len(db_inventories)} accessible databases on {server_name}...")
+        
+        for db_name, db_inventory in db_inventories.items():
+            if isinstance(db_inventory, Exception):
+                log(f"    Error accessing database {db_name} on {server_name}: {str(db_inventory)}", "WARN")
                 continue
+            
+            log(f"{server_name} - Database: {db_name} "
+                f"(connect: {db_inventory['connect_ms']:.0f}ms, queries: {db_inventory['query_ms']:.0f}ms)")
+            log("-" * 50)
+            
+            extensions = db_inventory['extensions']
+            if extensions:
+                log(f"  Extensions ({len(extensions)} installed):")
+                for ext_name, ext_version, ext_schema in extensions:
+                    log(f"    • {ext_name} v{ext_version} (schema: {ext_schema})")
+            else:
+                log("    No extensions installed")
+            
+            # Available (but not installed) extensions, from the server-wide list
+            installed = {ext_name for ext_name, _, _ in extensions}
+            available = [ext for ext in inventory['available_extensions'] if ext[0] not in installed][:5]
+            
+            if available:
+                log(f"  Available extensions (showing first 5):")
+                for ext_name, ext_version, ext_comment in available:
+                    comment_short = ext_comment[:40] + "..." if ext_comment and len(ext_comment) > 40 else ext_comment or "No description"
+                    log(f"    • {ext_name} v{ext_version} - {comment_short}")
+            
+            log("")  # Empty line between databases
         
     except Exception as e:
         log(f"PostgreSQL extensions check failed for {server_name}: {str(e)}", "ERROR")
@@ -204,6 +1329,7 @@ def test_azure_openai():
         log("Azure OpenAI test skipped - missing configuration", "WARN")
         return None
     
+    note_result(target=endpoint, deployment=deployment, api_version=api_version)
     try:
         url = f"{endpoint}/openai/deployments/{deployment}/completions?api-version={api_version}"
         headers = {
@@ -218,16 +1344,23 @@ def test_azure_openai():
         }
         
         log(f"Testing Azure OpenAI endpoint: {endpoint}")
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        log_http_phases('Azure OpenAI', url)
+        with timed_probe('http', 'Azure OpenAI') as probe:
+            response = http_session().post(url, headers=headers, json=payload, timeout=30)
+            probe['success'] = response.status_code == 200
+        log_request_phases('Azure OpenAI', response)
         
+        note_result(status_code=response.status_code)
         if response.status_code == 200:
             log("Azure OpenAI connection successful!")
             return True
         else:
+            note_result(error_class='HTTPStatusError')
             log(f"Azure OpenAI connection failed - Status: {response.status_code}, Response: {response.text}", "ERROR")
             return False
             
     except Exception as e:
+        note_result(error_class=type(e).__name__)
         log(f"Azure OpenAI connection error: {str(e)}", "ERROR")
         return False
 
@@ -242,6 +1375,7 @@ def test_azure_document_intelligence():
         log("Azure Document Intelligence test skipped - missing configuration", "WARN")
         return None
     
+    note_result(target=endpoint, api_version=api_version)
     try:
         # Test with a simple health check endpoint
         url = f"{endpoint}/formrecognizer/documentModels?api-version={api_version}"
@@ -250,16 +1384,23 @@ def test_azure_document_intelligence():
         }
         
         log(f"Testing Azure Document Intelligence endpoint: {endpoint}")
-        response = requests.get(url, headers=headers, timeout=30)
+        log_http_phases('Azure Document Intelligence', url)
+        with timed_probe('http', 'Azure Document Intelligence') as probe:
+            response = http_session().get(url, headers=headers, timeout=30)
+            probe['success'] = response.status_code == 200
+        log_request_phases('Azure Document Intelligence', response)
         
+        note_result(status_code=response.status_code)
         if response.status_code == 200:
             log("Azure Document Intelligence connection successful!")
             return True
         else:
+            note_result(error_class='HTTPStatusError')
             log(f"Azure Document Intelligence connection failed - Status: {response.status_code}, Response: {response.text}", "ERROR")
             return False
             
     except Exception as e:
+        note_result(error_class=type(e).__name__)
         log(f"Azure Document Intelligence connection error: {str(e)}", "ERROR")
         return False
 
@@ -274,6 +1415,7 @@ def test_persistent_volume():
     
     mount_path = os.environ.get('PVC_MOUNT_PATH', '/mnt/test-storage')
     
+    note_result(target=mount_path)
     try:
         # Test 1: Check if mount path exists
         if not os.path.exists(mount_path):
@@ -302,8 +1444,8 @@ def test_persistent_volume():
         log("PVC read/write test successful")
         
         # Test 4: Check storage info
-        import shutil
         total, used, free = shutil.disk_usage(mount_path)
+        note_result(total_mb=total//1024//1024, used_mb=used//1024//1024, free_mb=free//1024//1024)
         log(f"PVC storage info - Total: {total//1024//1024}MB, Used: {used//1024//1024}MB, Free: {free//1024//1024}MB")
         
         # Test 5: Test file persistence (create marker file)
@@ -319,6 +1461,7 @@ def test_persistent_volume():
         return True
         
     except Exception as e:
+        note_result(error_class=type(e).__name__)
         log(f"PVC test failed: {str(e)}", "ERROR")
         return False
 
@@ -332,6 +1475,7 @@ def test_ollama():
         log("Ollama test skipped - missing OLLAMA_ENDPOINT", "WARN")
         return None
     
+    note_result(target=endpoint, model=model)
     try:
         # Test Ollama API endpoint
         url = f"{endpoint}/api/generate"
@@ -349,16 +1493,23 @@ def test_ollama():
         }
         
         log(f"Testing Ollama endpoint: {endpoint} with model: {model}")
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        log_http_phases('Ollama', url)
+        with timed_probe('http', 'Ollama') as probe:
+            response = http_session().post(url, headers=headers, json=payload, timeout=30)
+            probe['success'] = response.status_code == 200
+        log_request_phases('Ollama', response)
         
+        note_result(status_code=response.status_code)
         if response.status_code == 200:
             log("Ollama connection successful!")
             return True
         else:
+            note_result(error_class='HTTPStatusError')
             log(f"Ollama connection failed - Status: {response.status_code}, Response: {response.text}", "ERROR")
             return False
             
     except Exception as e:
+        note_result(error_class=type(e).__name__)
         log(f"Ollama connection error: {str(e)}", "ERROR")
         return False
 
@@ -373,6 +1524,7 @@ def test_openai_compatible():
         log("OpenAI-compatible test skipped - missing OPENAI_COMPATIBLE_ENDPOINT", "WARN")
         return None
     
+    note_result(target=endpoint, model=model)
     try:
         # Test OpenAI-compatible API endpoint
         url = f"{endpoint}/v1/completions"
@@ -392,8 +1544,13 @@ def test_openai_compatible():
         }
         
         log(f"Testing OpenAI-compatible endpoint: {endpoint} with model: {model}")
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        log_http_phases('OpenAI-compatible', url)
+        with timed_probe('http', 'OpenAI-compatible completions') as probe:
+            response = http_session().post(url, headers=headers, json=payload, timeout=30)
+            probe['success'] = response.status_code == 200
+        log_request_phases('OpenAI-compatible', response)
         
+        note_result(status_code=response.status_code, api='completions')
         if response.status_code == 200:
             log("OpenAI-compatible connection successful!")
             return True
@@ -408,217 +1565,2801 @@ def test_openai_compatible():
                 "temperature": 0
             }
             
-            response = requests.post(url, headers=headers, json=chat_payload, timeout=30)
+            with timed_probe('http', 'OpenAI-compatible chat completions') as probe:
+                response = http_session().post(url, headers=headers, json=chat_payload, timeout=30)
+                probe['success'] = response.status_code == 200
+            log_request_phases('OpenAI-compatible', response)
             
+            note_result(status_code=response.status_code, api='chat/completions')
             if response.status_code == 200:
                 log("OpenAI-compatible connection successful (chat endpoint)!")
                 return True
             else:
+                note_result(error_class='HTTPStatusError')
                 log(f"OpenAI-compatible connection failed - Status: {response.status_code}, Response: {response.text}", "ERROR")
                 return False
             
     except Exception as e:
+        note_result(error_class=type(e).__name__)
         log(f"OpenAI-compatible connection error: {str(e)}", "ERROR")
         return False
 
-def test_custom_hostnames():
+def custom_host_hostname(url):
+    # Hostname of a custom host entry (a URL or a bare host[:port]), None if it has none
+    try:
+        return urlsplit(url if '://' in url else f'https://{url}').hostname
+    except ValueError:
+        return None
+
+def load_custom_hosts():
+    # CUSTOM_HOST_<n> / CUSTOM_HOST_<n>_NAME env vars (any n), plus an optional
+    # file (e.g. a mounted ConfigMap) with one "<url-or-host> [display name]" per line
+    custom_hosts = {}
+    
+    numbered = sorted(
+        int(match.group(1)) for match in
+        (re.fullmatch(r'CUSTOM_HOST_(\d+)', key) for key in os.environ) if match
+    )
+    for i in numbered:
+        host_url = os.environ.get(f'CUSTOM_HOST_{i}', '').strip()
+        host_name = os.environ.get(f'CUSTOM_HOST_{i}_NAME', f'Custom Host {i}').strip()
+        if host_url and not custom_host_hostname(host_url):
+            log(f"Ignoring CUSTOM_HOST_{i}: no hostname in '{host_url}'", "WARN")
+        elif host_url:
+            custom_hosts[host_name] = host_url
+    
+    hosts_file = os.environ.get('CUSTOM_HOSTS_FILE')
+    if hosts_file:
+        try:
+            with open(hosts_file) as f:
+                for line_number, line in enumerate(f, start=1):
+                    line = line.split('#', 1)[0].strip()
+                    if not line:
+                        continue
+                    host_url, _, host_name = line.partition(' ')
+                    if not custom_host_hostname(host_url):
+                        log(f"Ignoring {hosts_file} line {line_number}: no hostname in '{host_url}'", "WARN")
+                        continue
+                    host_name = host_name.strip() or host_url
+                    # Keep display names unique so results don't overwrite each other
+                    if host_name in custom_hosts:
+                        host_name = f"{host_name} (line {line_number})"
+                    custom_hosts[host_name] = host_url
+        except OSError as e:
+            log(f"Could not read CUSTOM_HOSTS_FILE {hosts_file}: {str(e)}", "WARN")
+    
+    return custom_hosts
+
+def resolve_unique_hosts(hostnames, workers):
+    # Each distinct hostname is resolved once, however many targets share it
+    def resolve(hostname):
+        try:
+            return sorted({info[4][0] for info in socket.getaddrinfo(hostname, None, type=socket.SOCK_STREAM)})
+        except Exception as e:
+            return e
+    
+    hostnames = sorted({hostname for hostname in hostnames if hostname})
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(hostnames))), thread_name_prefix='dns') as executor:
+        return dict(zip(hostnames, executor.map(resolve, hostnames)))
+
+def attempt_custom_host(session, service_name, test_url):
+    # Returns (status code or None, error text or None, response or None)
+    try:
+        with timed_probe('custom_host', service_name) as probe:
+            response = session.get(test_url, timeout=10, allow_redirects=True)
+            probe['success'] = response.status_code < 400
+        return response.status_code, None, response
+    except requests.exceptions.SSLError:
+        return None, "SSL Error", None
+    except requests.exceptions.ConnectionError:
+        return None, "Connection Error", None
+    except Exception as e:
+        return None, f"Error - {str(e)}", None
+
+def probe_custom_host(session, service_name, url, dns_results, attempt_pool):
+    hostname = custom_host_hostname(url)
+    addresses = dns_results.get(hostname)
+    if isinstance(addresses, Exception):
+        note_result(error_class=type(addresses).__name__, error=f"{service_name}: DNS resolution failed for {hostname}")
+        log(f"{service_name}: UNREACHABLE (DNS resolution failed for {hostname}: {str(addresses)})", "WARN")
+        return False
+    
+    if url.startswith(('http://', 'https://')):
+        test_urls = [url]
+    else:
+        # Race HTTPS and HTTP, happy-eyeballs style: HTTP starts if HTTPS hasn't
+        # answered within the fallback delay. HTTPS wins if it succeeds, but once
+        # HTTP has succeeded HTTPS only gets a short grace period, so a dropped
+        # port 443 doesn't cost the full HTTPS timeout
+        test_urls = [f'https://{url}', f'http://{url}']
+    
+    fallback_delay = float(os.environ.get('CUSTOM_HOST_FALLBACK_DELAY', '0.25'))
+    https_grace = float(os.environ.get('CUSTOM_HOST_HTTPS_GRACE', '0.5'))
+    attempts = {submit_in_context(attempt_pool, attempt_custom_host, session, service_name, test_urls[0]): test_urls[0]}
+    if len(test_urls) > 1:
+        done, _ = wait(attempts, timeout=fallback_delay)
+        first = next(iter(done), None)
+        if first is None or first.result()[0] is None or first.result()[0] >= 400:
+            attempts[submit_in_context(attempt_pool, attempt_custom_host, session, service_name, test_urls[1])] = test_urls[1]
+    
+    def succeeded(test_url):
+        status = outcomes.get(test_url, (None,))[0]
+        return status is not None and status < 400
+    
+    outcomes = {}
+    responses = {}
+    pending = set(attempts)
+    grace_deadline = None
+    while pending:
+        timeout = None if grace_deadline is None else max(0, grace_deadline - time.monotonic())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Grace period over; the fallback's success stands
+            for future in pending:
+                outcomes[attempts[future]] = (None, f"no answer within {https_grace}s of the fallback succeeding")
+            break
+        for future in done:
+            status, error, response = future.result()
+            outcomes[attempts[future]] = (status, error)
+            responses[attempts[future]] = response
+        # Stop waiting once the preferred URL has succeeded
+        if succeeded(test_urls[0]):
+            break
+        if grace_deadline is None and any(succeeded(test_url) for test_url in test_urls[1:]):
+            grace_deadline = time.monotonic() + https_grace
+    
+    for test_url in test_urls:
+        status, error = outcomes.get(test_url, (None, None))
+        if status is not None and status < 400:
+            # Consider 2xx and 3xx status codes as successful
+            log(f"{service_name}: REACHABLE (Status: {status}, URL: {test_url})")
+            log_request_phases(service_name, responses[test_url])
+            log_http_phases(service_name, test_url)
+            return True
+    
+    details = []
+    final_status = None
+    for test_url in test_urls:
+        status, error = outcomes.get(test_url, (None, "not attempted"))
+        if status is not None:
+            final_status = status
+            details.append(f"HTTP {status} for {test_url}")
+        else:
+            details.append(f"{error} for {test_url}")
+    
+    note_result(error_class='HTTPStatusError' if final_status else 'ConnectionError',
+                error=f"{service_name}: {'; '.join(details)}")
+    if final_status:
+        log(f"{service_name}: UNREACHABLE (Final Status: {final_status}; {'; '.join(details)})", "WARN")
+    else:
+        log(f"{service_name}: UNREACHABLE (Connection failed; {'; '.join(details)})", "WARN")
+    return False
+
+def test_custom_hostnames():
     log("Testing connectivity to custom hostnames...")
     
-    # Check if custom hostname tests are enabled
-    test_enabled = os.environ.get('TEST_CUSTOM_HOSTNAMES', 'true').lower() == 'true'
-    if not test_enabled:
-        log("Custom hostname tests skipped - disabled (set TEST_CUSTOM_HOSTNAMES=true to enable)", "WARN")
-        return None
+    # Check if custom hostname tests are enabled
+    test_enabled = os.environ.get('TEST_CUSTOM_HOSTNAMES', 'true').lower() == 'true'
+    if not test_enabled:
+        log("Custom hostname tests skipped - disabled (set TEST_CUSTOM_HOSTNAMES=true to enable)", "WARN")
+        return None
+    
+    custom_hosts = load_custom_hosts()
+    
+    if not custom_hosts:
+        log("No custom hostnames configured - skipping (configure CUSTOM_HOST_1, CUSTOM_HOST_2, etc. or CUSTOM_HOSTS_FILE)", "WARN")
+        return None
+    
+    concurrency = int(os.environ.get('CUSTOM_HOST_CONCURRENCY', '32'))
+    log(f"Probing {len(custom_hosts)} custom hosts with concurrency {concurrency}...")
+    
+    start = time.monotonic()
+    dns_results = resolve_unique_hosts(
+        [custom_host_hostname(url) for url in custom_hosts.values()],
+        concurrency
+    )
+    log(f"Resolved {len(dns_results)} unique hostnames in {time.monotonic() - start:.1f}s")
+    
+    results = {}
+    # Session whose per-host pool fits every attempt, since many targets may share
+    # one hostname and the default pool would throttle them; kept for later rounds
+    session = http_session(pool_maxsize=concurrency * 2)
+    # Separate pool for the HTTPS/HTTP attempts so host workers never wait on their
+    # own pool. HTTPS attempts cut short by the grace period finish in the
+    # background instead of holding up the summary.
+    attempt_pool = ThreadPoolExecutor(max_workers=concurrency * 2, thread_name_prefix='attempt')
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='host') as host_pool:
+            futures = {
+                service_name: submit_in_context(host_pool, probe_custom_host, session, service_name, url,
+                                                dns_results, attempt_pool)
+                for service_name, url in custom_hosts.items()
+            }
+            for service_name, future in futures.items():
+                try:
+                    results[service_name] = future.result()
+                except Exception as e:
+                    note_result(error_class=type(e).__name__, error=f"{service_name}: {str(e)}")
+                    log(f"{service_name}: ERROR - {str(e)}", "WARN")
+                    results[service_name] = False
+    finally:
+        attempt_pool.shutdown(wait=False)
+    
+    # Summary of custom hostname tests
+    reachable = sum(1 for v in results.values() if v)
+    total = len(results)
+    log(f"Custom hostnames summary: {reachable}/{total} hosts reachable in {time.monotonic() - start:.1f}s")
+    
+    return results
+
+EXTERNAL_PROBE_DEPTHS = ('tcp', 'tls', 'head', 'get')
+
+def external_probe_depth(service_name):
+    # EXTERNAL_PROBE_DEPTH_<SERVICE> overrides EXTERNAL_PROBE_DEPTH for one service
+    depth = os.environ.get(f'EXTERNAL_PROBE_DEPTH_{check_env_key(service_name)}',
+                           os.environ.get('EXTERNAL_PROBE_DEPTH', 'get')).lower()
+    if depth not in EXTERNAL_PROBE_DEPTHS:
+        log(f"{service_name}: unknown probe depth '{depth}', using 'get'", "WARN")
+        depth = 'get'
+    return depth
+
+def external_proxy(url):
+    # The proxy requests would use for url (HTTP(S)_PROXY, honouring NO_PROXY), or None
+    proxy = requests.utils.select_proxy(url, requests.utils.get_environ_proxies(url))
+    if proxy and '://' not in proxy:
+        proxy = f"http://{proxy}"  # requests assumes http:// for bare host:port
+    return proxy
+
+def open_proxy_tunnel(proxy, host, port, timeout=10):
+    # CONNECTs through an HTTP proxy so TCP/TLS probes take the same egress path as
+    # the session. Returns (socket, phases in ms, proxy address).
+    proxy_parts = urlsplit(proxy)
+    if proxy_parts.scheme != 'http':
+        raise OSError(f"cannot tunnel through a {proxy_parts.scheme} proxy")
+    sock, phases, address = open_traced_connection(proxy_parts.hostname, proxy_parts.port or 80, False, timeout)
+    try:
+        request = f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+        if proxy_parts.username:
+            credentials = f"{unquote(proxy_parts.username)}:{unquote(proxy_parts.password or '')}"
+            request += f"Proxy-Authorization: Basic {base64.b64encode(credentials.encode()).decode('ascii')}\r\n"
+        start = time.monotonic()
+        sock.sendall(f"{request}\r\n".encode('ascii'))
+        response = b''
+        while b'\r\n\r\n' not in response:
+            chunk = sock.recv(4096)
+            if not chunk or len(response) > 65536:
+                raise OSError("proxy closed the connection during CONNECT")
+            response += chunk
+        phases['proxy_connect'] = (time.monotonic() - start) * 1000
+        
+        status_line = response.split(b'\r\n', 1)[0].decode('latin-1')
+        status = status_line.split()[1] if len(status_line.split()) > 1 else ''
+        if status != '200':
+            raise OSError(f"proxy answered CONNECT with {status_line[:60]!r}")
+    except Exception:
+        sock.close()
+        raise
+    return sock, phases, address
+
+def probe_external_connection(parts, depth, proxy, timeout):
+    # 'tcp' and 'tls': TCP connect, plus a TLS handshake with SNI, tunnelled through
+    # the proxy when one applies
+    use_tls = parts.scheme == 'https'
+    port = parts.port or (443 if use_tls else 80)
+    via = f" via proxy {urlsplit(proxy).hostname}" if proxy else ""
+    
+    try:
+        if proxy:
+            sock, phases, address = open_proxy_tunnel(proxy, parts.hostname, port, timeout)
+        else:
+            sock, phases, address = open_traced_connection(parts.hostname, port, False, timeout)
+    except socket.gaierror as e:
+        return False, f"DNS resolution failed{via} ({str(e)})", {}, None
+    except socket.timeout:
+        return False, f"TCP connect timed out{via} - likely blocked by a firewall", {}, None
+    except ConnectionRefusedError:
+        return False, f"TCP connection refused{via}", {}, None
+    except OSError as e:
+        return False, f"TCP connect failed{via} ({str(e)})", {}, None
+    
+    try:
+        if use_tls and depth == 'tls':
+            start = time.monotonic()
+            try:
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+            except (ssl.SSLError, OSError) as e:
+                return False, f"TLS handshake failed{via} ({str(e)})", phases, address
+            phases['tls_handshake'] = (time.monotonic() - start) * 1000
+    finally:
+        sock.close()
+    
+    detail = "TLS handshake OK" if 'tls_handshake' in phases else "TCP connect OK"
+    return True, detail + via, phases, address
+
+def describe_request_error(error, timeout, via):
+    # Names the step a session request failed at, like probe_external_connection does
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    if isinstance(error, requests.exceptions.ProxyError):
+        return f"proxy error{via} ({str(error)})"
+    if isinstance(error, requests.exceptions.SSLError):
+        return f"TLS handshake failed{via} ({str(error)})"
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return f"TCP connect timed out{via} - likely blocked by a firewall"
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return f"TCP connect OK{via} but no HTTP response within {timeout}s - site is slow"
+    if type(reason).__name__ == 'NameResolutionError':
+        return f"DNS resolution failed ({str(reason)})"
+    if 'refused' in str(error).lower():
+        return f"TCP connection refused{via}"
+    return f"HTTP request failed{via} ({str(error)})"
+
+def probe_external_service(url, depth, timeout=10):
+    # Escalates TCP connect -> TLS handshake -> HEAD -> status line of a GET and stops
+    # at `depth`, so no page bodies are downloaded and no redirects followed. HEAD/GET
+    # go through the shared session, so HTTP(S)_PROXY and NO_PROXY apply as for every
+    # other check, and report that request's own phases. Returns (success, detail,
+    # phases in ms, address).
+    parts = urlsplit(url)
+    proxy = external_proxy(url)
+    if depth in ('tcp', 'tls'):
+        return probe_external_connection(parts, depth, proxy, timeout)
+    
+    proxy_host = urlsplit(proxy).hostname if proxy else None
+    via = f" via proxy {proxy_host}" if proxy else ""
+    session = http_session()
+    try:
+        method = 'HEAD' if depth == 'head' else 'GET'
+        with session.request(method, url, stream=True, allow_redirects=False, timeout=timeout) as response:
+            status = response.status_code
+        if depth == 'head' and status in (405, 501):
+            # Some sites reject HEAD outright; fall back to a GET
+            with session.get(url, stream=True, allow_redirects=False, timeout=timeout) as response:
+                status = response.status_code
+    except requests.exceptions.RequestException as e:
+        return False, describe_request_error(e, timeout, via), {}, None
+    
+    # Consider 2xx and 3xx status codes as successful
+    return status < 400, f"Status: {status}{via}", response.trace_phases, response.trace_address or parts.hostname
+
+EXTERNAL_SERVICES = {
+    'Office 365': 'https://login.microsoftonline.com',
+    'Google Drive': 'https://accounts.google.com',
+    'Notion': 'https://www.notion.so',
+    'Box': 'https://account.box.com',
+    'Dropbox': 'https://www.dropbox.com',
+    'ServiceNow': 'https://www.servicenow.com',
+    'Amazon S3': 'https://aws.amazon.com/s3/',
+    'Atlassian': 'https://id.atlassian.com/login'
+}
+
+def test_external_services():
+    log("Testing connectivity to external services...")
+    
+    # Check if external service tests are enabled
+    test_enabled = os.environ.get('TEST_EXTERNAL_SERVICES', 'true').lower() == 'true'
+    if not test_enabled:
+        log("External service tests skipped - disabled (set TEST_EXTERNAL_SERVICES=true to enable)", "WARN")
+        return None
+    
+    results = {}
+    
+    for service_name, url in EXTERNAL_SERVICES.items():
+        depth = external_probe_depth(service_name)
+        log(f"Testing {service_name} connectivity (depth: {depth})...")
+        try:
+            with timed_probe('external_service', service_name) as probe:
+                success, detail, phases, address = probe_external_service(url, depth)
+                probe['success'] = success
+        except Exception as e:
+            note_result(error_class=type(e).__name__, error=f"{service_name}: {str(e)}")
+            log(f"{service_name}: ERROR - {str(e)}", "WARN")
+            results[service_name] = False
+            continue
+        
+        if phases and phase_timing_enabled():
+            # All phases come from the same connection, so they add up to the probe time
+            phases.setdefault('total', sum(phases.values()))
+            log_phase_samples(service_name, [phases], address)
+        
+        if success:
+            log(f"{service_name}: REACHABLE ({detail})")
+        else:
+            note_result(error_class='Unreachable', error=f"{service_name}: {detail}")
+            log(f"{service_name}: UNREACHABLE ({detail})", "WARN")
+        results[service_name] = success
+    
+    # Summary of external service tests
+    reachable = sum(1 for v in results.values() if v)
+    total = len(results)
+    log(f"External services summary: {reachable}/{total} services reachable")
+    
+    return results
+
+# Checks run by main(), in the order they appear in the TEST SUMMARY
+CHECKS = [
+    ('Primary PostgreSQL', test_postgres),
+    ('Secondary PostgreSQL', test_postgres_secondary),
+    ('Azure OpenAI', test_azure_openai),
+    ('Azure Document Intelligence', test_azure_document_intelligence),
+    ('Ollama', test_ollama),
+    ('OpenAI-compatible', test_openai_compatible),
+    ('Persistent Volume Claim', test_persistent_volume),
+    ('Custom Hostnames', test_custom_hostnames),
+    ('External Services', test_external_services),
+]
+
+def run_check(name, func, started):
+    _log_context.check_name = name
+    started[name] = time.monotonic()
+    reset_result(name)
+    try:
+        return func()
+    except Exception as e:
+        note_result(error_class=type(e).__name__)
+        log(f"{name} check crashed: {str(e)}", "ERROR")
+        return False
+    finally:
+        _log_context.check_name = None
+
+# Checks that timed out and were left running; see __main__
+_abandoned_checks = set()
+
+def check_statement_timeout():
+    # libpq options that stop a single query from outliving its check (CHECK_TIMEOUT)
+    return f"-c statement_timeout={int(float(os.environ.get('CHECK_TIMEOUT', '120')) * 1000)}"
+
+def submit_daemon(max_workers, calls, thread_name_prefix):
+    # Like ThreadPoolExecutor.submit, but on daemon threads, which the interpreter
+    # does not join at exit: a check abandoned at its deadline cannot hold up sys.exit
+    work = queue.SimpleQueue()
+    futures = []
+    for func, args in calls:
+        future = Future()
+        work.put((future, func, args))
+        futures.append(future)
+    
+    def worker():
+        while True:
+            try:
+                future, func, args = work.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled before it started
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+    
+    for index in range(max(1, min(max_workers, len(futures)))):
+        threading.Thread(target=worker, name=f"{thread_name_prefix}_{index}", daemon=True).start()
+    return futures
+
+def run_checks(checks, on_complete=None, max_workers=None):
+    # Run independent checks on a bounded worker pool. Each check gets its own
+    # deadline (CHECK_TIMEOUT) and the whole pass is capped by GLOBAL_TIMEOUT.
+    # Results are returned in the order of `checks`, skipped checks (None) omitted.
+    # on_complete(name, result, duration) is called as each check finishes or times out.
+    parallel = os.environ.get('PARALLEL_CHECKS', 'true').lower() == 'true'
+    if max_workers is None:
+        max_workers = int(os.environ.get('CHECK_CONCURRENCY', '8'))
+    if not parallel:
+        max_workers = 1
+    check_timeout = float(os.environ.get('CHECK_TIMEOUT', '120'))
+    global_timeout = float(os.environ.get('GLOBAL_TIMEOUT', '300'))
+    
+    log(f"Running {len(checks)} checks with {max_workers} worker(s) "
+        f"(per-check timeout: {check_timeout:.0f}s, global timeout: {global_timeout:.0f}s)")
+    
+    pass_start = time.monotonic()
+    global_deadline = pass_start + global_timeout
+    started = {}
+    outcomes = {}
+    
+    submitted = submit_daemon(max_workers, [(run_check, (name, func, started)) for name, func in checks], 'check')
+    futures = {future: name for future, (name, _) in zip(submitted, checks)}
+    pending = set(futures)
+    
+    while pending:
+        now = time.monotonic()
+        
+        # Expire checks that ran past their own deadline or the global one
+        for future in list(pending):
+            name = futures[future]
+            if now >= global_deadline:
+                message = f"TIMEOUT (global deadline of {global_timeout:.0f}s reached)"
+            elif name in started and now - started[name] >= check_timeout:
+                message = f"TIMEOUT ({check_timeout:.0f}s)"
+            else:
+                continue
+            log(f"{name}: {message}", "ERROR")
+            with _result_lock:
+                _result_details.setdefault(name, {'metadata': {}}).update(
+                    status='timeout', error_class='CheckTimeout', error=message)
+            if not future.cancel():
+                _abandoned_checks.add(name)
+            outcomes[name] = False
+            pending.discard(future)
+            record_probe('check', name, now - started.get(name, now), False)
+            if on_complete:
+                on_complete(name, False, now - started.get(name, now))
+        
+        if not pending:
+            break
+        
+        # Sleep until the next check finishes or the nearest deadline passes
+        next_deadline = global_deadline
+        for future in pending:
+            name = futures[future]
+            if name in started:
+                next_deadline = min(next_deadline, started[name] + check_timeout)
+        done, pending = wait(pending, timeout=max(0.05, next_deadline - now), return_when=FIRST_COMPLETED)
+        
+        for future in done:
+            name = futures[future]
+            if not future.cancelled():
+                outcomes[name] = future.result()
+                duration = time.monotonic() - started[name]
+                if outcomes[name] is not None:
+                    record_probe('check', name, duration, is_success(outcomes[name]))
+                if on_complete:
+                    on_complete(name, outcomes[name], duration)
+    
+    log(f"All checks finished in {time.monotonic() - pass_start:.1f}s")
+    
+    results = {}
+    for name, _ in checks:
+        if outcomes.get(name) is not None:
+            results[name] = outcomes[name]
+    return results
+
+# Structured per-check results: checks attach target/error/metadata with
+# note_result() while they run, and run_checks' on_complete turns them into records
+RUN_ID = uuid.uuid4().hex[:12]
+_result_details = {}
+_result_lock = threading.Lock()
+
+def note_result(check_name=None, **fields):
+    # Defaults to the check running on this thread. target and metadata keys are
+    # overwritten; error and error_class keep the first value (the root cause).
+    check_name = check_name or getattr(_log_context, 'check_name', None)
+    if not check_name:
+        return
+    with _result_lock:
+        details = _result_details.setdefault(check_name, {'metadata': {}})
+        for key, value in fields.items():
+            if key in ('error', 'error_class'):
+                details.setdefault(key, value)
+            elif key == 'target':
+                details[key] = value
+            else:
+                details['metadata'][key] = value
+
+def reset_result(check_name):
+    with _result_lock:
+        _result_details.pop(check_name, None)
+
+def build_result(name, result, duration):
+    with _result_lock:
+        details = _result_details.get(name, {'metadata': {}})
+        metadata = dict(details['metadata'])
+    
+    if result is None:
+        status = 'skipped'
+    else:
+        status = details.get('status') or ('passed' if is_success(result) else 'failed')
+    
+    record = {
+        'type': 'check_result',
+        'run_id': RUN_ID,
+        'check': name,
+        'status': status,
+        'required': name == REQUIRED_CHECK,
+        'finished_at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'duration_ms': round(duration * 1000, 1),
+        'target': details.get('target'),
+        'error_class': details.get('error_class') if status != 'passed' else None,
+        'error': details.get('error') if status != 'passed' else None,
+        'metadata': metadata,
+    }
+    if isinstance(result, dict):
+        record['services'] = {service: 'reachable' if ok else 'unreachable' for service, ok in result.items()}
+    return record
+
+def results_jsonl_enabled():
+    return os.environ.get('RESULTS_JSONL', 'false').lower() == 'true'
+
+def emit_result_line(record):
+    # One JSON object per line on stdout, easy to pick out of the log stream
+    if results_jsonl_enabled():
+        enqueue_log_record((None, None, None, json.dumps(record, default=str)))
+
+def write_run_report(records, started_at, duration, passed=None):
+    # Single JSON document for the whole run, written atomically (RESULTS_REPORT_PATH).
+    # passed defaults to the outcome of the required check.
+    report_path = os.environ.get('RESULTS_REPORT_PATH')
+    if not report_path:
+        return
+    
+    if passed is None:
+        required = [record for record in records if record['required']]
+        passed = bool(required) and all(record['status'] == 'passed' for record in required)
+    report = {
+        'type': 'run_report',
+        'run_id': RUN_ID,
+        'pod': os.environ.get('HOSTNAME'),
+        'started_at': started_at.isoformat(timespec='milliseconds'),
+        'duration_ms': round(duration * 1000, 1),
+        'passed': passed,
+        'counts': {status: sum(1 for record in records if record['status'] == status)
+                   for status in ('passed', 'failed', 'timeout', 'skipped')},
+        'checks': records,
+    }
+    try:
+        directory = os.path.dirname(os.path.abspath(report_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{report_path}.{RUN_ID}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(temp_path, report_path)
+        log(f"Wrote run report to {report_path}")
+    except OSError as e:
+        log(f"Could not write run report to {report_path}: {str(e)}", "WARN")
+
+# On-disk baseline of check durations (BASELINE_STORE=true). samples.bin is an
+# append-only log of fixed-size records; rollups.json keeps per-check daily
+# count/mean/M2 of log(duration) from which rolling baselines are computed.
+BASELINE_RECORD = struct.Struct('<dIfB')  # unix time, crc32(check name), duration ms, success
+
+def load_baseline_store():
+    if os.environ.get('BASELINE_STORE', 'false').lower() != 'true':
+        return None
+    
+    directory = os.environ.get('BASELINE_DIR') or os.path.join(
+        os.environ.get('PVC_MOUNT_PATH', '/mnt/test-storage'), 'connectivity-baseline')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        rollups_path = os.path.join(directory, 'rollups.json')
+        rollups = {}
+        if os.path.exists(rollups_path):
+            with open(rollups_path) as f:
+                rollups = json.load(f)
+    except (OSError, ValueError) as e:
+        log(f"Baseline store unavailable at {directory}: {str(e)}", "WARN")
+        return None
+    
+    samples = sum(day[0] + day[3] for days in rollups.values() for day in days.values())
+    log(f"Baseline store: {directory} ({len(rollups)} checks, {samples} samples in rollups)")
+    return {'dir': directory, 'rollups': rollups}
+
+def merge_rollups(rollups):
+    # Combine [count, mean, M2, failures] rollups (Chan et al. parallel variance)
+    count, mean, m2, failures = 0, 0.0, 0.0, 0
+    for n, day_mean, day_m2, day_failures in rollups:
+        failures += day_failures
+        if n == 0:
+            continue
+        delta = day_mean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += day_m2 + delta * delta * count * n / total
+        count = total
+    return count, mean, m2, failures
+
+def check_baseline(store, name, result, duration, key=None):
+    # Compares one check duration with the rolling baseline of the previous
+    # BASELINE_WINDOW_DAYS, then appends it under `key` (default: the check
+    # name). Returns True if it is a regression.
+    if store is None or result is None:
+        return False
+    key = key or name
+    
+    success = is_success(result)
+    duration_ms = duration * 1000
+    now = time.time()
+    today = datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%d')
+    days = store['rollups'].setdefault(key, {})
+    
+    regression = False
+    if success:
+        window_days = int(os.environ.get('BASELINE_WINDOW_DAYS', '7'))
+        oldest = datetime.fromtimestamp(now - window_days * 86400, timezone.utc).strftime('%Y-%m-%d')
+        count, mean, m2, failures = merge_rollups(rollup for day, rollup in days.items() if day >= oldest)
+        
+        # Latencies are roughly log-normal, so the test runs on log(ms)
+        value = math.log(max(duration_ms, 0.001))
+        if count >= int(os.environ.get('BASELINE_MIN_SAMPLES', '10')):
+            stddev = math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+            baseline_ms = math.exp(mean)
+            z_score = (value - mean) / stddev if stddev > 0 else 0.0
+            regression = (z_score >= float(os.environ.get('BASELINE_Z_THRESHOLD', '3'))
+                          and duration_ms >= baseline_ms * (1 + float(os.environ.get('BASELINE_MIN_INCREASE', '0.2'))))
+            note_result(name, baseline_ms=round(baseline_ms, 1), baseline_samples=count,
+                        baseline_z_score=round(z_score, 2), regression=regression)
+            if regression:
+                log(f"{name}: latency regression - {duration_ms:.0f}ms vs baseline {baseline_ms:.0f}ms "
+                    f"(z={z_score:.1f} over {count} samples in {window_days}d)", "WARN")
+        
+        day = days.setdefault(today, [0, 0.0, 0.0, 0])
+        day[0] += 1
+        delta = value - day[1]
+        day[1] += delta / day[0]
+        day[2] += delta * (value - day[1])
+    else:
+        days.setdefault(today, [0, 0.0, 0.0, 0])[3] += 1
+    
+    try:
+        with open(os.path.join(store['dir'], 'samples.bin'), 'ab') as f:
+            f.write(BASELINE_RECORD.pack(now, zlib.crc32(key.encode('utf-8')), duration_ms, success))
+    except OSError as e:
+        log(f"Could not append baseline sample: {str(e)}", "WARN")
+    return regression
+
+def save_baseline_store(store):
+    # Drop rollups past retention, cap samples.bin by keeping its newest half,
+    # and rewrite rollups.json atomically
+    if store is None:
+        return
+    
+    retention_days = int(os.environ.get('BASELINE_RETENTION_DAYS', '90'))
+    oldest = datetime.fromtimestamp(time.time() - retention_days * 86400, timezone.utc).strftime('%Y-%m-%d')
+    for days in store['rollups'].values():
+        for day in [day for day in days if day < oldest]:
+            del days[day]
+    
+    try:
+        samples_path = os.path.join(store['dir'], 'samples.bin')
+        max_bytes = int(os.environ.get('BASELINE_MAX_BYTES', str(8 * 1024 * 1024)))
+        if os.path.exists(samples_path) and os.path.getsize(samples_path) > max_bytes:
+            keep = (max_bytes // 2) // BASELINE_RECORD.size * BASELINE_RECORD.size
+            with open(samples_path, 'rb') as f:
+                f.seek(-keep, os.SEEK_END)
+                tail = f.read()
+            with open(f"{samples_path}.tmp", 'wb') as f:
+                f.write(tail)
+            os.replace(f"{samples_path}.tmp", samples_path)
+        
+        rollups_path = os.path.join(store['dir'], 'rollups.json')
+        with open(f"{rollups_path}.tmp", 'w') as f:
+            json.dump(store['rollups'], f, separators=(',', ':'))
+        os.replace(f"{rollups_path}.tmp", rollups_path)
+    except OSError as e:
+        log(f"Could not save baseline store: {str(e)}", "WARN")
+
+# Warm PostgreSQL connections kept between monitor rounds, keyed by target
+_warm_connections = {}
+_warm_connections_lock = threading.Lock()
+
+def probe_warm_postgres(config, after_query=None):
+    # after_query(connection), if given, runs on the warm connection once SELECT 1 succeeded
+    server_name = config['server_name']
+    if not all([config['host'], config['user'], config['password']]):
+        note_result(error_class='ConfigurationError', error=f"{server_name} not configured")
+        log(f"{server_name} monitor probe skipped - missing required configuration", "WARN")
+        return False
+    
+    key = (config['host'], config['port'], config['database'], config['user'])
+    with _warm_connections_lock:
+        entry = _warm_connections.setdefault(key, {'conn': None, 'lock': threading.Lock()})
+    
+    # A probe from a previous round that timed out may still hold the connection
+    if not entry['lock'].acquire(blocking=False):
+        note_result(error_class='ProbeStillRunning', error=f"{server_name}: previous probe still running")
+        log(f"{server_name}: previous probe still running", "WARN")
+        return False
+    
+    try:
+        if entry['conn'] is None or entry['conn'].closed:
+            log(f"Opening warm connection to {server_name} at {config['host']}:{config['port']}/{config['database']}")
+            with timed_probe('postgres_connect', server_name):
+                entry['conn'] = psycopg2.connect(
+                    host=config['host'],
+                    hostaddr=pg_hostaddr(config['host']),
+                    port=config['port'],
+                    database=config['database'],
+                    user=config['user'],
+                    password=config['password'],
+                    connect_timeout=10,
+                    options=check_statement_timeout()
+                )
+            entry['conn'].autocommit = True
+        
+        query_start = time.monotonic()
+        with timed_probe('postgres_query', server_name):
+            cursor = entry['conn'].cursor()
+            cursor.execute("SELECT 1;")
+            cursor.fetchone()
+            cursor.close()
+        log(f"{server_name}: query OK ({(time.monotonic() - query_start) * 1000:.1f}ms)")
+        if after_query is not None:
+            after_query(entry['conn'])
+        return True
+        
+    except Exception as e:
+        log(f"{server_name} monitor probe failed: {str(e)}", "ERROR")
+        if entry['conn'] is not None:
+            entry['conn'].close()
+            entry['conn'] = None
+        return False
+    finally:
+        entry['lock'].release()
+
+def monitor_postgres():
+    return probe_warm_postgres(postgres_primary_config())
+
+def monitor_replica_lag(server_name, conn):
+    # One lag sample per monitor round; exported as a replication_lag metric whose
+    # "duration" is the lag in seconds
+    lag_threshold = float(os.environ.get('REPLICATION_LAG_THRESHOLD', '30'))
+    try:
+        cursor = conn.cursor()
+        try:
+            _, lag = replica_lag(cursor)
+        finally:
+            cursor.close()
+    except Exception as e:
+        log(f"{server_name}: replication lag unavailable: {str(e)}", "WARN")
+        return
+    if lag is None:
+        return  # not a streaming replica
+    
+    record_probe('replication_lag', server_name, lag, lag <= lag_threshold)
+    note_result(replication_lag_seconds=round(lag, 3))
+    if lag > lag_threshold:
+        log(f"{server_name}: replication lag {lag:.2f}s exceeds {lag_threshold:.0f}s", "WARN")
+    else:
+        log(f"{server_name}: replication lag {lag:.2f}s")
+
+def monitor_postgres_secondary():
+    config = postgres_secondary_config()
+    if config is None:
+        return None
+    if not replication_check_enabled():
+        return probe_warm_postgres(config)
+    return probe_warm_postgres(config, functools.partial(monitor_replica_lag, config['server_name']))
+
+# Full inventories only run on startup; monitor rounds use a cheap query on a warm connection
+MONITOR_OVERRIDES = {
+    'Primary PostgreSQL': monitor_postgres,
+    'Secondary PostgreSQL': monitor_postgres_secondary,
+}
+
+def check_env_key(name):
+    # 'Azure OpenAI' -> 'AZURE_OPENAI'
+    return ''.join(c if c.isalnum() else '_' for c in name.upper()).strip('_')
+
+def is_success(result):
+    if isinstance(result, dict):
+        return bool(result) and all(result.values())
+    return bool(result)
+
+def log_monitor_summary(history, names):
+    for name in names:
+        samples = [sample for sample in history if sample['check'] == name]
+        if not samples:
+            continue
+        successes = sum(1 for sample in samples if is_success(sample['result']))
+        durations = [sample['duration'] * 1000 for sample in samples]
+        log(f"  {name}: {'UP' if is_success(samples[-1]['result']) else 'DOWN'} - "
+            f"availability {successes / len(samples) * 100:.1f}% over {len(samples)} rounds, "
+            f"last {durations[-1]:.0f}ms, {format_percentiles(durations)}")
+
+def run_monitor(checks, baseline=None):
+    # Re-run checks forever, each on its own interval (MONITOR_INTERVAL, or
+    # MONITOR_INTERVAL_<CHECK> per check, 0 disables) with random jitter.
+    # Results are kept in a bounded in-memory ring buffer.
+    default_interval = float(os.environ.get('MONITOR_INTERVAL', '60'))
+    jitter = float(os.environ.get('MONITOR_JITTER', '0.1'))
+    history = deque(maxlen=int(os.environ.get('MONITOR_HISTORY_SIZE', '1000')))
+    
+    def next_delay(interval):
+        return interval * (1 + random.uniform(-jitter, jitter))
+    
+    def record(name, result, duration):
+        history.append({'timestamp': time.time(), 'check': name, 'result': result, 'duration': duration})
+        # Monitor overrides are much cheaper than the startup check, so keep their own baseline
+        check_baseline(baseline, name, result, duration,
+                       f"{name} (monitor)" if name in MONITOR_OVERRIDES else name)
+        emit_result_line(build_result(name, result, duration))
+    
+    intervals = {}
+    monitored = []
+    for name, func in checks:
+        interval = float(os.environ.get(f"MONITOR_INTERVAL_{check_env_key(name)}", default_interval))
+        if interval > 0:
+            intervals[name] = interval
+            monitored.append((name, MONITOR_OVERRIDES.get(name, func)))
+    
+    if not monitored:
+        log("Monitor mode has no checks to run", "WARN")
+        while True:
+            time.sleep(3600)
+    
+    log(f"Monitor mode: re-running {len(monitored)} checks every ~{default_interval:.0f}s "
+        f"(jitter: ±{jitter * 100:.0f}%, history: {history.maxlen} results)")
+    
+    next_run = {name: time.monotonic() + next_delay(intervals[name]) for name, _ in monitored}
+    round_number = 0
+    
+    while monitored:
+        now = time.monotonic()
+        due = [(name, func) for name, func in monitored if next_run[name] <= now]
+        if not due:
+            time.sleep(max(0.1, min(next_run.values()) - now))
+            continue
+        
+        round_number += 1
+        log("=" * 60)
+        log(f"Monitor round {round_number}: {', '.join(name for name, _ in due)}")
+        results = run_checks(due, on_complete=record)
+        save_baseline_store(baseline)
+        
+        for name, func in due:
+            if name in results:
+                next_run[name] = time.monotonic() + next_delay(intervals[name])
+            else:
+                # Check reported itself as not configured; stop scheduling it
+                monitored.remove((name, func))
+                del next_run[name]
+        
+        log("MONITOR SUMMARY:")
+        log_monitor_summary(history, [name for name, _ in due if name in results])
+    
+    log("Monitor mode has no configured checks left", "WARN")
+    while True:
+        time.sleep(3600)
+
+def load_fleet_servers(path):
+    # JSON list of servers, or {"defaults": {...}, "servers": [...]}. Each server needs
+    # a host; name, port, database, user and password or password_env are optional
+    # and fall back to the defaults, then to the PG* env vars.
+    with open(path) as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = {'servers': config}
+    if not isinstance(config, dict):
+        raise ValueError(f"expected a list of servers or an object, got {type(config).__name__}")
+    if not isinstance(config.get('defaults', {}), dict):
+        raise ValueError("'defaults' must be an object")
+    if not isinstance(config.get('servers', []), list):
+        raise ValueError("'servers' must be a list")
+    
+    defaults = {
+        'port': os.environ.get('PGPORT', '5432'),
+        'database': os.environ.get('PGDATABASE', 'postgres'),
+        'user': os.environ.get('PGUSER'),
+        'password_env': 'PGPASSWORD',
+    }
+    defaults.update(config.get('defaults', {}))
+    
+    servers = []
+    names = set()
+    for index, entry in enumerate(config.get('servers', []), start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"server #{index} must be an object, got {type(entry).__name__}")
+        server = dict(defaults, **entry)
+        if not server.get('host'):
+            raise ValueError(f"server #{index} has no host")
+        name = server.get('name') or server['host']
+        if name in names:
+            name = f"{name} (#{index})"
+        names.add(name)
+        servers.append({
+            'server_name': name,
+            'host': server['host'],
+            'port': str(server['port']),
+            'database': server['database'],
+            'user': server['user'],
+            'password': server.get('password') or os.environ.get(server.get('password_env') or ''),
+        })
+    return servers
+
+def run_postgres_fleet():
+    # test_postgres_server against every server in FLEET_CONFIG. FLEET_CONCURRENCY
+    # servers run at a time, each opening at most EXTENSION_CHECK_CONCURRENCY
+    # connections, under the usual CHECK_TIMEOUT / GLOBAL_TIMEOUT deadlines.
+    path = os.environ.get('FLEET_CONFIG')
+    if not path:
+        log("Fleet mode needs FLEET_CONFIG pointing at a server list", "ERROR")
+        return 1
+    try:
+        servers = load_fleet_servers(path)
+    except (OSError, ValueError) as e:
+        log(f"Could not load fleet config {path}: {str(e)}", "ERROR")
+        return 1
+    if not servers:
+        log(f"No servers defined in {path}", "ERROR")
+        return 1
+    
+    concurrency = int(os.environ.get('FLEET_CONCURRENCY', '8'))
+    log(f"Fleet mode: {len(servers)} PostgreSQL servers from {path}, {concurrency} at a time")
+    log("=" * 60)
+    start_metrics_server()
+    
+    started_at = datetime.now(timezone.utc)
+    start = time.monotonic()
+    dns_results = resolve_unique_hosts([server['host'] for server in servers if not is_ip_literal(server['host'])],
+                                       int(os.environ.get('DNS_CONCURRENCY', '32')))
+    unresolved = [host for host, addresses in dns_results.items() if isinstance(addresses, Exception)]
+    log(f"Resolved {len(dns_results) - len(unresolved)}/{len(dns_results)} server hostnames in {time.monotonic() - start:.2f}s" +
+        (f" (failed: {', '.join(unresolved)})" if unresolved else ""), "WARN" if unresolved else "INFO")
+    
+    records = {}
+    
+    def collect(name, result, duration):
+        records[name] = build_result(name, result, duration)
+        emit_result_line(records[name])
+    
+    checks = [(server['server_name'], functools.partial(test_postgres_server, **server)) for server in servers]
+    run_checks(checks, on_complete=collect, max_workers=concurrency)
+    elapsed = time.monotonic() - start
+    
+    log("=" * 60)
+    log("FLEET SUMMARY:")
+    passed = 0
+    for server in servers:
+        record = records.get(server['server_name'])
+        if record is None:
+            continue
+        metadata = record['metadata']
+        if record['status'] == 'passed':
+            passed += 1
+            details = (f"{metadata.get('server_version', '').split(' on ')[0]}, "
+                       f"{len(metadata.get('databases', {}))} databases, "
+                       f"{metadata.get('connections_in_use')}/{metadata.get('max_connections')} connections")
+        else:
+            details = ' '.join((record['error'] or record['error_class'] or 'failed').split())
+        log(f"  {server['server_name']} ({record['target']}): {record['status'].upper()} "
+            f"in {record['duration_ms']:.0f}ms - {details}", "INFO" if record['status'] == 'passed' else "ERROR")
+    
+    slowest = sorted(records.values(), key=lambda record: record['duration_ms'], reverse=True)[:3]
+    slowest_text = ', '.join(f"{record['check']} {record['duration_ms']:.0f}ms" for record in slowest)
+    log(f"  {passed}/{len(servers)} servers passed in {elapsed:.1f}s (slowest: {slowest_text})")
+    write_run_report([records[name] for name, _ in checks if name in records], started_at, elapsed,
+                     passed=passed == len(servers))
+    return 0 if passed == len(servers) else 1
+
+# Upper bounds (ms) of the latency histogram printed by benchmarks
+BENCHMARK_HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+def parse_workload(spec):
+    # "select:80,insert:15,copy:5" -> [('select', 80), ('insert', 15), ('copy', 5)]
+    workload = []
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition(':')
+        workload.append((name.strip().lower(), float(weight or 1)))
+    return workload
+
+def log_latency_report(label, latencies_ms, elapsed):
+    if not latencies_ms:
+        log(f"  {label}: no operations completed")
+        return
+    
+    log(f"  {label}: {len(latencies_ms)} ops, {len(latencies_ms) / elapsed:.1f} ops/s, "
+        f"{format_percentiles(latencies_ms)}, max {max(latencies_ms):.1f}ms")
+    
+    counts = [0] * (len(BENCHMARK_HISTOGRAM_MS) + 1)
+    for value in latencies_ms:
+        for i, bound in enumerate(BENCHMARK_HISTOGRAM_MS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    
+    labels = [f"<= {bound}ms" for bound in BENCHMARK_HISTOGRAM_MS] + [f"> {BENCHMARK_HISTOGRAM_MS[-1]}ms"]
+    for bucket_label, count in zip(labels, counts):
+        if count:
+            bar = '#' * max(1, round(count / len(latencies_ms) * 40))
+            log(f"    {bucket_label:>10} {count:>8} {bar}")
+
+def postgres_benchmark_client(config, workload, duration, preload_rows, copy_rows, latencies, errors, windows):
+    conn = psycopg2.connect(
+        host=config['host'],
+        hostaddr=pg_hostaddr(config['host']),
+        port=config['port'],
+        database=config['database'],
+        user=config['user'],
+        password=config['password'],
+        connect_timeout=10
+    )
+    conn.autocommit = True
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("SELECT pg_is_in_recovery();")
+        read_only = cursor.fetchone()[0]
+        
+        if read_only:
+            # Hot standby: no temp tables, so point selects go against pg_class
+            cursor.execute("SELECT oid FROM pg_class;")
+            select_ids = [row[0] for row in cursor.fetchall()]
+            select_query = "SELECT relname FROM pg_class WHERE oid = %s;"
+            workload = [(op, weight) for op, weight in workload if op == 'select']
+        else:
+            # Temp tables are private to this session, so clients don't contend on locks
+            cursor.execute("CREATE TEMP TABLE bench (id bigserial PRIMARY KEY, payload text);")
+            cursor.copy_expert(
+                "COPY bench (payload) FROM STDIN",
+                io.StringIO("".join(f"row {i}\n" for i in range(preload_rows)))
+            )
+            select_ids = list(range(1, preload_rows + 1))
+            select_query = "SELECT payload FROM bench WHERE id = %s;"
+        
+        if not workload:
+            return
+        
+        operations = [op for op, _ in workload]
+        weights = [weight for _, weight in workload]
+        copy_data = "".join(f"bulk row {i}\n" for i in range(copy_rows))
+        
+        # The measurement window starts after setup, so connect and preload don't count
+        window_start = time.monotonic()
+        deadline = window_start + duration
+        while time.monotonic() < deadline:
+            op = random.choices(operations, weights)[0]
+            start = time.monotonic()
+            try:
+                if op == 'select':
+                    cursor.execute(select_query, (random.choice(select_ids),))
+                    cursor.fetchall()
+                elif op == 'insert':
+                    cursor.execute("INSERT INTO bench (payload) VALUES (%s);", ("inserted row",))
+                elif op == 'copy':
+                    cursor.copy_expert("COPY bench (payload) FROM STDIN", io.StringIO(copy_data))
+                latencies[op].append((time.monotonic() - start) * 1000)
+            except Exception as e:
+                errors.append(f"{op}: {str(e).strip()}")
+                if conn.closed:
+                    break
+        windows.append(time.monotonic() - window_start)
+    finally:
+        cursor.close()
+        conn.close()
+
+def run_postgres_benchmark():
+    target = os.environ.get('BENCHMARK_TARGET', 'primary').lower()
+    config = postgres_secondary_config() if target == 'secondary' else postgres_primary_config()
+    if config is None or not all([config['host'], config['user'], config['password']]):
+        log(f"PostgreSQL benchmark skipped - {target} server not configured", "ERROR")
+        return 1
+    
+    duration = float(os.environ.get('BENCHMARK_DURATION', '30'))
+    clients = int(os.environ.get('BENCHMARK_CLIENTS', '4'))
+    workload = parse_workload(os.environ.get('BENCHMARK_WORKLOAD', 'select:80,insert:15,copy:5'))
+    preload_rows = int(os.environ.get('BENCHMARK_ROWS', '10000'))
+    copy_rows = int(os.environ.get('BENCHMARK_COPY_ROWS', '1000'))
+    
+    unknown = [op for op, _ in workload if op not in ('select', 'insert', 'copy')]
+    if unknown:
+        log(f"Unknown benchmark operations: {', '.join(unknown)} (use select, insert, copy)", "ERROR")
+        return 1
+    
+    server_name = config['server_name']
+    log(f"Benchmarking {server_name} at {config['host']}:{config['port']}/{config['database']}")
+    log(f"Workload: {', '.join(f'{op}:{weight:g}' for op, weight in workload)}, "
+        f"{clients} clients, {duration:.0f}s")
+    log("=" * 60)
+    
+    latencies = {op: [] for op, _ in workload}
+    errors = []
+    windows = []
+    
+    with ThreadPoolExecutor(max_workers=clients, thread_name_prefix='bench') as executor:
+        futures = [
+            executor.submit(postgres_benchmark_client, config, workload, duration,
+                            preload_rows, copy_rows, latencies, errors, windows)
+            for _ in range(clients)
+        ]
+    elapsed = max(windows) if windows else duration
+    
+    failed_clients = [future.exception() for future in futures if future.exception()]
+    for error in failed_clients:
+        log(f"Benchmark client failed: {str(error)}", "ERROR")
+    
+    total_ops = sum(len(values) for values in latencies.values())
+    log("BENCHMARK RESULTS:")
+    log(f"  Total: {total_ops} ops in {elapsed:.1f}s = {total_ops / elapsed:.1f} TPS "
+        f"({len(errors)} errors, {clients - len(failed_clients)}/{clients} clients connected)")
+    for op, values in latencies.items():
+        log_latency_report(op, values, elapsed)
+        if op == 'copy' and values:
+            log(f"    COPY throughput: {len(values) * copy_rows / elapsed:.0f} rows/s")
+    
+    for error in errors[:5]:
+        log(f"  Error: {error}", "WARN")
+    
+    return 1 if failed_clients or errors else 0
+
+def classify_connect_error(error):
+    message = str(error).lower()
+    if 'password authentication failed' in message or 'pg_hba.conf' in message:
+        return 'auth'
+    if ('too many connections' in message or 'remaining connection slots' in message
+            or 'too many clients' in message or 'no more connections allowed' in message):
+        return 'limit'
+    if 'timeout' in message or 'timed out' in message:
+        return 'timeout'
+    return 'other'
+
+def open_stress_connection(config):
+    # Returns (connection, connect ms, first query ms). The first query shows
+    # PgBouncer-style queueing, where connect succeeds but the query waits.
+    start = time.monotonic()
+    conn = psycopg2.connect(
+        host=config['host'],
+        hostaddr=pg_hostaddr(config['host']),
+        port=config['port'],
+        database=config['database'],
+        user=config['user'],
+        password=config['password'],
+        connect_timeout=10
+    )
+    connect_ms = (time.monotonic() - start) * 1000
+    
+    try:
+        start = time.monotonic()
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1;")
+        cursor.fetchone()
+        cursor.close()
+        conn.rollback()
+    except Exception:
+        conn.close()
+        raise
+    return conn, connect_ms, (time.monotonic() - start) * 1000
+
+def stress_connection_burst(config, count):
+    # Open `count` connections at once and hold them until all have been tried
+    connections = []
+    connect_ms = []
+    query_ms = []
+    failures = {}
+    
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix='stress') as executor:
+        futures = [executor.submit(open_stress_connection, config) for _ in range(count)]
+    ramp_seconds = time.monotonic() - start
+    
+    for future in futures:
+        try:
+            conn, connect_time, query_time = future.result()
+            connections.append(conn)
+            connect_ms.append(connect_time)
+            query_ms.append(query_time)
+        except Exception as e:
+            kind = classify_connect_error(e)
+            failures.setdefault(kind, str(e).strip().splitlines()[0])
+            failures[f"{kind}_count"] = failures.get(f"{kind}_count", 0) + 1
+    
+    for conn in connections:
+        conn.close()
+    
+    return {
+        'count': count,
+        'opened': len(connections),
+        'connect_ms': connect_ms,
+        'query_ms': query_ms,
+        'failures': failures,
+        'rate': count / ramp_seconds if ramp_seconds else 0
+    }
+
+def stress_pool(config, pool_size, workers, duration):
+    # Workers share a pool of `pool_size` connections; measures checkout wait
+    # plus query time, which is what the application sees behind a pool
+    import psycopg2.pool
+    pool = psycopg2.pool.ThreadedConnectionPool(1, pool_size,
+        host=config['host'],
+        hostaddr=pg_hostaddr(config['host']),
+        port=config['port'],
+        database=config['database'],
+        user=config['user'],
+        password=config['password'],
+        connect_timeout=10
+    )
+    slots = threading.BoundedSemaphore(pool_size)
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+    
+    def worker():
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            with slots:
+                try:
+                    conn = pool.getconn()
+                    try:
+                        cursor = conn.cursor()
+                        cursor.execute("SELECT 1;")
+                        cursor.fetchone()
+                        cursor.close()
+                        conn.rollback()
+                    finally:
+                        pool.putconn(conn)
+                except Exception as e:
+                    errors.append(str(e).strip())
+                    continue
+            latencies.append((time.monotonic() - start) * 1000)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pool') as executor:
+            for _ in range(workers):
+                executor.submit(worker)
+    finally:
+        pool.closeall()
+    return latencies, errors
+
+def run_connection_stress():
+    config = postgres_primary_config()
+    if not all([config['host'], config['user'], config['password']]):
+        log("Connection stress test skipped - Primary PostgreSQL not configured", "ERROR")
+        return 1
+    
+    levels = [int(level) for level in os.environ.get('STRESS_LEVELS', '1,5,10,25,50,100').split(',') if level.strip()]
+    max_level = int(os.environ.get('STRESS_MAX_CONNECTIONS', '100'))
+    pods = max(1, int(os.environ.get('STRESS_PODS', '1')))
+    pool_duration = float(os.environ.get('STRESS_POOL_DURATION', '10'))
+    
+    log(f"Connection stress test against {config['host']}:{config['port']}/{config['database']}")
+    
+    try:
+        conn, _, _ = open_stress_connection(config)
+        cursor = conn.cursor()
+        inventory = fetch_server_inventory(cursor)
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        log(f"Could not connect to {config['server_name']}: {str(e)}", "ERROR")
+        return 1
+    
+    free_slots = inventory['max_connections'] - inventory['reserved_connections'] - inventory['connections_in_use']
+    log(f"Server limits: max_connections={inventory['max_connections']}, "
+        f"reserved={inventory['reserved_connections']}, in use={inventory['connections_in_use']}, free={free_slots}")
+    log("=" * 60)
+    
+    results = []
+    for level in sorted(set(levels)):
+        if level > max_level:
+            log(f"Stopping at STRESS_MAX_CONNECTIONS={max_level}")
+            break
+        
+        result = stress_connection_burst(config, level)
+        results.append(result)
+        
+        failures = result['failures']
+        failure_text = ", ".join(f"{kind}: {failures[kind + '_count']}" for kind in ('auth', 'limit', 'timeout', 'other')
+                                 if failures.get(kind + '_count'))
+        log(f"{level:>4} connections: {result['opened']}/{level} opened at {result['rate']:.0f}/s"
+            + (f", connect {format_percentiles(result['connect_ms'])}" if result['connect_ms'] else "")
+            + (f", first query {format_percentiles(result['query_ms'])}" if result['query_ms'] else "")
+            + (f" - failures ({failure_text})" if failure_text else ""))
+        for kind in ('auth', 'limit', 'timeout', 'other'):
+            if kind in failures:
+                log(f"       {kind} failure: {failures[kind]}", "WARN")
+        
+        if failures.get('auth_count'):
+            log("Authentication failures - stopping", "ERROR")
+            break
+        if failures.get('limit_count'):
+            log(f"Connection limit reached at {level} concurrent connections")
+            break
+    
+    log("=" * 60)
+    log("POOL SIZING:")
+    
+    # Healthy levels opened every connection without the latency knee that
+    # signals backend saturation or PgBouncer queueing
+    baseline = results[0] if results and results[0]['connect_ms'] else None
+    healthy = 0
+    knee = None
+    for result in results:
+        if result['opened'] < result['count'] or not baseline:
+            break
+        total_ms = [c + q for c, q in zip(result['connect_ms'], result['query_ms'])]
+        baseline_ms = [c + q for c, q in zip(baseline['connect_ms'], baseline['query_ms'])]
+        if percentile(total_ms, 95) > max(50, 3 * percentile(baseline_ms, 95)):
+            knee = result['count']
+            break
+        healthy = result['count']
+    
+    if knee:
+        log(f"  Latency knee at {knee} concurrent connections (connect + first query p95 > 3x baseline) - "
+            f"likely server CPU saturation or PgBouncer queueing")
+    
+    budget = int(free_slots * 0.8)
+    if not healthy:
+        # Never recommend a size the test did not see working
+        first = results[0]['count'] if results else None
+        log("  No healthy concurrency level found" +
+            (f" (the first level, {first} connections, already failed)" if first else "") +
+            f" - no pool size recommended; 80% of free slots: {budget}. "
+            f"Rerun with lower STRESS_LEVELS after fixing the failures above.", "ERROR")
+        return 1
+    per_pod = min(budget, healthy) // pods
+    log(f"  Healthy concurrency observed: {healthy} connections; 80% of free slots: {budget}")
+    if per_pod <= 0:
+        # Even one connection per pod would eat into the reserved slots
+        log(f"  No connection headroom left for {pods} pod(s) - no pool size recommended and pool check skipped. "
+            "Free connections on the server or lower STRESS_PODS.", "ERROR")
+        return 1
+    log(f"  Recommended pool size: {per_pod} connections per pod ({pods} pod(s))")
+    
+    if pool_duration > 0:
+        latencies, errors = stress_pool(config, per_pod, per_pod * 2, pool_duration)
+        log(f"  Pool check ({per_pod} connections, {per_pod * 2} workers, {pool_duration:.0f}s): "
+            f"{len(latencies) / pool_duration:.0f} queries/s" +
+            (f", checkout + query {format_percentiles(latencies)}" if latencies else "") +
+            (f", {len(errors)} errors" if errors else ""))
+        raw = [c + q for result in results for c, q in zip(result['connect_ms'], result['query_ms'])]
+        if raw:
+            log(f"  Without a pool each query pays connect + first query: {format_percentiles(raw)}")
+    
+    return 0
+
+def llm_benchmark_targets(prompt, max_tokens):
+    # Streaming request definitions for every configured LLM backend:
+    # name -> (url, headers, payload, stream format)
+    targets = {}
+    
+    endpoint = os.environ.get('AZURE_OPENAI_ENDPOINT')
+    api_key = os.environ.get('AZURE_OPENAI_API_KEY')
+    deployment = os.environ.get('AZURE_OPENAI_DEPLOYMENT')
+    api_version = os.environ.get('AZURE_OPENAI_API_VERSION', '2024-02-01')
+    if all([endpoint, api_key, deployment]):
+        targets['Azure OpenAI'] = (
+            f"{endpoint}/openai/deployments/{deployment}/chat/completions?api-version={api_version}",
+            {"api-key": api_key, "Content-Type": "application/json"},
+            {"messages": [{"role": "user", "content": prompt}], "max_tokens": max_tokens, "stream": True},
+            'sse'
+        )
+    
+    endpoint = os.environ.get('OLLAMA_ENDPOINT')
+    if endpoint:
+        targets['Ollama'] = (
+            f"{endpoint}/api/generate",
+            {"Content-Type": "application/json"},
+            {"model": os.environ.get('OLLAMA_MODEL', 'llama2'), "prompt": prompt, "stream": True,
+             "options": {"num_predict": max_tokens}},
+            'ndjson'
+        )
     
-    # Get custom hostnames from environment variables
-    custom_hosts = {}
-    for i in range(1, 11):  # Support up to 10 custom hosts
-        host_key = f'CUSTOM_HOST_{i}'
-        name_key = f'CUSTOM_HOST_{i}_NAME'
+    endpoint = os.environ.get('OPENAI_COMPATIBLE_ENDPOINT')
+    if endpoint:
+        headers = {"Content-Type": "application/json"}
+        api_key = os.environ.get('OPENAI_COMPATIBLE_API_KEY')
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        targets['OpenAI-compatible'] = (
+            f"{endpoint}/v1/chat/completions",
+            headers,
+            {"model": os.environ.get('OPENAI_COMPATIBLE_MODEL', 'gpt-3.5-turbo'),
+             "messages": [{"role": "user", "content": prompt}], "max_tokens": max_tokens, "stream": True},
+            'sse'
+        )
+    
+    return targets
+
+def parse_stream_line(line, stream_format):
+    # Returns (text, exact token count or None, done) for one streamed line
+    if stream_format == 'ndjson':
+        chunk = json.loads(line)
+        return chunk.get('response', ''), chunk.get('eval_count') if chunk.get('done') else None, chunk.get('done', False)
+    
+    if not line.startswith('data:'):
+        return '', None, False
+    data = line[5:].strip()
+    if data == '[DONE]':
+        return '', None, True
+    chunk = json.loads(data)
+    text = ''
+    for choice in chunk.get('choices') or []:
+        text += (choice.get('delta') or {}).get('content') or choice.get('text') or ''
+    usage = chunk.get('usage') or {}
+    return text, usage.get('completion_tokens'), False
+
+def stream_llm_request(session, url, headers, payload, stream_format):
+    result = {'status': None, 'ttft_ms': None, 'gaps_ms': [], 'tokens': 0, 'total_ms': None, 'error': None}
+    start = time.monotonic()
+    try:
+        with session.post(url, headers=headers, json=payload, timeout=60, stream=True) as response:
+            result['status'] = response.status_code
+            if response.status_code != 200:
+                result['error'] = f"HTTP {response.status_code}"
+                return result
+            
+            last_token = None
+            exact_tokens = None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                text, token_count, done = parse_stream_line(line, stream_format)
+                if token_count is not None:
+                    exact_tokens = token_count
+                if text:
+                    now = time.monotonic()
+                    if last_token is None:
+                        result['ttft_ms'] = (now - start) * 1000
+                    else:
+                        result['gaps_ms'].append((now - last_token) * 1000)
+                    last_token = now
+                    result['tokens'] += 1
+                if done:
+                    break
+            
+            # Prefer the server's token count; streamed chunks are roughly one token each
+            if exact_tokens:
+                result['tokens'] = exact_tokens
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['total_ms'] = (time.monotonic() - start) * 1000
+    return result
+
+def run_llm_benchmark():
+    requests_per_backend = int(os.environ.get('LLM_BENCHMARK_REQUESTS', '20'))
+    concurrency = int(os.environ.get('LLM_BENCHMARK_CONCURRENCY', '4'))
+    max_tokens = int(os.environ.get('LLM_BENCHMARK_MAX_TOKENS', '64'))
+    prompt = os.environ.get('LLM_BENCHMARK_PROMPT', 'Write a short paragraph about network latency.')
+    
+    targets = llm_benchmark_targets(prompt, max_tokens)
+    selected = [name.strip() for name in os.environ.get('LLM_BENCHMARK_BACKENDS', '').split(',') if name.strip()]
+    if selected:
+        targets = {name: target for name, target in targets.items() if name in selected}
+    if not targets:
+        log("LLM benchmark skipped - no Azure OpenAI, Ollama or OpenAI-compatible endpoint configured", "ERROR")
+        return 1
+    
+    # Retries would hide throttling, which is part of what we measure. The pool
+    # must fit every worker, or queueing for a connection shows up as TTFT.
+    session = build_http_session(retries=0, pool_maxsize=concurrency)
+    
+    exit_code = 0
+    for name, (url, headers, payload, stream_format) in targets.items():
+        log("=" * 60)
+        log(f"Benchmarking {name}: {requests_per_backend} streaming requests, "
+            f"concurrency {concurrency}, max_tokens {max_tokens}")
         
-        host_url = os.environ.get(host_key, '').strip()
-        host_name = os.environ.get(name_key, f'Custom Host {i}').strip()
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='llm') as executor:
+            futures = [executor.submit(stream_llm_request, session, url, headers, payload, stream_format)
+                       for _ in range(requests_per_backend)]
+        elapsed = time.monotonic() - start
+        results = [future.result() for future in futures]
         
-        if host_url:
-            custom_hosts[host_name] = host_url
+        succeeded = [result for result in results if result['error'] is None]
+        throttled = [result for result in results if result['status'] == 429]
+        failed = [result for result in results if result['error'] is not None and result['status'] != 429]
+        
+        log(f"  Requests: {len(succeeded)} ok, {len(throttled)} throttled (429), {len(failed)} failed "
+            f"- throttle rate {len(throttled) / len(results) * 100:.1f}%")
+        
+        ttft = [result['ttft_ms'] for result in succeeded if result['ttft_ms'] is not None]
+        gaps = [gap for result in succeeded for gap in result['gaps_ms']]
+        per_request_rate = [result['tokens'] / (result['total_ms'] / 1000) for result in succeeded
+                            if result['tokens'] and result['total_ms']]
+        total_tokens = sum(result['tokens'] for result in succeeded)
+        
+        if ttft:
+            log(f"  Time to first token: {format_percentiles(ttft)}")
+        if gaps:
+            log(f"  Inter-token latency: {format_percentiles(gaps)}")
+        if per_request_rate:
+            log(f"  Tokens/sec per request: p50 {percentile(per_request_rate, 50):.1f}")
+        log(f"  Aggregate: {total_tokens} tokens in {elapsed:.1f}s = {total_tokens / elapsed:.1f} tokens/sec, "
+            f"{len(succeeded) / elapsed:.2f} requests/sec")
+        
+        for result in failed[:3]:
+            log(f"  Error: {result['error']}", "WARN")
+        if failed or not succeeded:
+            exit_code = 1
     
-    if not custom_hosts:
-        log("No custom hostnames configured - skipping (configure CUSTOM_HOST_1, CUSTOM_HOST_2, etc.)", "WARN")
-        return None
+    return exit_code
+
+def drop_page_cache(path):
+    # Best effort: evict the file from the page cache so reads hit the volume
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except (AttributeError, OSError):
+        pass
+
+def run_in_threads(threads, func, *args):
+    # Runs func(index, *args) on every thread; returns results in thread order
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='storage') as executor:
+        futures = [executor.submit(func, index, *args) for index in range(threads)]
+    return [future.result() for future in futures]
+
+def storage_sequential_write(index, paths, file_size, block):
+    fd = os.open(paths[index], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        written = 0
+        while written < file_size:
+            written += os.write(fd, block[:file_size - written])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return written
+
+def storage_sequential_read(index, paths, block_size):
+    buffer = bytearray(block_size)
+    total = 0
+    with open(paths[index], 'rb', buffering=0) as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            total += count
+    return total
+
+def open_direct_reader(path):
+    # O_DIRECT bypasses the page cache; it needs an aligned buffer (mmap memory is
+    # page-aligned) and some filesystems refuse it at open or on the first read.
+    # Returns (fd, buffer, True if O_DIRECT is in use).
+    buffer = mmap.mmap(-1, 4096)
+    if hasattr(os, 'O_DIRECT'):
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+        except OSError:
+            pass
+        else:
+            try:
+                os.preadv(fd, [buffer], 0)
+                return fd, buffer, True
+            except OSError:
+                os.close(fd)
+    return os.open(path, os.O_RDONLY), buffer, False
+
+def storage_random_io(index, paths, file_size, duration, write):
+    # 4K aligned random reads with O_DIRECT, or O_DSYNC writes so each one reaches
+    # the volume. Returns (latencies in ms, I/O mode).
+    if write:
+        fd, buffer, mode = os.open(paths[index], os.O_RDWR | os.O_DSYNC), None, 'O_DSYNC'
+    else:
+        fd, buffer, direct = open_direct_reader(paths[index])
+        mode = 'O_DIRECT' if direct else 'buffered'
+    block = os.urandom(4096)
+    blocks = max(1, file_size // 4096)
+    latencies = []
+    try:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            offset = random.randrange(blocks) * 4096
+            if mode == 'buffered' and len(latencies) % 64 == 0:
+                # Without O_DIRECT, keep evicting the file so most reads still miss the cache
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            start = time.monotonic()
+            if write:
+                os.pwrite(fd, block, offset)
+            else:
+                os.preadv(fd, [buffer], offset)
+            latencies.append((time.monotonic() - start) * 1000)
+    finally:
+        os.close(fd)
+        if buffer is not None:
+            buffer.close()
+    return latencies, mode
+
+def storage_small_files(index, directory, count):
+    paths = [os.path.join(directory, f"small-{index}-{i}.txt") for i in range(count)]
+    payload = b"x" * 1024
+    timings = {}
     
-    results = {}
+    start = time.monotonic()
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(payload)
+    timings['create'] = time.monotonic() - start
+    
+    start = time.monotonic()
+    for path in paths:
+        os.stat(path)
+    timings['stat'] = time.monotonic() - start
+    
+    start = time.monotonic()
+    for path in paths:
+        os.remove(path)
+    timings['delete'] = time.monotonic() - start
+    return timings
+
+def run_storage_benchmark():
+    mount_path = os.environ.get('PVC_MOUNT_PATH', '/mnt/test-storage')
+    file_size_mb = int(os.environ.get('PVC_BENCHMARK_FILE_SIZE_MB', '256'))
+    block_size = int(os.environ.get('PVC_BENCHMARK_BLOCK_SIZE_KB', '1024')) * 1024
+    threads = max(1, int(os.environ.get('PVC_BENCHMARK_THREADS', '4')))
+    duration = float(os.environ.get('PVC_BENCHMARK_DURATION', '10'))
+    fsync_count = int(os.environ.get('PVC_BENCHMARK_FSYNC_COUNT', '100'))
+    small_files = int(os.environ.get('PVC_BENCHMARK_SMALL_FILES', '1000'))
+    
+    if not os.path.isdir(mount_path):
+        log(f"PVC benchmark skipped - mount path does not exist: {mount_path}", "ERROR")
+        return 1
+    
+    total_size = file_size_mb * 1024 * 1024
+    file_size = total_size // threads
+    free = shutil.disk_usage(mount_path).free
+    if free < total_size * 1.1:
+        log(f"Not enough free space on {mount_path}: need {file_size_mb}MB, have {free // 1024 // 1024}MB", "ERROR")
+        return 1
+    
+    directory = os.path.join(mount_path, 'connectivity-benchmark')
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f"bench-{index}.dat") for index in range(threads)]
     
-    for service_name, url in custom_hosts.items():
+    log(f"Benchmarking storage at {mount_path}: {file_size_mb}MB across {threads} threads, "
+        f"{block_size // 1024}KB sequential blocks, {duration:.0f}s random I/O")
+    log("=" * 60)
+    
+    try:
+        # Sequential write (including the final fsync)
+        block = os.urandom(block_size)
+        start = time.monotonic()
+        written = sum(run_in_threads(threads, storage_sequential_write, paths, file_size, block))
+        elapsed = time.monotonic() - start
+        log(f"  Sequential write: {written / 1024 / 1024 / elapsed:.1f} MB/s ({written // 1024 // 1024}MB in {elapsed:.1f}s)")
+        
+        # Sequential read, after evicting what we just wrote from the page cache
+        for path in paths:
+            drop_page_cache(path)
+        start = time.monotonic()
+        read = sum(run_in_threads(threads, storage_sequential_read, paths, block_size))
+        elapsed = time.monotonic() - start
+        log(f"  Sequential read: {read / 1024 / 1024 / elapsed:.1f} MB/s ({read // 1024 // 1024}MB in {elapsed:.1f}s)")
+        
+        # Random 4K I/O
+        for label, write in (('Random 4K read', False), ('Random 4K write', True)):
+            for path in paths:
+                drop_page_cache(path)
+            results = run_in_threads(threads, storage_random_io, paths, file_size, duration, write)
+            latencies = [value for values, _ in results for value in values]
+            modes = sorted({mode for _, mode in results})
+            log(f"  {label} ({', '.join(modes)}): {len(latencies) / duration:.0f} IOPS, latency {format_percentiles(latencies)}")
+            if 'buffered' in modes:
+                log("    O_DIRECT is not supported on this volume; some reads may be served from the page cache", "WARN")
+        
+        # fsync latency for small appends, as a database WAL would do
+        fsync_path = os.path.join(directory, 'fsync.dat')
+        fd = os.open(fsync_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        latencies = []
         try:
-            log(f"Testing {service_name} connectivity to {url}...")
-            
-            # Add protocol if missing
-            if not url.startswith(('http://', 'https://')):
-                # Try HTTPS first, then HTTP if it fails
-                test_urls = [f'https://{url}', f'http://{url}']
-            else:
-                test_urls = [url]
+            for _ in range(fsync_count):
+                os.write(fd, b"x" * 4096)
+                start = time.monotonic()
+                os.fsync(fd)
+                latencies.append((time.monotonic() - start) * 1000)
+        finally:
+            os.close(fd)
+            os.remove(fsync_path)
+        if latencies:
+            log(f"  fsync latency ({fsync_count} x 4KB appends): {format_percentiles(latencies)}, max {max(latencies):.1f}ms")
+        
+        # Small-file metadata operations
+        per_thread = max(1, small_files // threads)
+        timings = run_in_threads(threads, storage_small_files, directory, per_thread)
+        for operation in ('create', 'stat', 'delete'):
+            slowest = max(timing[operation] for timing in timings)
+            log(f"  Small files {operation}: {per_thread * threads / slowest:.0f} files/s")
+        
+        return 0
+        
+    except Exception as e:
+        log(f"Storage benchmark failed: {str(e)}", "ERROR")
+        return 1
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+class CountingSink:
+    # File-like target for COPY TO STDOUT that only counts what arrives
+    def __init__(self):
+        self.bytes = 0
+    
+    def write(self, data):
+        self.bytes += len(data)
+
+class GeneratedSource:
+    # File-like source for COPY FROM STDIN producing `total` bytes of fixed-width rows
+    def __init__(self, total, row_bytes):
+        self.remaining = total
+        self.row = 'x' * (row_bytes - 1) + '\n'
+    
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return ''
+        rows = max(1, min(size if size > 0 else self.remaining, self.remaining) // len(self.row))
+        self.remaining -= rows * len(self.row)
+        return self.row * rows
+
+def postgres_throughput_stream(index, config, test, total, row_bytes, buffer_size, barrier):
+    # One stream on its own connection; timing starts when all streams are connected.
+    # Returns (bytes transferred, start, end).
+    conn = None
+    try:
+        conn = psycopg2.connect(
+            host=config['host'],
+            hostaddr=pg_hostaddr(config['host']),
+            port=config['port'],
+            database=config['database'],
+            user=config['user'],
+            password=config['password'],
+            connect_timeout=10
+        )
+        rows = max(1, total // row_bytes)
+        query = f"SELECT repeat('x', {row_bytes - 1}) FROM generate_series(1, {rows})"
+        if test == 'copy_from':
+            setup = conn.cursor()
+            setup.execute("CREATE TEMP TABLE throughput (payload text);")
+            conn.commit()
+    except Exception:
+        # Release the sibling streams instead of leaving them at the barrier
+        barrier.abort()
+        if conn:
+            conn.close()
+        raise
+    try:
+        barrier.wait()
+        start = time.monotonic()
+        
+        if test == 'cursor':
+            # Server-side cursor: rows arrive in batches of about buffer_size bytes
+            cursor = conn.cursor(name=f"throughput_{index}")
+            cursor.itersize = max(1, buffer_size // row_bytes)
+            cursor.execute(query)
+            transferred = sum(len(row[0]) + 1 for row in cursor)
+            cursor.close()
+        elif test == 'copy_to':
+            sink = CountingSink()
+            conn.cursor().copy_expert(f"COPY ({query}) TO STDOUT", sink, size=buffer_size)
+            transferred = sink.bytes
+        else:
+            conn.cursor().copy_expert("COPY throughput FROM STDIN", GeneratedSource(rows * row_bytes, row_bytes),
+                                      size=buffer_size)
+            transferred = rows * row_bytes
+        conn.commit()
+        return transferred, start, time.monotonic()
+    finally:
+        conn.close()
+
+def http_throughput_stream(index, urls, test, total, buffer_size, barrier):
+    try:
+        session = build_http_session(retries=0)
+    except Exception:
+        barrier.abort()
+        raise
+    url = urls[index % len(urls)]
+    transferred = 0
+    try:
+        barrier.wait()
+        start = time.monotonic()
+        if test == 'http_download':
+            with session.get(url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=buffer_size):
+                    transferred += len(chunk)
+                    if transferred >= total:
+                        break
+        else:
+            block = b'x' * buffer_size
             
-            success = False
-            final_status = None
+            def body():
+                sent = 0
+                while sent < total:
+                    yield block
+                    sent += len(block)
             
-            for test_url in test_urls:
+            response = session.post(url, data=body(), timeout=30)
+            response.raise_for_status()
+            transferred = (total + buffer_size - 1) // buffer_size * buffer_size
+    finally:
+        session.close()
+    return transferred, start, time.monotonic()
+
+def measure_throughput(streams, func, *args):
+    # Aggregate MB/s of `streams` parallel transfers started together
+    # Streams that are not all connected within THROUGHPUT_START_TIMEOUT fail with BrokenBarrierError
+    barrier = threading.Barrier(streams, timeout=float(os.environ.get('THROUGHPUT_START_TIMEOUT', '60')))
+    with ThreadPoolExecutor(max_workers=streams, thread_name_prefix='throughput') as executor:
+        futures = [executor.submit(func, index, *args, barrier) for index in range(streams)]
+    # Report the stream that failed rather than the siblings it released from the barrier
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        raise next((e for e in errors if not isinstance(e, threading.BrokenBarrierError)), errors[0])
+    results = [future.result() for future in futures]
+    transferred = sum(result[0] for result in results)
+    elapsed = max(result[2] for result in results) - min(result[1] for result in results)
+    return transferred / 1024 / 1024 / max(elapsed, 1e-6), transferred, elapsed
+
+def run_throughput_benchmark():
+    buffer_sizes = [int(size) * 1024 for size in os.environ.get('THROUGHPUT_BUFFER_SIZES_KB', '8,64,1024').split(',') if size.strip()]
+    stream_counts = [int(count) for count in os.environ.get('THROUGHPUT_STREAMS', '1,4').split(',') if count.strip()]
+    pg_total = int(float(os.environ.get('THROUGHPUT_PG_MB', '64')) * 1024 * 1024)
+    row_bytes = max(2, int(os.environ.get('THROUGHPUT_PG_ROW_BYTES', '1024')))
+    http_total = int(float(os.environ.get('THROUGHPUT_HTTP_MB', '64')) * 1024 * 1024)
+    upload_url = os.environ.get('THROUGHPUT_HTTP_UPLOAD_URL')
+    download_urls = [url.strip() for url in os.environ.get('THROUGHPUT_HTTP_URLS', '').split(',') if url.strip()]
+    if not download_urls:
+        download_urls = [url for url in load_custom_hosts().values() if url.startswith(('http://', 'https://'))]
+    
+    target = os.environ.get('THROUGHPUT_TARGET', 'primary').lower()
+    config = postgres_secondary_config() if target == 'secondary' else postgres_primary_config()
+    
+    tests = []
+    if config and all([config['host'], config['user'], config['password']]):
+        read_only = False
+        try:
+            with timed_probe('postgres_connect', config['server_name']):
+                conn = psycopg2.connect(
+                    host=config['host'],
+                    hostaddr=pg_hostaddr(config['host']),
+                    port=config['port'],
+                    database=config['database'],
+                    user=config['user'],
+                    password=config['password'],
+                    connect_timeout=10
+                )
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_is_in_recovery();")
+            read_only = cursor.fetchone()[0]
+            conn.close()
+            tests += [('cursor', 'Server-side cursor (download)'), ('copy_to', 'COPY TO STDOUT (download)')]
+            if not read_only:
+                tests.append(('copy_from', 'COPY FROM STDIN (upload)'))
+        except Exception as e:
+            log(f"PostgreSQL throughput skipped - cannot connect to {config['server_name']}: {str(e)}", "ERROR")
+    else:
+        log(f"PostgreSQL throughput skipped - {target} server not configured", "WARN")
+    if download_urls:
+        tests.append(('http_download', f"HTTP download ({len(download_urls)} URL(s))"))
+    if upload_url:
+        tests.append(('http_upload', 'HTTP upload'))
+    
+    if not tests:
+        log("Throughput benchmark has nothing to measure (configure PG* or THROUGHPUT_HTTP_* settings)", "ERROR")
+        return 1
+    
+    log(f"Throughput benchmark: buffers {', '.join(f'{size // 1024}KB' for size in buffer_sizes)}, "
+        f"streams {', '.join(map(str, stream_counts))}")
+    log("=" * 60)
+    
+    failures = 0
+    for test, label in tests:
+        log(f"{label}:")
+        best = None
+        # psycopg2 ignores the buffer size for COPY TO, so sweep streams only
+        sizes = buffer_sizes[:1] if test == 'copy_to' else buffer_sizes
+        for buffer_size in sizes:
+            for streams in stream_counts:
+                setting = f"{streams} stream(s)" if test == 'copy_to' else f"{buffer_size // 1024}KB buffer x {streams} stream(s)"
                 try:
-                    response = requests.get(test_url, timeout=10, allow_redirects=True)
-                    final_status = response.status_code
-                    
-                    # Consider 2xx and 3xx status codes as successful
-                    if response.status_code < 400:
-                        log(f"{service_name}: REACHABLE (Status: {response.status_code}, URL: {test_url})")
-                        results[service_name] = True
-                        success = True
-                        break
+                    if test.startswith('http'):
+                        mb_per_second, transferred, elapsed = measure_throughput(
+                            streams, http_throughput_stream, download_urls if test == 'http_download' else [upload_url],
+                            test, http_total // streams, buffer_size)
                     else:
-                        log(f"{service_name}: HTTP {response.status_code} for {test_url}")
-                        
-                except requests.exceptions.SSLError:
-                    log(f"{service_name}: SSL Error for {test_url}, trying HTTP if available")
-                    continue
-                except requests.exceptions.ConnectionError:
-                    log(f"{service_name}: Connection Error for {test_url}")
-                    continue
+                        mb_per_second, transferred, elapsed = measure_throughput(
+                            streams, postgres_throughput_stream, config, test, pg_total // streams, row_bytes, buffer_size)
                 except Exception as e:
-                    log(f"{service_name}: Error for {test_url} - {str(e)}")
+                    log(f"  {setting}: failed - {str(e)}", "ERROR")
+                    failures += 1
                     continue
-            
-            if not success:
-                if final_status:
-                    log(f"{service_name}: UNREACHABLE (Final Status: {final_status})", "WARN")
-                else:
-                    log(f"{service_name}: UNREACHABLE (Connection failed)", "WARN")
-                results[service_name] = False
-                
+                log(f"  {setting}: {mb_per_second:.1f} MB/s ({transferred / 1024 / 1024:.0f}MB in {elapsed:.2f}s)")
+                if best is None or mb_per_second > best[0]:
+                    best = (mb_per_second, setting)
+        if best:
+            log(f"  Best: {best[0]:.1f} MB/s with {best[1]}")
+    
+    return 1 if failures else 0
+
+def sample_pdf(pages):
+    # Minimal text PDF used when no sample documents are configured
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + i * 2} 0 R" for i in range(pages)), pages),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i in range(pages):
+        text = f"BT /F1 24 Tf 72 720 Td (Connectivity test page {i + 1}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + i * 2} 0 R >>")
+        objects.append(f"<< /Length {len(text)} >>\nstream\n{text}\nendstream")
+    
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return pdf.encode('latin-1')
+
+def load_docintel_documents():
+    # DOCINTEL_BENCHMARK_DOCUMENTS: comma-separated files, directories or URLs
+    documents = []
+    content_types = {'.pdf': 'application/pdf', '.png': 'image/png', '.jpg': 'image/jpeg',
+                     '.jpeg': 'image/jpeg', '.tif': 'image/tiff', '.tiff': 'image/tiff', '.bmp': 'image/bmp'}
+    
+    for source in os.environ.get('DOCINTEL_BENCHMARK_DOCUMENTS', '').split(','):
+        source = source.strip()
+        if not source:
+            continue
+        if source.startswith(('http://', 'https://')):
+            documents.append((source, None, None))
+            continue
+        paths = sorted(glob.glob(os.path.join(source, '*'))) if os.path.isdir(source) else [source]
+        for path in paths:
+            content_type = content_types.get(os.path.splitext(path)[1].lower())
+            if content_type:
+                with open(path, 'rb') as f:
+                    documents.append((os.path.basename(path), f.read(), content_type))
+    
+    if not documents:
+        documents.append(("built-in sample (3 pages)", sample_pdf(3), 'application/pdf'))
+    return documents
+
+def retry_after_seconds(response, default):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+def analyze_document(session, endpoint, headers, model, api_version, document, max_retries, timeout):
+    # Gives up with an error once the document has taken `timeout` seconds in total
+    name, content, content_type = document
+    result = {'document': name, 'error': None, 'throttled': 0, 'pages': 0,
+              'submit_ms': None, 'queue_ms': None, 'processing_ms': None, 'total_ms': None, 'polls': 0}
+    url = f"{endpoint}/formrecognizer/documentModels/{model}:analyze?api-version={api_version}"
+    
+    start = time.monotonic()
+    deadline = start + timeout
+    for attempt in range(max_retries + 1):
+        submit_start = time.monotonic()
+        if content is None:
+            response = session.post(url, headers=headers, json={"urlSource": name}, timeout=60)
+        else:
+            response = session.post(url, headers=dict(headers, **{"Content-Type": content_type}),
+                                    data=content, timeout=60)
+        result['submit_ms'] = (time.monotonic() - submit_start) * 1000
+        
+        if response.status_code != 429:
+            break
+        result['throttled'] += 1
+        wait_seconds = retry_after_seconds(response, 2 ** attempt)
+        if attempt == max_retries or time.monotonic() + wait_seconds >= deadline:
+            break
+        time.sleep(wait_seconds)
+    
+    if response.status_code != 202:
+        result['error'] = f"submit HTTP {response.status_code}: {response.text[:200]}"
+        return result
+    
+    # Poll the operation with adaptive backoff: honour Retry-After, otherwise
+    # start fast and back off while the operation is still queued or running
+    operation_url = response.headers.get('Operation-Location')
+    if not operation_url:
+        result['error'] = "202 without Operation-Location"
+        return result
+    submitted = time.monotonic()
+    delay = 0.25
+    running_seen = None
+    last_status = f"HTTP {response.status_code}"
+    while True:
+        pause = retry_after_seconds(response, delay) if result['polls'] == 0 else delay
+        remaining = deadline - time.monotonic()
+        if pause >= remaining:
+            result['error'] = f"timed out after {timeout:.0f}s ({result['polls']} polls, last status: {last_status})"
+            return result
+        time.sleep(pause)
+        response = session.get(operation_url, headers=headers, timeout=max(1.0, min(30.0, remaining - pause)))
+        result['polls'] += 1
+        
+        last_status = f"HTTP {response.status_code}"
+        if response.status_code == 429:
+            result['throttled'] += 1
+            delay = retry_after_seconds(response, delay * 2)
+            continue
+        if response.status_code != 200:
+            result['error'] = f"poll HTTP {response.status_code}: {response.text[:200]}"
+            return result
+        
+        body = response.json()
+        status = body.get('status')
+        last_status = status
+        if status == 'running' and running_seen is None:
+            running_seen = time.monotonic()
+        if status == 'succeeded':
+            break
+        if status == 'failed':
+            result['error'] = f"analysis failed: {json.dumps(body.get('error'))[:200]}"
+            return result
+        delay = min(delay * 1.5, 5.0)
+    
+    finished = time.monotonic()
+    result['pages'] = len((body.get('analyzeResult') or {}).get('pages') or [])
+    result['queue_ms'] = ((running_seen or finished) - submitted) * 1000
+    result['processing_ms'] = (finished - (running_seen or submitted)) * 1000
+    result['total_ms'] = (finished - start) * 1000
+    return result
+
+def run_docintel_benchmark():
+    endpoint = os.environ.get('AZURE_DOCINTEL_ENDPOINT')
+    api_key = os.environ.get('AZURE_DOCINTEL_API_KEY')
+    api_version = os.environ.get('AZURE_DOCINTEL_API_VERSION', '2023-07-31')
+    if not all([endpoint, api_key]):
+        log("Document Intelligence benchmark skipped - missing AZURE_DOCINTEL_ENDPOINT or AZURE_DOCINTEL_API_KEY", "ERROR")
+        return 1
+    
+    model = os.environ.get('DOCINTEL_BENCHMARK_MODEL', 'prebuilt-read')
+    repeat = int(os.environ.get('DOCINTEL_BENCHMARK_REPEAT', '5'))
+    concurrency = int(os.environ.get('DOCINTEL_BENCHMARK_CONCURRENCY', '4'))
+    max_retries = int(os.environ.get('DOCINTEL_BENCHMARK_RETRIES', '3'))
+    timeout = float(os.environ.get('DOCINTEL_BENCHMARK_TIMEOUT', '300'))
+    
+    documents = load_docintel_documents() * repeat
+    headers = {"Ocp-Apim-Subscription-Key": api_key}
+    session = build_http_session(retries=0, pool_maxsize=concurrency)
+    
+    log(f"Benchmarking Document Intelligence {endpoint} with model {model}: "
+        f"{len(documents)} documents, concurrency {concurrency}")
+    log("=" * 60)
+    
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='docintel') as executor:
+        futures = [executor.submit(analyze_document, session, endpoint, headers, model, api_version,
+                                   document, max_retries, timeout)
+                   for document in documents]
+    elapsed = time.monotonic() - start
+    
+    results = []
+    for document, future in zip(documents, futures):
+        try:
+            results.append(future.result())
         except Exception as e:
-            log(f"{service_name}: ERROR - {str(e)}", "WARN")
-            results[service_name] = False
+            results.append({'document': document[0], 'error': str(e), 'throttled': 0, 'pages': 0})
     
-    # Summary of custom hostname tests
-    reachable = sum(1 for v in results.values() if v)
-    total = len(results)
-    log(f"Custom hostnames summary: {reachable}/{total} hosts reachable")
+    succeeded = [result for result in results if result['error'] is None]
+    failed = [result for result in results if result['error'] is not None]
+    pages = sum(result['pages'] for result in succeeded)
     
-    return results
+    log("BENCHMARK RESULTS:")
+    log(f"  Documents: {len(succeeded)} succeeded, {len(failed)} failed, "
+        f"{sum(result['throttled'] for result in results)} throttled responses (429)")
+    if succeeded:
+        log(f"  Submit latency: {format_percentiles([r['submit_ms'] for r in succeeded])}")
+        log(f"  Queue time: {format_percentiles([r['queue_ms'] for r in succeeded])}")
+        log(f"  Processing time: {format_percentiles([r['processing_ms'] for r in succeeded])}")
+        log(f"  Total per document: {format_percentiles([r['total_ms'] for r in succeeded])}")
+        per_page = [r['total_ms'] / r['pages'] for r in succeeded if r['pages']]
+        if per_page:
+            log(f"  Total per page: {format_percentiles(per_page)}")
+        log(f"  Throughput: {pages} pages in {elapsed:.1f}s = {pages / elapsed * 60:.1f} pages/minute")
+    
+    for result in failed[:3]:
+        log(f"  {result['document']}: {result['error']}", "WARN")
+    
+    return 1 if failed or not succeeded else 0
 
-def test_external_services():
-    log("Testing connectivity to external services...")
+class QuietServerMixin:
+    # Local test servers; benchmark clients and phase-timing probes hang up
+    # mid-response, so don't print tracebacks for client disconnects
+    daemon_threads = True
     
-    # Check if external service tests are enabled
-    test_enabled = os.environ.get('TEST_EXTERNAL_SERVICES', 'true').lower() == 'true'
-    if not test_enabled:
-        log("External service tests skipped - disabled (set TEST_EXTERNAL_SERVICES=true to enable)", "WARN")
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class QuietHTTPServer(QuietServerMixin, ThreadingHTTPServer):
+    pass
+
+class QuietTCPServer(QuietServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Local stand-in for the Azure OpenAI, OpenAI-compatible, Ollama and
+    # Document Intelligence APIs, plus /bytes/<n> and /upload for throughput tests
+    protocol_version = 'HTTP/1.1'
+    
+    # Document Intelligence operations: id -> (submitted at, pages)
+    operations = {}
+    
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path.startswith('/bytes/'):
+            self.send_bytes(int(path.rsplit('/', 1)[-1]))
+        elif path == '/formrecognizer/documentModels':
+            self.send_json(200, {"value": [{"modelId": "prebuilt-read"}]})
+        elif '/analyzeResults/' in path:
+            operation = self.operations.get(path.rsplit('/', 1)[-1])
+            if operation is None:
+                self.send_json(404, {"error": {"code": "NotFound"}})
+                return
+            submitted, pages = operation
+            age = time.monotonic() - submitted
+            queue_delay = float(os.environ.get('STUB_ANALYZE_QUEUE_DELAY', '0.5'))
+            page_delay = float(os.environ.get('STUB_ANALYZE_PAGE_DELAY', '0.3'))
+            if age < queue_delay:
+                self.send_json(200, {"status": "notStarted"})
+            elif age < queue_delay + pages * page_delay:
+                self.send_json(200, {"status": "running"})
+            else:
+                self.send_json(200, {"status": "succeeded", "analyzeResult": {
+                    "pages": [{"pageNumber": i + 1} for i in range(pages)]
+                }})
+        else:
+            self.send_json(404, {"error": "not found"})
+    
+    def do_POST(self):
+        if self.path.startswith('/upload'):
+            self.send_json(200, {"received": self.drain_body()})
+            return
+        
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length)
+        
+        if random.random() < float(os.environ.get('STUB_THROTTLE_RATE', '0')):
+            self.send_json(429, {"error": {"message": "Rate limit exceeded"}}, {'Retry-After': '1'})
+            return
+        
+        if ':analyze' in self.path:
+            # Page count of an uploaded PDF, or one page for anything else
+            pages = max(1, raw_body.count(b'/Type /Page ') + raw_body.count(b'/Type /Page>'))
+            operation_id = str(uuid.uuid4())
+            self.operations[operation_id] = (time.monotonic(), pages)
+            model_path = self.path.split(':analyze')[0]
+            self.send_json(202, {}, {
+                'Operation-Location': f"http://{self.headers['Host']}{model_path}/analyzeResults/{operation_id}",
+                'Retry-After': '0'
+            })
+            return
+        
+        body = json.loads(raw_body or b'{}')
+        if self.path.startswith('/api/generate'):
+            self.stream_tokens(body, 'ndjson')
+        elif '/completions' in self.path:
+            self.stream_tokens(body, 'sse')
+        else:
+            self.send_json(404, {"error": "not found"})
+    
+    def send_bytes(self, size):
+        # Throughput target: `size` bytes of filler
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        block = b'x' * 65536
+        while size > 0:
+            self.wfile.write(block[:size])
+            size -= len(block)
+    
+    def drain_body(self):
+        # Reads and discards a request body, chunked or not; returns its size
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            received = int(self.headers.get('Content-Length') or 0)
+            remaining = received
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, 65536))
+                if not data:
+                    break
+                remaining -= len(data)
+            return received
+        received = 0
+        while True:
+            chunk_size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+            if chunk_size == 0:
+                self.rfile.readline()
+                return received
+            self.rfile.read(chunk_size)
+            self.rfile.readline()
+            received += chunk_size
+    
+    def stream_tokens(self, body, stream_format):
+        tokens = int(os.environ.get('STUB_TOKENS', '20'))
+        if stream_format == 'ndjson':
+            tokens = min(tokens, (body.get('options') or {}).get('num_predict', tokens))
+        else:
+            tokens = min(tokens, body.get('max_tokens', tokens))
+        token_delay = float(os.environ.get('STUB_TOKEN_DELAY', '0.02'))
+        time.sleep(float(os.environ.get('STUB_FIRST_TOKEN_DELAY', '0.2')))
+        
+        if not body.get('stream'):
+            text = " token" * tokens
+            if stream_format == 'ndjson':
+                self.send_json(200, {"response": text, "done": True, "eval_count": tokens})
+            else:
+                self.send_json(200, {"choices": [{"text": text, "message": {"content": text}}]})
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson' if stream_format == 'ndjson' else 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(tokens):
+            if i:
+                time.sleep(token_delay)
+            if stream_format == 'ndjson':
+                self.write_chunk(json.dumps({"response": " token", "done": False}) + "\n")
+            else:
+                self.write_chunk("data: " + json.dumps({"choices": [{"delta": {"content": " token"}}]}) + "\n\n")
+        if stream_format == 'ndjson':
+            self.write_chunk(json.dumps({"response": "", "done": True, "eval_count": tokens}) + "\n")
+        else:
+            self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+    
+    def write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+    
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+
+def run_stub_server():
+    port = int(os.environ.get('STUB_PORT', '8089'))
+    server = QuietHTTPServer(('0.0.0.0', port), StubHandler)
+    log(f"Stub server listening on port {port} (Azure OpenAI, OpenAI-compatible, Ollama and Document Intelligence APIs, "
+        f"/bytes/<n> and /upload)")
+    server.serve_forever()
+    return 0
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # HTTP target for self-benchmark; each server's behaviour dict sets the response
+    # delay, the share of 503 errors, the body size and a per-4KB delay for slow bodies
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        behaviour = self.server.behaviour
+        time.sleep(behaviour.get('delay', 0))
+        status = 503 if random.random() < behaviour.get('error_rate', 0) else 200
+        body = b'x' * behaviour.get('body_bytes', 512)
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        for offset in range(0, len(body), 4096):
+            self.wfile.write(body[offset:offset + 4096])
+            time.sleep(behaviour.get('chunk_delay', 0))
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_local_server(handler, behaviour=None, server_class=QuietHTTPServer):
+    server = server_class(('127.0.0.1', 0), handler)
+    server.behaviour = behaviour or {}
+    threading.Thread(target=server.serve_forever, name='stand-in', daemon=True).start()
+    return server
+
+class PostgresStandInHandler(socketserver.StreamRequestHandler):
+    # PostgreSQL target for self-benchmark, speaking just enough of the wire protocol
+    # for the tester's own queries: any login is accepted, the server inventory lists
+    # behaviour['databases'] databases and each one has the same two extensions.
+    # behaviour['delay'] is added to every connection setup
+    SSL_REQUEST = 80877103
+    GSSENC_REQUEST = 80877104
+    PROTOCOL_3 = 196608
+    PARAMETERS = (
+        ('server_version', '16.4'), ('server_encoding', 'UTF8'), ('client_encoding', 'UTF8'),
+        ('DateStyle', 'ISO, MDY'), ('TimeZone', 'UTC'), ('integer_datetimes', 'on'),
+        ('standard_conforming_strings', 'on'),
+    )
+    # Replies go out as several small writes
+    disable_nagle_algorithm = True
+    # Type oids of the result columns
+    INT4, INT8, TEXT, JSON = 23, 20, 25, 114
+    
+    def handle(self):
+        if not self.read_startup():
+            return
+        time.sleep(self.server.behaviour.get('delay', 0))
+        self.send(b'R', struct.pack('!I', 0))  # AuthenticationOk, whatever the password
+        for name, value in self.PARAMETERS:
+            self.send(b'S', name.encode() + b'\0' + value.encode() + b'\0')
+        self.send(b'K', struct.pack('!II', threading.get_ident() & 0x7fffffff, 0))
+        
+        status = b'I'
+        self.send(b'Z', status)
+        while True:
+            header = self.rfile.read(5)
+            if len(header) < 5 or header[:1] == b'X':
+                return
+            payload = self.rfile.read(struct.unpack('!I', header[1:])[0] - 4)
+            if header[:1] != b'Q':
+                self.send_error('08P01', "only the simple query protocol is supported")
+                return
+            status = self.answer(payload.rstrip(b'\0').decode('utf-8'), status)
+            self.send(b'Z', status)
+    
+    def read_startup(self):
+        # SSL and GSSAPI encryption are declined; the client then sends the
+        # plain startup packet on the same connection
+        while True:
+            header = self.rfile.read(8)
+            if len(header) < 8:
+                return False
+            length, code = struct.unpack('!II', header)
+            self.rfile.read(length - 8)
+            if code not in (self.SSL_REQUEST, self.GSSENC_REQUEST):
+                return code == self.PROTOCOL_3
+            self.wfile.write(b'N')
+    
+    def answer(self, query, status):
+        # Returns the transaction status for the following ReadyForQuery
+        command = query.split(None, 1)[0].rstrip(';').upper() if query.strip() else ''
+        if command in ('COMMIT', 'ROLLBACK'):
+            self.send(b'C', (b'ROLLBACK' if status == b'E' else command.encode()) + b'\0')
+            return b'I'
+        if status == b'E':
+            self.send_error('25P02', "current transaction is aborted, commands ignored until end of transaction block")
+            return status
+        if command in ('BEGIN', 'SET'):
+            self.send(b'C', command.encode() + b'\0')
+            return b'T' if command == 'BEGIN' else status
+        
+        result = self.select(query) if command == 'SELECT' else None
+        if result is None:
+            self.send_error('0A000', f"not supported by the connectivity tester stand-in: {query.strip()[:60]}")
+            return b'E' if status == b'T' else status
+        
+        columns, rows = result
+        self.send(b'T', struct.pack('!H', len(columns)) + b''.join(
+            name.encode() + b'\0' + struct.pack('!IHIhiH', 0, 0, type_oid, -1, -1, 0)
+            for name, type_oid in columns))
+        for row in rows:
+            values = [str(value).encode('utf-8') for value in row]
+            self.send(b'D', struct.pack('!H', len(values)) + b''.join(
+                struct.pack('!I', len(value)) + value for value in values))
+        self.send(b'C', f"SELECT {len(rows)}".encode() + b'\0')
+        return status
+    
+    def select(self, query):
+        # (columns, rows) for the queries the tester sends, None for anything else
+        if 'pg_available_extensions' in query:
+            count = self.server.behaviour.get('databases', 1)
+            databases = [['postgres', True, 5]] + [
+                [f"connectivity_bench_{index:04d}", True, 16384 + index] for index in range(count - 1)]
+            available = [['pg_stat_statements', '1.10', 'track planning and execution statistics of all SQL statements executed'],
+                         ['plpgsql', '1.0', 'PL/pgSQL procedural language']]
+            return ([('version', self.TEXT), ('max_connections', self.INT4), ('reserved', self.INT4),
+                     ('count', self.INT8), ('databases', self.JSON), ('available', self.JSON)],
+                    [(f"PostgreSQL {self.PARAMETERS[0][1]} (connectivity tester stand-in)", 100, 3, 1,
+                      json.dumps(databases), json.dumps(available))])
+        if 'FROM pg_extension' in query:
+            return ([('extension_name', self.TEXT), ('version', self.TEXT), ('schema', self.TEXT)],
+                    [('pg_stat_statements', '1.10', 'public'), ('plpgsql', '1.0', 'pg_catalog')])
+        if 'FROM pg_class' in query:
+            return [('pg_size_pretty', self.TEXT)], [('7600 kB',)]
+        if re.fullmatch(r'SELECT\s+1\s*;?', query.strip(), re.IGNORECASE):
+            return [('?column?', self.INT4)], [(1,)]
+        return None
+    
+    def send(self, kind, payload):
+        self.wfile.write(kind + struct.pack('!I', len(payload) + 4) + payload)
+    
+    def send_error(self, code, message):
+        fields = [b'S', b'ERROR', b'V', b'ERROR', b'C', code.encode(), b'M', message.encode('utf-8')]
+        self.send(b'E', b''.join(fields[i] + fields[i + 1] + b'\0' for i in range(0, len(fields), 2)) + b'\0')
+
+@contextmanager
+def patched_env(**values):
+    # Temporarily sets (or, for None, removes) environment variables
+    saved = {key: os.environ.get(key) for key in values}
+    for key, value in values.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = str(value)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def self_benchmark_postgres_config():
+    # Explicit SELF_BENCHMARK_PG* target, never the pod's own PG* server; None if unset
+    host = os.environ.get('SELF_BENCHMARK_PGHOST')
+    if not host:
         return None
     
-    services = {
-        'Office 365': 'https://login.microsoftonline.com',
-        'Google Drive': 'https://accounts.google.com',
-        'Notion': 'https://www.notion.so',
-        'Box': 'https://account.box.com',
-        'Dropbox': 'https://www.dropbox.com',
-        'ServiceNow': 'https://www.servicenow.com',
-        'Amazon S3': 'https://aws.amazon.com/s3/',
-        'Atlassian': 'https://id.atlassian.com/login'
+    return {
+        'server_name': "Self-benchmark PostgreSQL",
+        'host': host,
+        'port': os.environ.get('SELF_BENCHMARK_PGPORT', '5432'),
+        'database': os.environ.get('SELF_BENCHMARK_PGDATABASE', 'postgres'),
+        'user': os.environ.get('SELF_BENCHMARK_PGUSER'),
+        'password': os.environ.get('SELF_BENCHMARK_PGPASSWORD')
     }
+
+def self_benchmark_databases(config, scale, create):
+    # Up to `scale` accessible databases, creating connectivity_bench_<n> ones if allowed.
+    # Returns (inventory, database names, names created here).
+    conn = psycopg2.connect(
+        host=config['host'],
+        hostaddr=pg_hostaddr(config['host']),
+        port=config['port'],
+        database=config['database'],
+        user=config['user'],
+        password=config['password'],
+        connect_timeout=10
+    )
+    conn.autocommit = True
+    created = []
+    try:
+        cursor = conn.cursor()
+        inventory = fetch_server_inventory(cursor)
+        accessible = [db_name for db_name, can_connect in inventory['databases'] if can_connect]
+        index = 0
+        while create and len(accessible) < scale:
+            db_name = f"connectivity_bench_{index:04d}"
+            index += 1
+            if db_name not in accessible:
+                cursor.execute(f'CREATE DATABASE "{db_name}";')
+                created.append(db_name)
+                accessible.append(db_name)
+        if created:
+            inventory = fetch_server_inventory(cursor)
+        cursor.close()
+    finally:
+        conn.close()
+    return inventory, accessible[:scale], created
+
+def drop_benchmark_databases(config, db_names):
+    conn = psycopg2.connect(
+        host=config['host'],
+        hostaddr=pg_hostaddr(config['host']),
+        port=config['port'],
+        database=config['database'],
+        user=config['user'],
+        password=config['password'],
+        connect_timeout=10
+    )
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        for db_name in db_names:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{db_name}";')
+    finally:
+        conn.close()
+
+def write_stand_in_hosts(path, servers, scale):
+    # Spread `scale` custom hosts round-robin over the stand-in servers
+    with open(path, 'w') as f:
+        for index in range(scale):
+            server = servers[index % len(servers)]
+            f.write(f"http://127.0.0.1:{server.server_address[1]}/host/{index} Stand-in {index}\n")
+
+def run_self_benchmark():
+    # Times the tester's own hot paths against local stand-ins at increasing scale,
+    # appends the medians to SELF_BENCHMARK_RESULTS and compares them with earlier runs
+    global _log_threshold
+    scales = [int(scale) for scale in os.environ.get('SELF_BENCHMARK_SCALES', '10,100,1000').split(',') if scale.strip()]
+    repeat = max(1, int(os.environ.get('SELF_BENCHMARK_REPEAT', '3')))
+    latency = float(os.environ.get('SELF_BENCHMARK_LATENCY', '0.05'))
+    tolerance = float(os.environ.get('SELF_BENCHMARK_TOLERANCE', '0.25'))
+    create_databases = os.environ.get('SELF_BENCHMARK_CREATE_DATABASES', 'false').lower() == 'true'
+    results_path = os.environ.get('SELF_BENCHMARK_RESULTS') or os.path.join(
+        os.environ.get('PVC_MOUNT_PATH', '/mnt/test-storage'), 'self-benchmark.jsonl')
     
-    results = {}
+    # Database scenarios use a local wire-protocol stand-in unless SELF_BENCHMARK_PGHOST
+    # names a server; databases are only ever created on such an explicit target
+    config = self_benchmark_postgres_config()
+    if config and not all([config['user'], config['password']]):
+        log("SELF_BENCHMARK_PGHOST is set but SELF_BENCHMARK_PGUSER or SELF_BENCHMARK_PGPASSWORD is missing", "ERROR")
+        return 1
     
-    for service_name, url in services.items():
-        try:
-            log(f"Testing {service_name} connectivity...")
-            response = requests.get(url, timeout=10, allow_redirects=True)
-            
-            # Consider 2xx and 3xx status codes as successful
-            if response.status_code < 400:
-                log(f"{service_name}: REACHABLE (Status: {response.status_code})")
-                results[service_name] = True
-            else:
-                log(f"{service_name}: UNREACHABLE (Status: {response.status_code})", "WARN")
-                results[service_name] = False
+    # Fast, slow, half-failing and slow-body HTTP targets, plus the API stub
+    stand_ins = [
+        start_local_server(StandInHandler),
+        start_local_server(StandInHandler, {'delay': latency}),
+        start_local_server(StandInHandler, {'delay': latency, 'error_rate': 0.5}),
+        start_local_server(StandInHandler, {'body_bytes': 64 * 1024, 'chunk_delay': latency / 16}),
+    ]
+    stub = start_local_server(StubHandler)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    hosts_path = os.path.join(os.environ.get('TMPDIR', '/tmp'), f"self-benchmark-hosts-{RUN_ID}.txt")
+    
+    pg_stand_in = None
+    if config is None:
+        pg_stand_in = start_local_server(PostgresStandInHandler, {'delay': latency / 10}, server_class=QuietTCPServer)
+        config = {
+            'server_name': "Self-benchmark PostgreSQL stand-in",
+            'host': '127.0.0.1',
+            'port': str(pg_stand_in.server_address[1]),
+            'database': 'postgres',
+            'user': 'stand-in',
+            'password': 'stand-in'
+        }
+        pg_target = 'stand-in'
+        create_databases = False
+    else:
+        pg_target = f"{config['host']}:{config['port']}/{config['database']}"
+    
+    log(f"Self-benchmark: scales {', '.join(map(str, scales))}, {repeat} repeat(s), stand-in latency {latency * 1000:.0f}ms, "
+        f"PostgreSQL target {pg_target}")
+    log("=" * 60)
+    
+    def main_pass():
+        resolve_configured_hosts()
+        run_checks(CHECKS)
+    
+    scenarios = [
+        ('custom_hosts', lambda scale: test_custom_hostnames()),
+        ('extension_inventory', None),
+        ('main_pass', lambda scale: main_pass()),
+    ]
+    
+    env = {
+        'TEST_CUSTOM_HOSTNAMES': 'true', 'CUSTOM_HOSTS_FILE': hosts_path,
+        'TEST_EXTERNAL_SERVICES': 'false', 'TEST_PVC': 'false', 'PGHOST_SECONDARY': None, 'READY_FILE': None,
+        'PGHOST': config['host'], 'PGPORT': config['port'], 'PGDATABASE': config['database'],
+        'PGUSER': config['user'], 'PGPASSWORD': config['password'],
+        'DATABASE_SIZE_MODE': 'skip', 'CATALOG_SNAPSHOT': 'false',
+        'AZURE_OPENAI_ENDPOINT': stub_url, 'AZURE_OPENAI_API_KEY': 'stand-in', 'AZURE_OPENAI_DEPLOYMENT': 'stand-in',
+        'AZURE_DOCINTEL_ENDPOINT': stub_url, 'AZURE_DOCINTEL_API_KEY': 'stand-in',
+        'OLLAMA_ENDPOINT': stub_url, 'OPENAI_COMPATIBLE_ENDPOINT': stub_url,
+        'STUB_FIRST_TOKEN_DELAY': str(latency), 'STUB_TOKEN_DELAY': '0',
+    }
+    if pg_stand_in:
+        # The stand-in declines TLS, whatever the pod asks libpq for
+        env.update({'PGSSLMODE': 'disable', 'PGGSSENCMODE': 'disable'})
+    
+    measurements = []
+    created = []
+    quiet = os.environ.get('SELF_BENCHMARK_QUIET', 'true').lower() == 'true'
+    try:
+        with patched_env(**env):
+            for scale in scales:
+                write_stand_in_hosts(hosts_path, stand_ins, scale)
+                if pg_stand_in:
+                    pg_stand_in.behaviour['databases'] = scale
+                inventory, db_names, new_databases = self_benchmark_databases(config, scale, create_databases)
+                created += new_databases
                 
-        except requests.exceptions.Timeout:
-            log(f"{service_name}: TIMEOUT (10s)", "WARN")
-            results[service_name] = False
-        except requests.exceptions.ConnectionError:
-            log(f"{service_name}: CONNECTION ERROR", "WARN")
-            results[service_name] = False
-        except Exception as e:
-            log(f"{service_name}: ERROR - {str(e)}", "WARN")
-            results[service_name] = False
+                for scenario, func in scenarios:
+                    if scenario == 'extension_inventory':
+                        func = lambda scale: fetch_database_inventories(
+                            config['server_name'], config['host'], config['port'], config['user'],
+                            config['password'], inventory, db_names)
+                        actual_scale = len(db_names)
+                    else:
+                        actual_scale = scale
+                    
+                    timings = []
+                    for _ in range(repeat):
+                        threshold = _log_threshold
+                        if quiet:
+                            _log_threshold = LOG_LEVELS['ERROR'] + 1
+                        start = time.monotonic()
+                        try:
+                            func(scale)
+                        finally:
+                            _log_threshold = threshold
+                        timings.append(time.monotonic() - start)
+                    
+                    seconds = percentile(timings, 50)
+                    note = f" (only {actual_scale} databases available)" if actual_scale < scale else ""
+                    log(f"  {scenario} @ {scale}: median {seconds:.3f}s, min {min(timings):.3f}s{note}")
+                    measurements.append({
+                        'type': 'self_benchmark', 'run_id': RUN_ID, 'label': os.environ.get('SELF_BENCHMARK_LABEL'),
+                        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                        'scenario': scenario, 'scale': scale, 'actual_scale': actual_scale, 'pg_target': pg_target,
+                        'median_s': round(seconds, 4), 'min_s': round(min(timings), 4), 'repeat': repeat,
+                    })
+    finally:
+        for server in stand_ins + [stub] + ([pg_stand_in] if pg_stand_in else []):
+            server.shutdown()
+        if os.path.exists(hosts_path):
+            os.remove(hosts_path)
+        if created and os.environ.get('SELF_BENCHMARK_KEEP_DATABASES', 'false').lower() != 'true':
+            drop_benchmark_databases(config, created)
     
-    # Summary of external service tests
-    reachable = sum(1 for v in results.values() if v)
-    total = len(results)
-    log(f"External services summary: {reachable}/{total} services reachable")
+    # Compare with the median of the last five stored runs of each scenario and scale
+    history = {}
+    try:
+        with open(results_path) as f:
+            for line in f:
+                record = json.loads(line)
+                key = (record['scenario'], record['scale'], record['actual_scale'], record.get('pg_target'))
+                history.setdefault(key, []).append(record['median_s'])
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        log(f"Could not read previous self-benchmark results from {results_path}: {str(e)}", "WARN")
     
-    return results
+    log("=" * 60)
+    log("SELF-BENCHMARK COMPARISON:")
+    regressions = 0
+    for record in measurements:
+        previous = history.get((record['scenario'], record['scale'], record['actual_scale'], record['pg_target']), [])[-5:]
+        label = f"{record['scenario']} @ {record['scale']}"
+        if not previous:
+            log(f"  {label}: {record['median_s']:.3f}s (no previous results)")
+            continue
+        baseline = percentile(previous, 50)
+        change = (record['median_s'] - baseline) / baseline if baseline else 0.0
+        # Small absolute differences are noise, whatever the ratio
+        if change > tolerance and record['median_s'] - baseline > 0.05:
+            regressions += 1
+            log(f"  {label}: {record['median_s']:.3f}s vs {baseline:.3f}s ({change:+.0%}) - REGRESSION", "ERROR")
+        else:
+            log(f"  {label}: {record['median_s']:.3f}s vs {baseline:.3f}s ({change:+.0%})")
+    
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+        with open(results_path, 'a') as f:
+            for record in measurements:
+                f.write(json.dumps(record) + '\n')
+        log(f"Appended {len(measurements)} results to {results_path}")
+    except OSError as e:
+        log(f"Could not store self-benchmark results in {results_path}: {str(e)}", "WARN")
+    
+    return 1 if regressions else 0
 
-def main():
+def main(fast_start=False):
+    # Drop a READY_FILE left behind by a previous run until this run's check passes
+    _readiness['owns_ready_file'] = True
+    set_ready(False)
+    atexit.register(clear_ready_file)
+    
     log("Starting connectivity tests...")
     log("=" * 60)
     
-    results = {}
+    start_metrics_server()
+    
+    baseline = load_baseline_store()
+    started_at = datetime.now(timezone.utc)
+    pass_start = time.monotonic()
+    records = {}
+    
+    def collect(name, result, duration):
+        check_baseline(baseline, name, result, duration)
+        records[name] = build_result(name, result, duration)
+        emit_result_line(records[name])
     
-    # Test PostgreSQL (always required)
-    results['Primary PostgreSQL'] = test_postgres()
-    log("-" * 60)
-    
-    # Test Secondary PostgreSQL (optional)
-    result = test_postgres_secondary()
-    if result is not None:
-        results['Secondary PostgreSQL'] = result
-        log("-" * 60)
-    
-    # Test Azure OpenAI (optional)
-    result = test_azure_openai()
-    if result is not None:
-        results['Azure OpenAI'] = result
-        log("-" * 60)
-    
-    # Test Azure Document Intelligence (optional)
-    result = test_azure_document_intelligence()
-    if result is not None:
-        results['Azure Document Intelligence'] = result
-        log("-" * 60)
-    
-    # Test Ollama (optional)
-    result = test_ollama()
-    if result is not None:
-        results['Ollama'] = result
-        log("-" * 60)
-    
-    # Test OpenAI-compatible endpoint (optional)
-    result = test_openai_compatible()
-    if result is not None:
-        results['OpenAI-compatible'] = result
-        log("-" * 60)
-    
-    # Test Persistent Volume Claim (optional)
-    result = test_persistent_volume()
-    if result is not None:
-        results['Persistent Volume Claim'] = result
-        log("-" * 60)
-    
-    # Test Custom Hostnames (optional)
-    custom_results = test_custom_hostnames()
-    if custom_results is not None:
-        results['Custom Hostnames'] = custom_results
-        log("-" * 60)
-    
-    # Test External Services (optional)
-    external_results = test_external_services()
-    if external_results is not None:
-        results['External Services'] = external_results
-        log("-" * 60)
+    if fast_start:
+        # Required check alone first, so readiness (/readyz, READY_FILE) is signalled
+        # as soon as it passes; the optional checks only run afterwards
+        results = run_checks([check for check in CHECKS if check[0] == REQUIRED_CHECK], on_complete=collect)
+        if results.get(REQUIRED_CHECK, False):
+            log(f"Ready after {time.monotonic() - pass_start:.2f}s; continuing with optional checks")
+            resolve_configured_hosts()
+            results.update(run_checks([check for check in CHECKS if check[0] != REQUIRED_CHECK], on_complete=collect))
+            results = {name: results[name] for name, _ in CHECKS if name in results}
+    else:
+        resolve_configured_hosts()
+        results = run_checks(CHECKS, on_complete=collect)
+    save_baseline_store(baseline)
+    write_run_report([records[name] for name, _ in CHECKS if name in records],
+                     started_at, time.monotonic() - pass_start)
     
     # Summary
     log("=" * 60)
     log("TEST SUMMARY:")
     for service, status in results.items():
-        if service in ['Custom Hostnames', 'External Services']:
+        if isinstance(status, dict):
             # Handle service groups separately
             reachable = sum(1 for v in status.values() if v)
             total = len(status)
@@ -635,6 +4376,11 @@ def main():
         log("Required tests failed!", "ERROR")
         sys.exit(1)
     
+    # Keep re-running the checks if monitor mode is enabled
+    if os.environ.get('MONITOR_MODE', 'false').lower() == 'true':
+        log("=" * 60)
+        run_monitor(CHECKS, baseline)
+    
     # Keep the pod running for further manual testing
     log("=" * 60)
     log("All required tests completed. Pod will stay running for manual testing.")
@@ -646,5 +4392,41 @@ def main():
     while True:
         time.sleep(3600)
 
+def run_fast_start():
+    return main(fast_start=True)
+
+# Entry points, selected by the first argument or TEST_MODE
+MODES = {
+    'connectivity': main,
+    'fast-start': run_fast_start,
+    'pg-benchmark': run_postgres_benchmark,
+    'pg-connection-stress': run_connection_stress,
+    'pg-fleet': run_postgres_fleet,
+    'llm-benchmark': run_llm_benchmark,
+    'docintel-benchmark': run_docintel_benchmark,
+    'pvc-benchmark': run_storage_benchmark,
+    'throughput-benchmark': run_throughput_benchmark,
+    'stub-server': run_stub_server,
+    'self-benchmark': run_self_benchmark,
+}
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Kubernetes sends SIGTERM before killing the pod; flush queued log lines first
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    mode = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('TEST_MODE', 'connectivity')
+    if mode not in MODES:
+        log(f"Unknown mode: {mode} (available: {', '.join(MODES)})", "ERROR")
+        sys.exit(2)
+    try:
+        code = MODES[mode]()
+    except SystemExit as e:
+        code = e.code
+    if _abandoned_checks:
+        # Abandoned checks may still be waiting in nested thread pools, which the
+        # interpreter would join at exit; leave without waiting for them
+        log(f"Exiting without waiting for timed-out checks: {', '.join(sorted(_abandoned_checks))}", "WARN")
+        clear_ready_file()  # os._exit skips the atexit hook
+        flush_logs()
+        sys.stdout.flush()
+        os._exit(code if isinstance(code, int) else 1)
+    sys.exit(code)
\ No newline at end of file
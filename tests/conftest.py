@@ -0,0 +1,11 @@
+import pytest
+
+import test_connectivity as tc
+
+
+@pytest.fixture
+def logged(monkeypatch):
+    # Messages passed to log(), as (level, message)
+    messages = []
+    monkeypatch.setattr(tc, 'log', lambda message, level="INFO": messages.append((level, message)))
+    return messages
@@ -0,0 +1,106 @@
+import math
+import os
+import random
+import statistics
+import zlib
+
+import pytest
+
+import test_connectivity as tc
+
+
+def rollup(values):
+    # [count, mean, M2, failures] of one day, computed directly
+    mean = statistics.fmean(values)
+    return [len(values), mean, sum((value - mean) ** 2 for value in values), 0]
+
+
+def test_merge_rollups_matches_direct_computation():
+    rng = random.Random(1)
+    days = [[rng.gauss(4, 0.3) for _ in range(n)] for n in (5, 1, 12, 30)]
+    count, mean, m2, failures = tc.merge_rollups([rollup(day) for day in days] + [[0, 0.0, 0.0, 3]])
+    
+    values = [value for day in days for value in day]
+    assert count == len(values)
+    assert mean == pytest.approx(statistics.fmean(values))
+    assert m2 / (count - 1) == pytest.approx(statistics.variance(values))
+    assert failures == 3
+
+
+def test_merge_rollups_empty():
+    assert tc.merge_rollups([]) == (0, 0.0, 0.0, 0)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch, logged):
+    monkeypatch.setenv('BASELINE_STORE', 'true')
+    monkeypatch.setenv('BASELINE_DIR', str(tmp_path))
+    monkeypatch.setenv('BASELINE_MIN_SAMPLES', '10')
+    return tc.load_baseline_store()
+
+
+def test_check_baseline_welford_rollup(store):
+    durations = [0.1, 0.12, 0.09, 0.11]
+    for duration in durations:
+        assert tc.check_baseline(store, 'Primary PostgreSQL', True, duration) is False
+    tc.check_baseline(store, 'Primary PostgreSQL', False, 10)
+    
+    (count, mean, m2, failures), = store['rollups']['Primary PostgreSQL'].values()
+    logs = [math.log(duration * 1000) for duration in durations]
+    assert count == 4
+    assert failures == 1
+    assert mean == pytest.approx(statistics.fmean(logs))
+    assert m2 / (count - 1) == pytest.approx(statistics.variance(logs))
+
+
+def test_check_baseline_flags_regression(store):
+    rng = random.Random(2)
+    for _ in range(30):
+        tc.check_baseline(store, 'Azure OpenAI', True, rng.uniform(0.09, 0.11))
+    
+    # Within the usual spread, then far above it
+    assert tc.check_baseline(store, 'Azure OpenAI', True, 0.105) is False
+    assert tc.check_baseline(store, 'Azure OpenAI', True, 0.5) is True
+    # A large z-score alone isn't enough without the minimum relative increase
+    assert tc.check_baseline(store, 'Azure OpenAI', True, 0.115) is False
+
+
+def test_check_baseline_needs_min_samples(store):
+    for _ in range(9):
+        tc.check_baseline(store, 'Ollama', True, 0.1)
+    assert tc.check_baseline(store, 'Ollama', True, 5) is False
+
+
+def test_check_baseline_disabled():
+    assert tc.check_baseline(None, 'Ollama', True, 0.1) is False
+
+
+def test_sample_records_round_trip(store):
+    tc.check_baseline(store, 'Primary PostgreSQL', True, 0.25)
+    tc.check_baseline(store, 'Custom Hostnames', {'a': True, 'b': False}, 1.5, key='Custom Hostnames (monitor)')
+    
+    with open(os.path.join(store['dir'], 'samples.bin'), 'rb') as f:
+        records = list(tc.BASELINE_RECORD.iter_unpack(f.read()))
+    assert len(records) == 2
+    (_, crc, duration_ms, success), (_, crc2, duration_ms2, success2) = records
+    assert (crc, success) == (zlib.crc32(b'Primary PostgreSQL'), 1)
+    assert duration_ms == pytest.approx(250)
+    assert (crc2, success2) == (zlib.crc32(b'Custom Hostnames (monitor)'), 0)
+    assert duration_ms2 == pytest.approx(1500)
+
+
+def test_save_baseline_store_keeps_whole_newest_records(store, monkeypatch):
+    for i in range(100):
+        tc.check_baseline(store, 'Ollama', True, (i + 1) / 1000)
+    monkeypatch.setenv('BASELINE_MAX_BYTES', str(tc.BASELINE_RECORD.size * 25 + 3))
+    tc.save_baseline_store(store)
+    
+    with open(os.path.join(store['dir'], 'samples.bin'), 'rb') as f:
+        data = f.read()
+    assert len(data) % tc.BASELINE_RECORD.size == 0
+    durations = [round(record[2]) for record in tc.BASELINE_RECORD.iter_unpack(data)]
+    assert durations == list(range(101 - len(durations), 101))
+    
+    # Rollups survive a reload
+    monkeypatch.setenv('BASELINE_MAX_BYTES', str(8 * 1024 * 1024))
+    assert tc.load_baseline_store()['rollups'] == store['rollups']
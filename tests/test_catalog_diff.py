@@ -0,0 +1,115 @@
+import pytest
+
+import test_connectivity as tc
+
+VERSION = 'PostgreSQL 16.4 on x86_64-pc-linux-gnu'
+
+
+@pytest.fixture
+def snapshot():
+    return {
+        'taken_at': '2026-01-01T00:00:00+00:00',
+        'version': VERSION,
+        'databases': {'app': 100, 'orders': 200, 'legacy': 300, 'locked': 400},
+        'database_extensions': {
+            'app': {'oid': 100, 'fetched_at': 0, 'extensions': {'plpgsql': ['1.0', 'pg_catalog'],
+                                                                'pg_trgm': ['1.5', 'public']}},
+            'orders': {'oid': 200, 'fetched_at': 0, 'extensions': {'plpgsql': ['1.0', 'pg_catalog'],
+                                                                   'uuid-ossp': ['1.1', 'public']}},
+        },
+        'available_extensions': {'plpgsql': '1.0', 'pg_trgm': '1.6', 'uuid-ossp': '1.1'},
+    }
+
+
+def inventory(database_oids, available=(('plpgsql', '1.0', ''), ('pg_trgm', '1.6', ''), ('uuid-ossp', '1.1', ''))):
+    return {'version': VERSION, 'database_oids': database_oids, 'available_extensions': list(available)}
+
+
+def fetched(*extensions):
+    return {'extensions': list(extensions)}
+
+
+def diff(logged, current, db_inventories, snapshot):
+    changes = tc.log_catalog_diff('Primary PostgreSQL', current, db_inventories, snapshot)
+    messages = [message.strip() for _, message in logged]
+    assert changes == len(messages)
+    return messages
+
+
+def test_no_changes(logged, snapshot):
+    current = inventory({'app': 100, 'orders': 200, 'legacy': 300, 'locked': 400})
+    db_inventories = {
+        'app': fetched(('pg_trgm', '1.5', 'public'), ('plpgsql', '1.0', 'pg_catalog')),
+        'orders': fetched(('plpgsql', '1.0', 'pg_catalog'), ('uuid-ossp', '1.1', 'public')),
+    }
+    assert diff(logged, current, db_inventories, snapshot) == []
+
+
+def test_databases_added_removed_recreated(logged, snapshot):
+    # 'locked' was never readable but is still tracked by oid
+    current = inventory({'app': 100, 'orders': 201, 'reports': 500})
+    db_inventories = {
+        'app': fetched(('pg_trgm', '1.5', 'public'), ('plpgsql', '1.0', 'pg_catalog')),
+        # Recreated with different extensions: no extension diff against the old entry
+        'orders': fetched(('plpgsql', '1.0', 'pg_catalog')),
+        'reports': fetched(('plpgsql', '1.0', 'pg_catalog')),
+    }
+    assert diff(logged, current, db_inventories, snapshot) == [
+        'Database added: reports',
+        'Database removed: legacy',
+        'Database removed: locked',
+        'Database recreated: orders',
+    ]
+
+
+def test_extension_changes(logged, snapshot):
+    current = inventory({'app': 100, 'orders': 200, 'legacy': 300, 'locked': 400})
+    db_inventories = {
+        'app': fetched(('pg_trgm', '1.6', 'extensions'), ('plpgsql', '1.0', 'pg_catalog'), ('hstore', '1.8', 'public')),
+        'orders': fetched(('plpgsql', '1.0', 'pg_catalog')),
+    }
+    assert diff(logged, current, db_inventories, snapshot) == [
+        'app: extension installed: hstore v1.8 (schema: public)',
+        'app: extension upgraded: pg_trgm v1.5 -> v1.6',
+        'app: extension moved: pg_trgm schema public -> extensions',
+        'orders: extension removed: uuid-ossp v1.1',
+    ]
+
+
+def test_cached_and_failed_databases_are_not_diffed(logged, snapshot):
+    current = inventory({'app': 100, 'orders': 200, 'legacy': 300, 'locked': 400})
+    db_inventories = {
+        'app': dict(fetched(), cached=True),
+        'orders': OSError('connection refused'),
+    }
+    assert diff(logged, current, db_inventories, snapshot) == []
+
+
+def test_server_and_available_extension_changes(logged, snapshot):
+    current = inventory({'app': 100, 'orders': 200, 'legacy': 300, 'locked': 400},
+                        available=[('plpgsql', '1.0', ''), ('pg_trgm', '1.7', ''), ('uuid-ossp', '1.1', ''),
+                                   ('vector', '0.7.0', '')])
+    current['version'] = 'PostgreSQL 16.6 on x86_64-pc-linux-gnu'
+    assert diff(logged, current, {}, snapshot) == [
+        'Server version changed: PostgreSQL 16.4 -> PostgreSQL 16.6',
+        'Available extension versions changed: pg_trgm v1.6 -> v1.7',
+        'Newly available extensions: vector',
+    ]
+
+
+def test_cached_database_inventories(monkeypatch, snapshot):
+    snapshot['database_extensions']['app']['fetched_at'] = tc.time.time() - 60
+    current = inventory({'app': 100, 'orders': 200})
+    
+    monkeypatch.setenv('CATALOG_REFRESH_SECONDS', '3600')
+    cached = tc.cached_database_inventories(snapshot, current, ['app', 'orders'])
+    # orders' entry is older than the refresh window
+    assert list(cached) == ['app']
+    assert cached['app']['cached'] is True
+    assert cached['app']['extensions'] == [('pg_trgm', '1.5', 'public'), ('plpgsql', '1.0', 'pg_catalog')]
+    
+    # A recreated database is always re-read
+    assert tc.cached_database_inventories(snapshot, inventory({'app': 101}), ['app']) == {}
+    
+    monkeypatch.setenv('CATALOG_REFRESH_SECONDS', '0')
+    assert tc.cached_database_inventories(snapshot, current, ['app', 'orders']) == {}
@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import test_connectivity as tc
+
+
+@pytest.fixture
+def race(monkeypatch, logged):
+    # Runs probe_custom_host with fake attempts: outcomes maps scheme -> (delay, status)
+    monkeypatch.setenv('CUSTOM_HOST_FALLBACK_DELAY', '0.05')
+    monkeypatch.setenv('CUSTOM_HOST_HTTPS_GRACE', '0.2')
+    attempted = []
+    
+    def run(url, outcomes):
+        def attempt(session, service_name, test_url):
+            attempted.append(test_url)
+            delay, status = outcomes[test_url.split('://', 1)[0]]
+            time.sleep(delay)
+            return (status, None, None) if status else (None, "Connection Error", None)
+        
+        monkeypatch.setattr(tc, 'attempt_custom_host', attempt)
+        with ThreadPoolExecutor(max_workers=2) as attempt_pool:
+            start = time.monotonic()
+            reachable = tc.probe_custom_host(None, 'Service', url, {}, attempt_pool)
+            elapsed = time.monotonic() - start
+        return reachable, elapsed, attempted, [message for _, message in logged]
+    return run
+
+
+def test_https_success_skips_http(race):
+    reachable, elapsed, attempted, messages = race('example.com', {'https': (0, 200), 'http': (0, 200)})
+    assert reachable
+    assert attempted == ['https://example.com']
+    assert 'URL: https://example.com' in messages[-1]
+
+
+def test_http_accepted_after_grace_when_https_hangs(race):
+    reachable, elapsed, attempted, messages = race('example.com', {'https': (1, 200), 'http': (0, 200)})
+    assert reachable
+    assert attempted == ['https://example.com', 'http://example.com']
+    assert 'URL: http://example.com' in messages[-1]
+    # fallback delay + grace period, not the HTTPS attempt's duration
+    assert elapsed < 0.8
+
+
+def test_https_wins_within_grace(race):
+    reachable, elapsed, attempted, messages = race('example.com', {'https': (0.15, 200), 'http': (0, 200)})
+    assert reachable
+    assert 'URL: https://example.com' in messages[-1]
+
+
+def test_http_error_status_waits_for_https(race):
+    reachable, elapsed, attempted, messages = race('example.com', {'https': (0.5, 200), 'http': (0, 503)})
+    assert reachable
+    assert 'URL: https://example.com' in messages[-1]
+    assert elapsed >= 0.5
+
+
+def test_both_fail(race):
+    reachable, elapsed, attempted, messages = race('example.com', {'https': (0, None), 'http': (0, 404)})
+    assert not reachable
+    assert 'Final Status: 404' in messages[-1]
+    assert 'Connection Error for https://example.com' in messages[-1]
+
+
+def test_explicit_scheme_is_not_raced(race):
+    reachable, elapsed, attempted, messages = race('http://example.com/health', {'http': (0, 200)})
+    assert reachable
+    assert attempted == ['http://example.com/health']
+
+
+def test_dns_failure_skips_attempts(logged):
+    attempts = []
+    dns_results = {'example.com': OSError('Name or service not known')}
+    assert tc.probe_custom_host(None, 'Service', 'example.com', dns_results, attempts) is False
+    assert 'DNS resolution failed for example.com' in logged[-1][1]
+
+
+def test_sized_sessions_are_reused():
+    assert tc.http_session(pool_maxsize=64) is tc.http_session(pool_maxsize=64)
+    assert tc.http_session(pool_maxsize=64) is not tc.http_session()
+    assert tc.http_session() is tc.http_session()
@@ -0,0 +1,82 @@
+import socket
+import threading
+
+import pytest
+
+import test_connectivity as tc
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    # Fake system resolver: records the lookups and answers from `answers`
+    lookups = []
+    answers = {'db.internal': ['10.0.0.5'], 'multi.internal': ['10.0.0.6', '10.0.0.7'], '10.1.2.3': ['10.1.2.3']}
+
+    def system_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        lookups.append((host, port))
+        if host not in answers:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, port or 0)) for address in answers[host]]
+
+    monkeypatch.setattr(tc, '_system_getaddrinfo', system_getaddrinfo)
+    monkeypatch.setattr(tc, '_dns_cache', {})
+    monkeypatch.setattr(tc, '_dns_stats', {})
+    monkeypatch.setenv('DNS_CACHE_TTL', '30')
+    return lookups
+
+
+def test_one_lookup_per_name_whatever_the_port(resolver):
+    first = tc.cached_getaddrinfo('db.internal', 5432)
+    second = tc.cached_getaddrinfo('DB.internal', '443')
+    assert resolver == [('db.internal', None)]
+    assert [info[4] for info in first] == [('10.0.0.5', 5432)]
+    assert [info[4] for info in second] == [('10.0.0.5', 443)]
+    assert tc._dns_stats['db.internal']['result'] == ['10.0.0.5']
+
+
+def test_expired_entries_are_looked_up_again(resolver, monkeypatch):
+    monkeypatch.setenv('DNS_CACHE_TTL', '0')
+    tc.cached_getaddrinfo('db.internal', 80)
+    tc.cached_getaddrinfo('db.internal', 80)
+    assert len(resolver) == 2
+
+
+def test_failures_are_not_cached(resolver):
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            tc.cached_getaddrinfo('missing.internal', 80)
+    assert len(resolver) == 2
+    assert isinstance(tc._dns_stats['missing.internal']['result'], socket.gaierror)
+
+
+def test_literals_and_service_names_bypass_the_cache(resolver):
+    tc.cached_getaddrinfo('10.1.2.3', 80)
+    tc.cached_getaddrinfo('db.internal', 'https')
+    assert resolver == [('10.1.2.3', 80), ('db.internal', 'https')]
+    assert tc._dns_cache == {}
+
+
+def test_concurrent_callers_each_get_their_own_port(resolver):
+    results = {}
+
+    def lookup(port):
+        results[port] = tc.cached_getaddrinfo('multi.internal', port)
+
+    threads = [threading.Thread(target=lookup, args=(port,)) for port in range(8000, 8032)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for port, infos in results.items():
+        assert [info[4] for info in infos] == [('10.0.0.6', port), ('10.0.0.7', port)]
+    assert len(results) == 32
+    assert len(tc._dns_cache) == 1
+
+
+def test_pg_hostaddr_pins_only_single_address_hosts(resolver, monkeypatch):
+    monkeypatch.setattr(socket, 'getaddrinfo', tc.cached_getaddrinfo)
+    assert tc.pg_hostaddr('db.internal') == '10.0.0.5'
+    assert tc.pg_hostaddr('multi.internal') is None
+    assert tc.pg_hostaddr('missing.internal') is None
+    assert tc.pg_hostaddr('/var/run/postgresql') is None
+    assert tc.pg_hostaddr('a.internal,b.internal') is None
@@ -0,0 +1,67 @@
+import test_connectivity as tc
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+        self.text = str(self._body)
+    
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    def __init__(self, submit, polls):
+        self.submit = submit
+        self.polls = list(polls)
+    
+    def post(self, url, **kwargs):
+        return self.submit
+    
+    def get(self, url, **kwargs):
+        return self.polls.pop(0) if len(self.polls) > 1 else self.polls[0]
+
+
+def analyze(session, timeout=5):
+    document = ('sample.pdf', b'%PDF', 'application/pdf')
+    return tc.analyze_document(session, 'https://docintel.example.com', {}, 'prebuilt-read', '2023-07-31',
+                               document, max_retries=0, timeout=timeout)
+
+
+def test_202_without_operation_location():
+    result = analyze(FakeSession(FakeResponse(202), []))
+    assert result['document'] == 'sample.pdf'
+    assert result['error'] == "202 without Operation-Location"
+
+
+def test_succeeded_after_polling():
+    accepted = FakeResponse(202, headers={'Operation-Location': 'https://op', 'Retry-After': '0'})
+    session = FakeSession(accepted, [
+        FakeResponse(200, {'status': 'running'}),
+        FakeResponse(200, {'status': 'succeeded', 'analyzeResult': {'pages': [{}, {}]}}),
+    ])
+    result = analyze(session)
+    assert result['error'] is None
+    assert result['pages'] == 2
+    assert result['polls'] == 2
+
+
+def test_timeout_reports_last_status(monkeypatch):
+    monkeypatch.setattr(tc.time, 'sleep', lambda seconds: None)
+    accepted = FakeResponse(202, headers={'Operation-Location': 'https://op', 'Retry-After': '0'})
+    
+    # Timing out before the first poll reports the submit status
+    result = analyze(FakeSession(accepted, [FakeResponse(200, {'status': 'running'})]), timeout=0)
+    assert result['error'] == "timed out after 0s (0 polls, last status: HTTP 202)"
+    
+    clock = iter(range(0, 1000, 2))
+    monkeypatch.setattr(tc.time, 'monotonic', lambda: next(clock))
+    result = analyze(FakeSession(accepted, [FakeResponse(200, {'status': 'running'})]), timeout=10)
+    assert result['error'].endswith("last status: running)")
+    
+    clock = iter(range(0, 1000, 2))
+    result = analyze(FakeSession(accepted, [FakeResponse(429, headers={'Retry-After': '0'})]), timeout=10)
+    assert result['error'].endswith("last status: HTTP 429)")
+    assert result['throttled'] == result['polls']
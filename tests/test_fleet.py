@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import test_connectivity as tc
+
+
+@pytest.fixture
+def fleet_file(tmp_path, monkeypatch):
+    for key in ('PGPORT', 'PGDATABASE', 'PGUSER', 'PGPASSWORD'):
+        monkeypatch.delenv(key, raising=False)
+    
+    def write(config):
+        path = tmp_path / 'fleet.json'
+        path.write_text(json.dumps(config))
+        return str(path)
+    return write
+
+
+def test_load_fleet_servers_list(fleet_file, monkeypatch):
+    monkeypatch.setenv('PGUSER', 'admin')
+    monkeypatch.setenv('PGPASSWORD', 'secret')
+    servers = tc.load_fleet_servers(fleet_file([{'host': 'pg1.example.com'}]))
+    assert servers == [{
+        'server_name': 'pg1.example.com',
+        'host': 'pg1.example.com',
+        'port': '5432',
+        'database': 'postgres',
+        'user': 'admin',
+        'password': 'secret',
+    }]
+
+
+def test_load_fleet_servers_defaults_and_overrides(fleet_file, monkeypatch):
+    monkeypatch.setenv('FLEET_PASSWORD', 'from-env')
+    servers = tc.load_fleet_servers(fleet_file({
+        'defaults': {'port': 6432, 'user': 'app', 'password_env': 'FLEET_PASSWORD'},
+        'servers': [
+            {'host': 'pg1', 'name': 'east'},
+            {'host': 'pg2', 'name': 'east', 'database': 'orders', 'password': 'inline'},
+        ],
+    }))
+    assert [server['server_name'] for server in servers] == ['east', 'east (#2)']
+    assert [server['port'] for server in servers] == ['6432', '6432']
+    assert servers[0]['password'] == 'from-env'
+    assert servers[1]['password'] == 'inline'
+    assert servers[1]['database'] == 'orders'
+
+
+@pytest.mark.parametrize('config, message', [
+    ('not a list', 'expected a list of servers or an object, got str'),
+    ({'defaults': [], 'servers': []}, "'defaults' must be an object"),
+    ({'servers': {'host': 'pg1'}}, "'servers' must be a list"),
+    (['pg1'], 'server #1 must be an object, got str'),
+    ([{'host': 'pg1'}, {'port': 5432}], 'server #2 has no host'),
+])
+def test_load_fleet_servers_rejects_malformed_config(fleet_file, config, message):
+    with pytest.raises(ValueError, match=message):
+        tc.load_fleet_servers(fleet_file(config))
+
+
+def test_load_fleet_servers_rejects_invalid_json(tmp_path):
+    path = tmp_path / 'fleet.json'
+    path.write_text('[{"host": ')
+    with pytest.raises(ValueError):
+        tc.load_fleet_servers(str(path))
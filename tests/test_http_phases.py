@@ -0,0 +1,52 @@
+import pytest
+
+import test_connectivity as tc
+
+
+@pytest.fixture(scope='module')
+def stand_in():
+    server = tc.start_local_server(tc.StandInHandler, {'delay': 0.02})
+    yield f"http://localhost:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def test_new_connection_reports_setup_phases(stand_in):
+    session = tc.build_http_session()
+    response = session.get(stand_in)
+    phases = response.trace_phases
+    assert set(phases) == {'dns', 'tcp_connect', 'ttfb', 'total'}
+    assert phases['ttfb'] >= 15
+    assert sum(ms for phase, ms in phases.items() if phase != 'total') == pytest.approx(phases['total'], abs=0.01)
+    assert response.trace_address == '127.0.0.1'
+    assert response.trace_reused is False
+    
+    # The next request reuses the warm connection, so there is nothing to set up
+    response = session.get(stand_in)
+    assert set(response.trace_phases) == {'ttfb', 'total'}
+    assert response.trace_reused is True
+    assert response.trace_address == '127.0.0.1'
+
+
+def test_phase_timing_disabled_skips_dns_lookup(stand_in, monkeypatch):
+    monkeypatch.setenv('PHASE_TIMING', 'false')
+    response = tc.build_http_session().get(stand_in)
+    assert set(response.trace_phases) == {'tcp_connect', 'ttfb', 'total'}
+
+
+def test_log_request_phases(stand_in, logged):
+    response = tc.build_http_session().get(stand_in)
+    tc.log_request_phases('Ollama', response)
+    tc.log_request_phases('Ollama', None)
+    assert len(logged) == 1
+    assert logged[0][1].startswith('Ollama timing (127.0.0.1): DNS ')
+    assert 'TTFB' in logged[0][1]
+
+
+def test_external_get_probe_reports_its_own_phases(stand_in, monkeypatch):
+    for key in ('HTTP_PROXY', 'http_proxy', 'ALL_PROXY', 'all_proxy'):
+        monkeypatch.delenv(key, raising=False)
+    success, detail, phases, address = tc.probe_external_service(stand_in, 'get')
+    assert success
+    assert detail == 'Status: 200'
+    assert {'ttfb', 'total'} <= set(phases)
+    assert address == '127.0.0.1'
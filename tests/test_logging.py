@@ -0,0 +1,49 @@
+import json
+import signal
+import threading
+
+import test_connectivity as tc
+
+
+def test_sync_logging_filters_by_level(monkeypatch, capsys):
+    monkeypatch.setattr(tc, '_log_async', False)
+    monkeypatch.setattr(tc, '_log_threshold', tc.LOG_LEVELS['WARN'])
+    tc.log("hidden")
+    tc.log("shown", "WARN")
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith("[WARN] shown")
+
+
+def test_json_log_format(monkeypatch):
+    monkeypatch.setattr(tc, '_log_json', True)
+    record = json.loads(tc.format_log_record((0, 'INFO', 'Ollama', 'hello')))
+    assert record == {'time': '1970-01-01T00:00:00.000+00:00', 'level': 'INFO', 'check': 'Ollama', 'message': 'hello'}
+
+
+def test_async_writer_flushes_in_order(capsys):
+    # The module's writer thread is running whenever LOG_ASYNC is on (the default)
+    assert tc._log_async
+    for i in range(2500):
+        tc.enqueue_log_record((0, 'INFO', None, f"line {i}"))
+    tc.flush_logs()
+    assert [line.rsplit(' ', 1)[-1] for line in capsys.readouterr().out.splitlines()] == [str(i) for i in range(2500)]
+
+
+def test_sigterm_during_sync_write_does_not_deadlock(monkeypatch, capsys):
+    monkeypatch.setattr(tc, '_log_async', False)
+    outcome = []
+    
+    def interrupted_write():
+        # As if SIGTERM arrived while this thread was writing a log line
+        with tc._log_lock:
+            try:
+                tc.handle_sigterm(signal.SIGTERM, None)
+            except SystemExit as e:
+                outcome.append(e.code)
+    
+    thread = threading.Thread(target=interrupted_write, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert outcome == [128 + signal.SIGTERM]
+    assert "Received SIGTERM" in capsys.readouterr().out
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+import test_connectivity as tc
+
+
+def test_parse_lsn():
+    assert tc.parse_lsn('0/0') == 0
+    assert tc.parse_lsn('16/B374D848') == (0x16 << 32) + 0xB374D848
+    assert tc.parse_lsn('1/0') - tc.parse_lsn('0/FFFFFFFF') == 1
+
+
+def test_parse_stream_line_sse():
+    line = 'data: ' + json.dumps({'choices': [{'delta': {'content': 'Hello'}}]})
+    assert tc.parse_stream_line(line, 'sse') == ('Hello', None, False)
+    
+    # Completions-style text and a final usage chunk
+    assert tc.parse_stream_line('data: {"choices": [{"text": "Hi"}]}', 'sse') == ('Hi', None, False)
+    assert tc.parse_stream_line('data: {"choices": [], "usage": {"completion_tokens": 7}}', 'sse') == ('', 7, False)
+    
+    assert tc.parse_stream_line('data: [DONE]', 'sse') == ('', None, True)
+    assert tc.parse_stream_line(': keep-alive', 'sse') == ('', None, False)
+    assert tc.parse_stream_line('event: message', 'sse') == ('', None, False)
+
+
+def test_parse_stream_line_ndjson():
+    assert tc.parse_stream_line('{"response": "Hel", "done": false}', 'ndjson') == ('Hel', None, False)
+    # eval_count is only taken from the final chunk
+    assert tc.parse_stream_line('{"response": "", "done": true, "eval_count": 12}', 'ndjson') == ('', 12, True)
+    assert tc.parse_stream_line('{"response": "x", "eval_count": 3}', 'ndjson') == ('x', None, False)
+
+
+def test_parse_stream_line_rejects_invalid_json():
+    with pytest.raises(ValueError):
+        tc.parse_stream_line('data: {not json', 'sse')
+
+
+@pytest.fixture
+def clean_custom_hosts(monkeypatch):
+    for key in list(tc.os.environ):
+        if key.startswith('CUSTOM_HOST'):
+            monkeypatch.delenv(key)
+
+
+def test_load_custom_hosts_from_env(monkeypatch, clean_custom_hosts, logged):
+    monkeypatch.setenv('CUSTOM_HOST_1', 'https://api.example.com')
+    monkeypatch.setenv('CUSTOM_HOST_1_NAME', 'API')
+    monkeypatch.setenv('CUSTOM_HOST_12', 'internal.example.com:8443')
+    monkeypatch.setenv('CUSTOM_HOST_2', 'https://')
+    monkeypatch.setenv('CUSTOM_HOST_3', '  ')
+    
+    assert tc.load_custom_hosts() == {
+        'API': 'https://api.example.com',
+        'Custom Host 12': 'internal.example.com:8443',
+    }
+    assert logged == [('WARN', "Ignoring CUSTOM_HOST_2: no hostname in 'https://'")]
+
+
+def test_load_custom_hosts_from_file(monkeypatch, tmp_path, clean_custom_hosts, logged):
+    hosts_file = tmp_path / 'hosts.txt'
+    hosts_file.write_text(
+        "# shared services\n"
+        "db.example.com Database\n"
+        "https://cache.example.com:6380  # no display name\n"
+        "\n"
+        "db.example.com Database\n"
+        "http:// Broken\n"
+    )
+    monkeypatch.setenv('CUSTOM_HOST_1', 'https://env.example.com')
+    monkeypatch.setenv('CUSTOM_HOSTS_FILE', str(hosts_file))
+    
+    assert tc.load_custom_hosts() == {
+        'Custom Host 1': 'https://env.example.com',
+        'Database': 'db.example.com',
+        'https://cache.example.com:6380': 'https://cache.example.com:6380',
+        'Database (line 5)': 'db.example.com',
+    }
+    assert [level for level, _ in logged] == ['WARN']
+    assert 'line 6' in logged[0][1]
+
+
+def test_load_custom_hosts_missing_file(monkeypatch, tmp_path, clean_custom_hosts, logged):
+    monkeypatch.setenv('CUSTOM_HOSTS_FILE', str(tmp_path / 'missing.txt'))
+    assert tc.load_custom_hosts() == {}
+    assert logged[0][0] == 'WARN'
+
+
+def test_external_probe_depth(monkeypatch, logged):
+    monkeypatch.delenv('EXTERNAL_PROBE_DEPTH', raising=False)
+    monkeypatch.delenv('EXTERNAL_PROBE_DEPTH_AMAZON_S3', raising=False)
+    assert tc.external_probe_depth('Amazon S3') == 'get'
+    
+    monkeypatch.setenv('EXTERNAL_PROBE_DEPTH', 'TLS')
+    assert tc.external_probe_depth('Amazon S3') == 'tls'
+    
+    monkeypatch.setenv('EXTERNAL_PROBE_DEPTH_AMAZON_S3', 'tcp')
+    assert tc.external_probe_depth('Amazon S3') == 'tcp'
+    assert tc.external_probe_depth('Notion') == 'tls'
+    assert logged == []
+
+
+def test_external_probe_depth_unknown(monkeypatch, logged):
+    monkeypatch.setenv('EXTERNAL_PROBE_DEPTH', 'ping')
+    assert tc.external_probe_depth('Box') == 'get'
+    assert logged == [('WARN', "Box: unknown probe depth 'ping', using 'get'")]
@@ -0,0 +1,30 @@
+import test_connectivity as tc
+
+
+def test_ready_file_left_alone_by_non_owner(tmp_path, monkeypatch):
+    ready_file = tmp_path / 'ready'
+    ready_file.write_text('tester\n')
+    monkeypatch.setenv('READY_FILE', str(ready_file))
+    monkeypatch.setitem(tc._readiness, 'owns_ready_file', False)
+    
+    tc.record_probe('check', tc.REQUIRED_CHECK, 0.1, False)
+    assert ready_file.read_text() == 'tester\n'
+    tc.clear_ready_file()
+    assert ready_file.exists()
+
+
+def test_ready_file_follows_required_check_for_owner(tmp_path, monkeypatch):
+    ready_file = tmp_path / 'ready'
+    monkeypatch.setenv('READY_FILE', str(ready_file))
+    monkeypatch.setitem(tc._readiness, 'owns_ready_file', True)
+    
+    tc.record_probe('check', tc.REQUIRED_CHECK, 0.1, True)
+    assert ready_file.exists()
+    tc.record_probe('check', 'Ollama', 0.1, False)
+    assert ready_file.exists()
+    tc.record_probe('check', tc.REQUIRED_CHECK, 0.1, False)
+    assert not ready_file.exists()
+    
+    tc.record_probe('check', tc.REQUIRED_CHECK, 0.1, True)
+    tc.clear_ready_file()
+    assert not ready_file.exists()
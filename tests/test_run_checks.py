@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+import test_connectivity as tc
+
+
+@pytest.fixture
+def release(monkeypatch, logged):
+    # Set at teardown, so that checks stuck past their deadline can finish
+    event = threading.Event()
+    monkeypatch.setattr(tc, '_abandoned_checks', set())
+    monkeypatch.setenv('PARALLEL_CHECKS', 'true')
+    yield event
+    event.set()
+
+
+def hang(event):
+    def check():
+        event.wait(10)
+        return True
+    return check
+
+
+def test_checks_run_concurrently_in_order(release):
+    barrier = threading.Barrier(3, timeout=5)
+    checks = [
+        ('A', lambda: barrier.wait() is not None),
+        ('B', lambda: barrier.wait() is not None and 'warn'),
+        ('C', lambda: barrier.wait() is not None and None),
+    ]
+    completed = []
+    results = tc.run_checks(checks, on_complete=lambda name, result, duration: completed.append(name), max_workers=3)
+    # All three only get past the barrier together; skipped checks (None) are left out
+    assert list(results.items()) == [('A', True), ('B', 'warn')]
+    assert sorted(completed) == ['A', 'B', 'C']
+
+
+def test_check_deadline_abandons_only_the_slow_check(release, monkeypatch, logged):
+    monkeypatch.setenv('CHECK_TIMEOUT', '0.2')
+    completed = {}
+    start = time.monotonic()
+    results = tc.run_checks([('Slow', hang(release)), ('Fast', lambda: True)],
+                            on_complete=lambda name, result, duration: completed.update({name: result}), max_workers=2)
+    assert time.monotonic() - start < 2
+    assert results == {'Slow': False, 'Fast': True}
+    assert completed == {'Slow': False, 'Fast': True}
+    assert tc._abandoned_checks == {'Slow'}
+    assert tc._result_details['Slow']['status'] == 'timeout'
+    assert ('ERROR', 'Slow: TIMEOUT (0s)') in logged
+
+
+def test_global_deadline_cancels_queued_checks(release, monkeypatch, logged):
+    monkeypatch.setenv('GLOBAL_TIMEOUT', '0.2')
+    started = []
+
+    def queued():
+        started.append('Queued')
+        return True
+
+    results = tc.run_checks([('Slow', hang(release)), ('Queued', queued)], max_workers=1)
+    assert results == {'Slow': False, 'Queued': False}
+    # The queued check never started, so only the running one is left behind
+    assert tc._abandoned_checks == {'Slow'}
+    release.set()
+    time.sleep(0.1)
+    assert started == []
+    assert tc._result_details['Queued']['error'] == "TIMEOUT (global deadline of 0s reached)"
+
+
+def test_crashing_check_fails(release, logged):
+    def crash():
+        raise RuntimeError("boom")
+
+    assert tc.run_checks([('Crash', crash)]) == {'Crash': False}
+    assert ('ERROR', 'Crash check crashed: boom') in logged
+    assert tc._result_details['Crash']['error_class'] == 'RuntimeError'
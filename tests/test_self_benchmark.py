@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import test_connectivity as tc
+
+
+@pytest.fixture(scope='module')
+def pg_stand_in():
+    server = tc.start_local_server(tc.PostgresStandInHandler, {'databases': 3}, server_class=tc.QuietTCPServer)
+    yield server
+    server.shutdown()
+
+
+def connect(server, database='postgres'):
+    return tc.psycopg2.connect(host='127.0.0.1', port=server.server_address[1], database=database,
+                               user='stand-in', password='stand-in', connect_timeout=5, sslmode='disable')
+
+
+def test_stand_in_answers_server_inventory(pg_stand_in):
+    conn = connect(pg_stand_in)
+    try:
+        inventory = tc.fetch_server_inventory(conn.cursor())
+    finally:
+        conn.close()
+    assert inventory['databases'] == [('postgres', True), ('connectivity_bench_0000', True),
+                                      ('connectivity_bench_0001', True)]
+    assert inventory['database_oids']['connectivity_bench_0001'] == 16385
+    assert tc.extension_check_workers(inventory) == 4
+    assert 'stand-in' in inventory['version']
+
+
+def test_stand_in_answers_database_extensions(pg_stand_in):
+    result = tc.fetch_database_extensions('127.0.0.1', pg_stand_in.server_address[1], 'stand-in', 'stand-in',
+                                          'connectivity_bench_0000', estimate_sizes=True)
+    assert result['extensions'] == [('pg_stat_statements', '1.10', 'public'), ('plpgsql', '1.0', 'pg_catalog')]
+    assert result['estimated_size'] == '7600 kB'
+
+
+def test_stand_in_rejects_other_queries_and_recovers(pg_stand_in):
+    conn = connect(pg_stand_in)
+    try:
+        cursor = conn.cursor()
+        with pytest.raises(tc.psycopg2.errors.FeatureNotSupported):
+            cursor.execute("CREATE DATABASE other;")
+        with pytest.raises(tc.psycopg2.errors.InFailedSqlTransaction):
+            cursor.execute("SELECT 1;")
+        conn.rollback()
+        cursor.execute("SELECT 1;")
+        assert cursor.fetchone() == (1,)
+    finally:
+        conn.close()
+
+
+def test_explicit_target_ignores_pod_settings(monkeypatch):
+    monkeypatch.setenv('PGHOST', 'db.pod.internal')
+    monkeypatch.delenv('SELF_BENCHMARK_PGHOST', raising=False)
+    assert tc.self_benchmark_postgres_config() is None
+
+    monkeypatch.setenv('SELF_BENCHMARK_PGHOST', 'bench.internal')
+    monkeypatch.setenv('SELF_BENCHMARK_PGUSER', 'bench')
+    config = tc.self_benchmark_postgres_config()
+    assert (config['host'], config['port'], config['database'], config['user']) == ('bench.internal', '5432', 'postgres', 'bench')
+
+
+def test_explicit_target_needs_credentials(monkeypatch, logged):
+    monkeypatch.setenv('SELF_BENCHMARK_PGHOST', 'bench.internal')
+    monkeypatch.delenv('SELF_BENCHMARK_PGUSER', raising=False)
+    assert tc.run_self_benchmark() == 1
+    assert logged[-1][0] == 'ERROR'
+
+
+def test_self_benchmark_uses_stand_in_not_pod_server(monkeypatch, tmp_path, logged):
+    # The pod's PGHOST is unroutable; every scenario must still run, against the stand-in
+    for key, value in {'PGHOST': '10.255.255.1', 'PGUSER': 'pod', 'PGPASSWORD': 'pod',
+                       'SELF_BENCHMARK_SCALES': '2', 'SELF_BENCHMARK_REPEAT': '1', 'SELF_BENCHMARK_LATENCY': '0.01',
+                       'SELF_BENCHMARK_RESULTS': str(tmp_path / 'results.jsonl')}.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.delenv('SELF_BENCHMARK_PGHOST', raising=False)
+
+    assert tc.run_self_benchmark() == 0
+    records = [json.loads(line) for line in (tmp_path / 'results.jsonl').read_text().splitlines()]
+    assert [record['scenario'] for record in records] == ['custom_hosts', 'extension_inventory', 'main_pass']
+    assert {record['pg_target'] for record in records} == {'stand-in'}
+    assert records[1]['actual_scale'] == 2
+    assert tc.os.environ['PGHOST'] == '10.255.255.1'